@@ -1,129 +1,400 @@
 # add_test_images.py
+"""
+Import en masse de la banque publique (PICTOGRAMS_PATH/public).
 
+Le script fonctionne en pipeline :
+  1. scan du système de fichiers, comparé au manifeste du dernier import
+     (chemin relatif -> taille, mtime, SHA-256) : seuls les fichiers dont la taille
+     ou la date a changé sont hachés, et seuls ceux dont le contenu a changé sont traités ;
+  2. recherche groupée des dossiers et des images déjà connus (une requête par dossier) ;
+  3. INSERT par lots des nouveaux dossiers et des nouvelles images, suppression
+     des lignes dont le fichier a disparu ;
+  4. génération des miniatures dans un ProcessPoolExecutor.
+
+    python add_test_images.py [--workers N] [--batch-size N] [--full]
+"""
+import argparse
+import hashlib
+import json
 import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from PIL import Image as PILImage # Renommer pour éviter le conflit avec notre modèle Image
+from sqlalchemy import insert, update, delete, or_, select
 from app import create_app, db
-from app.models import Image, Folder
+from app.models import Image, Folder, ThumbnailJob
+from app.normalize import normalize_settings, normalize_public_file
+from app.search import touch_public_library
+from app.thumbnails import generate_thumbnail
+from app.utils import extract_description_from_path, normalize_search_key
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+# Taille des clauses IN (SQLite limite le nombre de paramètres liés)
+LOOKUP_CHUNK = 500
+# Manifeste du dernier import, à la racine de PICTOGRAMS_PATH
+MANIFEST_NAME = '.ingest-manifest.json'
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class Progress:
+    """Affiche l'avancement d'une étape sur une seule ligne."""
+
+    def __init__(self, label, total):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self._last_percent = -1
+
+    def advance(self, count=1):
+        self.done += count
+        percent = self.done * 100 // self.total if self.total else 100
+        if percent != self._last_percent:
+            self._last_percent = percent
+            sys.stdout.write(f"\r{self.label} : {self.done}/{self.total} ({percent} %)")
+            sys.stdout.flush()
+
+    def finish(self):
+        if self.total:
+            sys.stdout.write("\n")
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _map(executor, function, items):
+    """map() dans le pool de processus, ou dans le processus courant sans pool."""
+    if executor is None:
+        return map(function, items)
+    return executor.map(function, items, chunksize=max(1, min(64, len(items) // 64)))
+
+
+def _make_thumbnail(paths):
+    """Exécuté dans un processus du pool : retourne None ou le message d'erreur."""
+    source_path, thumb_path = paths
+    try:
+        generate_thumbnail(source_path, thumb_path)
+    except (IOError, FileNotFoundError) as e:
+        return f"Erreur lors de la création de la miniature pour {source_path} : {e}"
+    return None
 
-# --- Configuration des miniatures ---
-THUMB_SIZE = (48, 48) # Taille maximale pour les miniatures
 
-def create_thumbnail(filepath_relative, source_folder, thumbs_folder):
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _manifest_entry(path):
+    """Exécuté dans un processus du pool : entrée de manifeste d'un fichier."""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': _hash_file(path)}
+
+
+def _normalize(args):
     """
-    Génère une miniature pour une image donnée et la sauvegarde en JPEG.
+    Exécuté dans un processus du pool : normalise le fichier et retourne
+    (nouveau nom, entrée de manifeste du fichier final).
     """
+    source_path, pictograms_path, settings = args
+    normalized = normalize_public_file(source_path, pictograms_path, settings)
+    final_path = normalized or Path(source_path)
+    return final_path.name, _manifest_entry(final_path)
+
+
+def load_manifest(path):
     try:
-        source_path = source_folder / filepath_relative
-        # Construire le chemin de la miniature en changeant l'extension en .jpeg
-        thumb_path_relative = Path(filepath_relative).with_suffix('.png')
-        thumb_path_full = thumbs_folder / thumb_path_relative
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        print(f"Manifeste illisible ({path}), import complet.")
+        return {}
 
-        # S'assurer que le dossier parent de la miniature existe
-        thumb_path_full.parent.mkdir(parents=True, exist_ok=True)
 
-        with PILImage.open(source_path) as img:
-            img.thumbnail(THUMB_SIZE)
+def save_manifest(path, manifest):
+    """Écriture atomique : un import interrompu laisse le manifeste précédent intact."""
+    fd, tmp_name = tempfile.mkstemp(dir=Path(path).parent, suffix='.part')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, separators=(',', ':'), sort_keys=True)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
 
 
-            # Sauvegarder la miniature avec optimisation
-            img.save(thumb_path_full, 'PNG', quality=85, optimize=True)
-            # print(f"Miniature créée : {thumb_path_full}") # Décommenter pour le debug
+def scan(scan_root, pictograms_path):
+    """
+    Liste (chemin relatif du dossier, [(nom, taille, mtime)]) des images ;
+    les parents précèdent leurs enfants.
+    """
+    directories = []
+    for root, dirs, files in os.walk(scan_root):
+        dirs.sort()
+        relative_path = Path(root).relative_to(pictograms_path).as_posix()
+        images = []
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                stat = os.stat(os.path.join(root, name))
+                images.append((name, stat.st_size, stat.st_mtime_ns))
+        directories.append((relative_path, images))
+    return directories
 
-    except (IOError, FileNotFoundError) as e:
-        print(f"Erreur lors de la création de la miniature pour {filepath_relative} : {e}")
 
-def main():
-    app = create_app()
-    with app.app_context():
-        source_pictograms_path = Path(app.config['PICTOGRAMS_PATH'])
-        thumbs_folder = Path(app.config['PICTOGRAMS_PATH_MIN']) # Nouveau chemin pour les miniatures
-        scan_root = source_pictograms_path / 'public'
+def remove_deleted(removed_paths, scanned_directories, thumbs_folder):
+    """
+    Supprime les images publiques dont le fichier a disparu, ainsi que les
+    dossiers publics qui n'existent plus. Retourne le nombre d'images supprimées.
+    """
+    vanished_folders = [
+        folder_id for folder_id, path in db.session.query(Folder.id, Folder.path)
+        .filter(Folder.user_id.is_(None), or_(Folder.path == 'public', Folder.path.like('public/%')))
+        if path not in scanned_directories
+    ]
+    image_ids = []
+    for chunk in _chunks(sorted(removed_paths), LOOKUP_CHUNK):
+        image_ids += db.session.query(Image.id, Image.path) \
+            .filter(Image.user_id.is_(None), Image.path.in_(chunk)).all()
+    for chunk in _chunks(vanished_folders, LOOKUP_CHUNK):
+        image_ids += db.session.query(Image.id, Image.path) \
+            .filter(Image.user_id.is_(None), Image.folder_id.in_(chunk)).all()
+    image_ids = dict(image_ids)
 
-        if not scan_root.exists():
-            print(f"Le dossier source {scan_root} n'existe pas. Arrêt du script.")
-            print(f"pictograms path {source_pictograms_path} .")
-            print(f"thumbs_folder  {thumbs_folder}.") 
-            return
+    ids = list(image_ids)
+    for chunk in _chunks(ids, LOOKUP_CHUNK):
+        db.session.execute(delete(ThumbnailJob).where(ThumbnailJob.image_id.in_(chunk)))
+        db.session.execute(delete(Image).where(Image.id.in_(chunk)))
+    for chunk in _chunks(vanished_folders, LOOKUP_CHUNK):
+        # Les dossiers disparus ne se référencent qu'entre eux
+        db.session.execute(update(Folder).where(Folder.id.in_(chunk)).values(parent_id=None))
+        db.session.execute(delete(Folder).where(Folder.id.in_(chunk)))
+    if ids:
+        touch_public_library(db.session)
+    db.session.commit()
 
-        print("Début du scan et de l'ajout des pictogrammes publics...")
+    for path in image_ids.values():
+        (thumbs_folder / Path(path).with_suffix('.png')).unlink(missing_ok=True)
+    return len(ids)
+
+
+def sync_folders(directories):
+    """Crée les dossiers manquants, niveau par niveau. Retourne ({chemin: id}, nombre ajouté)."""
+    paths = [path for path, _ in directories]
+    folder_ids = {}
+    for chunk in _chunks(paths, LOOKUP_CHUNK):
+        folder_ids.update(db.session.query(Folder.path, Folder.id).filter(Folder.path.in_(chunk)))
+
+    missing = [path for path in paths if path not in folder_ids]
+    by_depth = {}
+    for path in missing:
+        by_depth.setdefault(path.count('/'), []).append(path)
 
-        # S'assurer que le dossier des miniatures existe
-        thumbs_folder.mkdir(exist_ok=True)
-
-        path_to_folder_id = {str(scan_root): None} # Le parent de la racine est None
-        images_added = 0
-        folders_added = 0
-
-        # Parcourir les dossiers
-        for root, dirs, files in os.walk(scan_root):
-            root_path = Path(root)
-            relative_path = root_path.relative_to(source_pictograms_path)
-            normalized_path = relative_path.as_posix() # Utiliser des / comme séparateur
-
-            # --- GESTION DES DOSSIERS (Évite les doublons) ---
-            existing_folder = db.session.query(Folder).filter_by(path=normalized_path).first()
-
-            if not existing_folder:
-                parent_physical_path = str(root_path.parent)
-                parent_id = path_to_folder_id.get(parent_physical_path)
-
-                folder = Folder(
-                    name=root_path.name,
-                    path=normalized_path,
-                    user_id=None, # Dossier public
-                    parent_id=parent_id
-                )
-                db.session.add(folder)
-                db.session.commit() # Commit pour obtenir l'ID
-                folder_id = folder.id
-                folders_added += 1
-                print(f"Dossier ajouté : {normalized_path}")
+    for depth in sorted(by_depth):
+        folders = [
+            Folder(
+                name=Path(path).name,
+                path=path,
+                user_id=None, # Dossier public
+                parent_id=folder_ids.get(Path(path).parent.as_posix())
+            )
+            for path in by_depth[depth]
+        ]
+        db.session.add_all(folders)
+        db.session.flush() # Un INSERT groupé par niveau, pour obtenir les ID des parents
+        folder_ids.update((folder.path, folder.id) for folder in folders)
+    db.session.commit()
+    return folder_ids, len(missing)
+
+
+def ingest(app, workers=None, batch_size=500, full=False):
+    """
+    Importe la banque publique. Avec full=True, le manifeste est ignoré et
+    tous les fichiers sont revérifiés. Retourne les compteurs de l'opération.
+    """
+    source_pictograms_path = Path(app.config['PICTOGRAMS_PATH'])
+    thumbs_folder = Path(app.config['PICTOGRAMS_PATH_MIN'])
+    scan_root = source_pictograms_path / 'public'
+    manifest_path = source_pictograms_path / MANIFEST_NAME
+    stats = {'folders_added': 0, 'images_added': 0, 'images_updated': 0, 'images_removed': 0,
+             'unchanged': 0, 'thumbnails': 0, 'thumbnail_errors': 0}
+
+    if not scan_root.exists():
+        print(f"Le dossier source {scan_root} n'existe pas. Arrêt du script.")
+        print(f"pictograms path {source_pictograms_path} .")
+        print(f"thumbs_folder  {thumbs_folder}.")
+        return stats
+
+    thumbs_folder.mkdir(parents=True, exist_ok=True)
+    workers = os.cpu_count() if workers is None else workers
+    # Normalisation des nouvelles images (IMAGE_NORMALIZE), None si désactivée
+    settings = normalize_settings()
+    previous = {} if full else load_manifest(manifest_path)
+    manifest = {}
+
+    # 1. Scan, comparé au manifeste
+    print("Scan de la banque publique...")
+    directories = scan(scan_root, source_pictograms_path)
+    total_files = sum(len(files) for _, files in directories)
+    print(f"{len(directories)} dossier(s), {total_files} image(s) trouvé(s).")
+
+    candidates = [] # Fichiers nouveaux ou dont la taille / la date a changé
+    for directory, files in directories:
+        for name, size, mtime in files:
+            image_path = f"{directory}/{name}"
+            entry = previous.get(image_path)
+            if entry and entry['size'] == size and entry['mtime'] == mtime:
+                manifest[image_path] = entry
             else:
-                folder_id = existing_folder.id
-
-            path_to_folder_id[str(root_path)] = folder_id
-
-            # Parcourir les images dans le dossier courant
-            for file in files:
-                if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                    image_relative_path = relative_path / file
-                    normalized_image_path = image_relative_path.as_posix()
-
-                    # --- GESTION DES IMAGES (Évite les doublons) ---
-                    existing_image = db.session.query(Image).filter_by(path=normalized_image_path).first()
-
-                    thumb_path_relative = Path(normalized_image_path).with_suffix('.jpeg')
-                    thumb_path_full = thumbs_folder / thumb_path_relative
-
-                    if existing_image:
-                        # L'image existe en BDD, on vérifie juste si la miniature existe physiquement
-                        if not thumb_path_full.exists():
-                            print(f"L'image '{normalized_image_path}' existe, mais sa miniature est manquante. Création...")
-                            create_thumbnail(str(image_relative_path), source_pictograms_path, thumbs_folder)
-                    else:
-                        # L'image n'existe pas en BDD, on l'ajoute et on crée la miniature
-                        image = Image(
-                            path=normalized_image_path,
-                            name=file,
-                            description=f"Public pictogram: {file}",
-                            is_public=True,
-                            user_id=None,
-                            folder_id=folder_id
-                        )
-                        db.session.add(image)
-                        images_added += 1
-                        print(f"Image ajoutée à la BDD : {normalized_image_path}")
-
-                        # Création de la miniature
-                        create_thumbnail(str(image_relative_path), source_pictograms_path, thumbs_folder)
-
-        db.session.commit()
+                candidates.append(image_path)
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        # 2. Hachage des candidats : un fichier simplement « touché » n'est pas retraité
+        changed = set()
+        progress = Progress("Hachage", len(candidates))
+        entries = _map(executor, _manifest_entry, [source_pictograms_path / path for path in candidates])
+        for image_path, entry in zip(candidates, entries):
+            old = previous.get(image_path)
+            if old is None or old['sha256'] != entry['sha256']:
+                changed.add(image_path)
+            manifest[image_path] = entry
+            progress.advance()
+        progress.finish()
+        stats['unchanged'] = total_files - len(changed)
+
+        # 3. Dossiers
+        folder_ids, stats['folders_added'] = sync_folders(directories)
+
+        # 4. Recherche des images modifiées déjà connues, une requête par dossier
+        new_files = []           # (folder_id, chemin du dossier, nom du fichier)
+        description_updates = [] # Anciennes descriptions génériques à remplacer
+        thumbnails_needed = []   # Chemins relatifs des images à (re)générer
+        changed_directories = [(directory, [f for f in files if f"{directory}/{f[0]}" in changed])
+                               for directory, files in directories]
+        changed_directories = [(directory, files) for directory, files in changed_directories if files]
+        progress = Progress("Analyse des dossiers", len(changed_directories))
+        for directory, files in changed_directories:
+            known = {}
+            for chunk in _chunks([f"{directory}/{name}" for name, _, _ in files], LOOKUP_CHUNK):
+                rows = db.session.query(Image.path, Image.id, Image.description).filter(Image.path.in_(chunk))
+                known.update((path, (image_id, description)) for path, image_id, description in rows)
+
+            for name, _, _ in files:
+                image_path = f"{directory}/{name}"
+                if image_path not in known:
+                    new_files.append((folder_ids[directory], directory, name))
+                    continue
+                image_id, description = known[image_path]
+                if description == f"Public pictogram: {name}":
+                    description_updates.append({'id': image_id, 'description': extract_description_from_path(image_path)})
+                # Contenu modifié depuis le dernier import, ou image jamais vue par le manifeste
+                # dont la miniature manque : la miniature est (re)générée
+                if image_path in previous or not (thumbs_folder / Path(image_path).with_suffix('.png')).exists():
+                    thumbnails_needed.append(image_path)
+                    stats['images_updated'] += 1
+            progress.advance()
+        progress.finish()
+
+        if description_updates:
+            db.session.execute(update(Image), description_updates)
+            touch_public_library(db.session)
+            db.session.commit()
+
+        # 5. Normalisation des nouvelles images (le nom du fichier peut changer)
+        if settings and new_files:
+            progress = Progress("Normalisation", len(new_files))
+            args = [(source_pictograms_path / directory / name, source_pictograms_path, settings)
+                    for _, directory, name in new_files]
+            names = []
+            for (_, directory, name), (new_name, entry) in zip(new_files, _map(executor, _normalize, args)):
+                names.append(new_name)
+                manifest.pop(f"{directory}/{name}", None)
+                manifest[f"{directory}/{new_name}"] = entry
+                progress.advance()
+            progress.finish()
+            new_files = [(folder_id, directory, name) for (folder_id, directory, _), name in zip(new_files, names)]
+
+        # 6. INSERT par lots
+        progress = Progress("Ajout des images", len(new_files))
+        for batch in _chunks(new_files, batch_size):
+            rows = []
+            for folder_id, directory, name in batch:
+                image_path = f"{directory}/{name}"
+                rows.append({
+                    'path': image_path,
+                    'name': name,
+                    # Pas d'événement ORM pour un INSERT en masse : clé calculée ici
+                    'search_key': normalize_search_key(name),
+                    # Calculée une fois ici plutôt qu'à chaque requête mobile
+                    'description': extract_description_from_path(image_path),
+                    'is_public': True,
+                    'user_id': None,
+                    'folder_id': folder_id,
+                })
+                thumbnails_needed.append(image_path)
+            db.session.execute(insert(Image), rows)
+            touch_public_library(db.session)
+            db.session.commit()
+            progress.advance(len(batch))
+        progress.finish()
+        stats['images_added'] = len(new_files)
+
+        # 7. Fichiers disparus depuis le dernier import ; sans manifeste (full), la base
+        # elle-même sert de référence
+        if full:
+            known_paths = db.session.scalars(select(Image.path).where(Image.user_id.is_(None)))
+            removed = set(known_paths) - set(manifest)
+        else:
+            removed = set(previous) - set(manifest)
+        scanned_directories = {directory for directory, _ in directories}
+        stats['images_removed'] = remove_deleted(removed, scanned_directories, thumbs_folder)
+
+        # 8. Miniatures, en parallèle
+        progress = Progress("Miniatures", len(thumbnails_needed))
+        jobs = [(source_pictograms_path / path, thumbs_folder / Path(path).with_suffix('.png'))
+                for path in thumbnails_needed]
+        for error in _map(executor, _make_thumbnail, jobs):
+            if error:
+                stats['thumbnail_errors'] += 1
+                print(f"\n{error}")
+            progress.advance()
+        progress.finish()
+        stats['thumbnails'] = len(jobs) - stats['thumbnail_errors']
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    save_manifest(manifest_path, manifest)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importe les pictogrammes publics (PICTOGRAMS_PATH/public).")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processus pour les miniatures (défaut : nombre de CPU, 0 ou 1 : sans pool)")
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help="Nombre d'images par INSERT (défaut : 500)")
+    parser.add_argument('--full', action='store_true',
+                        help="Ignore le manifeste et revérifie tous les fichiers")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        print("Début du scan et de l'ajout des pictogrammes publics...")
+        stats = ingest(app, workers=args.workers, batch_size=args.batch_size, full=args.full)
         print("-" * 20)
         print("Opération terminée.")
-        print(f"{folders_added} nouveau(x) dossier(s) ajouté(s).")
-        print(f"{images_added} nouvelle(s) image(s) ajoutée(s).")
-        print("Les miniatures manquantes pour les images existantes ont été créées.")
+        print(f"{stats['folders_added']} nouveau(x) dossier(s) ajouté(s).")
+        print(f"{stats['images_added']} nouvelle(s) image(s) ajoutée(s).")
+        print(f"{stats['images_updated']} image(s) modifiée(s), {stats['images_removed']} supprimée(s), "
+              f"{stats['unchanged']} inchangée(s).")
+        print(f"{stats['thumbnails']} miniature(s) créée(s), {stats['thumbnail_errors']} erreur(s).")
 
 
 if __name__ == '__main__':
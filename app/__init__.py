@@ -48,8 +48,10 @@ def create_app(config_override=None):
     pictograms_path = Path(app.config['PICTOGRAMS_PATH'])
     pictograms_path.mkdir(parents=True, exist_ok=True)
 
-    csrf = CSRFProtect(app)
     from app.routes import api
+    # Before CSRFProtect: its check parses the form, upload limits must already apply
+    app.before_request(api.limit_upload_size)
+    csrf = CSRFProtect(app)
     
     db.init_app(app)
     migrate.init_app(app, db)
@@ -59,6 +61,14 @@ def create_app(config_override=None):
     bootstrap.init_app(app)
     sitemap.init_app(app)
 
+    from app import thumbnail_queue, cli, search, arasaac, compression
+    thumbnail_queue.init_app(app)
+    cli.init_app(app)
+    search.init_app(app)
+    arasaac.init_app(app)
+    compression.init_app(app)
+    from app import sync  # noqa: F401 (stamps tree writes with sync versions)
+
     # JWT Configuration for mobile API
     app.config['JWT_SECRET_KEY'] = 'a-changer-pour-la-production-avec-githubSecretKey'
     jwt.init_app(app)
@@ -72,7 +82,7 @@ def create_app(config_override=None):
     app.babel_localeselector = get_locale
 
     # Register Blueprints
-    from app.routes import auth, main, builder, files, mobile_api
+    from app.routes import auth, main, builder, files, mobile_api, admin, arasaac_proxy
     # api is already imported above
     app.register_blueprint(auth.bp)
     app.register_blueprint(main.bp)
@@ -80,6 +90,8 @@ def create_app(config_override=None):
     app.register_blueprint(api.bp)
     app.register_blueprint(files.bp)
     app.register_blueprint(mobile_api.bp)
+    app.register_blueprint(admin.bp)
+    app.register_blueprint(arasaac_proxy.bp)
     csrf.exempt(mobile_api.bp) #a garder on va utiliser des jeutons pour la partie mobile.
 
     @app.cli.command('generate-sitemap')
@@ -0,0 +1,130 @@
+"""
+Proxy de la banque ARASAAC (api.arasaac.org, static.arasaac.org).
+
+Les navigateurs passent par l'application plutôt que d'interroger ARASAAC :
+  - les réponses de recherche sont mises en cache par (langue, requête)
+    pendant ARASAAC_SEARCH_TTL secondes, dans chaque processus ;
+  - les PNG des pictogrammes sont téléchargés une seule fois puis conservés
+    sous PICTOGRAMS_PATH/.arasaac/.
+
+Quand plusieurs requêtes identiques manquent le cache en même temps, un seul
+appel part vers ARASAAC ; les autres attendent son résultat.
+"""
+import os
+import tempfile
+from pathlib import Path
+from urllib.parse import quote
+import requests
+from flask import current_app
+from app.cache import SingleFlight, TTLCache
+
+ARASAAC_DIRNAME = '.arasaac'
+# Résolution demandée à static.arasaac.org
+PICTOGRAM_RESOLUTION = 300
+SEARCH_CACHE_SIZE = 2048
+MAX_QUERY_LENGTH = 100
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+class ArasaacUnavailable(Exception):
+    """ARASAAC injoignable, ou réponse inattendue."""
+
+
+class PictogramNotFound(Exception):
+    """Identifiant inconnu d'ARASAAC."""
+
+
+def _state():
+    return current_app.extensions['arasaac']
+
+
+def _get(url):
+    try:
+        return requests.get(url, timeout=current_app.config['ARASAAC_TIMEOUT'])
+    except requests.RequestException as e:
+        raise ArasaacUnavailable(f"{url} : {e}") from e
+
+
+def search_key(locale, query):
+    """Clé de cache d'une recherche : la casse et les espaces ne comptent pas."""
+    return locale, ' '.join(query.lower().split())
+
+
+def _fetch_search(locale, query):
+    url = f"{current_app.config['ARASAAC_API_URL']}/api/pictograms/{locale}/search/{quote(query, safe='')}"
+    response = _get(url)
+    if response.status_code == 404:
+        return []  # ARASAAC répond 404 quand rien ne correspond
+    if response.status_code != 200:
+        raise ArasaacUnavailable(f"{url} : HTTP {response.status_code}")
+    try:
+        data = response.json()
+    except ValueError as e:
+        raise ArasaacUnavailable(f"{url} : réponse illisible") from e
+    if not isinstance(data, list):
+        raise ArasaacUnavailable(f"{url} : réponse inattendue")
+
+    # Seuls l'identifiant et les mots-clés servent à l'interface : le reste
+    # (catégories, synonymes, etc.) alourdirait le cache et les réponses
+    results = []
+    for picto in data:
+        if not isinstance(picto, dict) or not isinstance(picto.get('_id'), int):
+            continue
+        keywords = [{'keyword': keyword['keyword']} for keyword in picto.get('keywords') or []
+                    if isinstance(keyword, dict) and keyword.get('keyword')]
+        if keywords:
+            results.append({'_id': picto['_id'], 'keywords': keywords})
+    return results
+
+
+def search(locale, query):
+    """Pictogrammes ARASAAC correspondant à query, depuis le cache si possible."""
+    key = search_key(locale, query)
+    state = _state()
+    results = state['searches'].get(key)
+    if results is None:
+        # get_or_set revérifie le cache : un appel concurrent a pu le remplir entre-temps
+        results = state['flights'].do(
+            ('search', key), lambda: state['searches'].get_or_set(key, lambda: _fetch_search(*key)))
+    return results
+
+
+def pictogram_path(picto_id):
+    return Path(current_app.config['PICTOGRAMS_PATH']) / ARASAAC_DIRNAME / f"{picto_id}_{PICTOGRAM_RESOLUTION}.png"
+
+
+def _download_pictogram(picto_id, path):
+    if path.exists():
+        return
+    url = f"{current_app.config['ARASAAC_STATIC_URL']}/pictograms/{picto_id}/{picto_id}_{PICTOGRAM_RESOLUTION}.png"
+    response = _get(url)
+    if response.status_code == 404:
+        raise PictogramNotFound(picto_id)
+    if response.status_code != 200 or not response.content.startswith(PNG_SIGNATURE):
+        raise ArasaacUnavailable(f"{url} : HTTP {response.status_code}, {len(response.content)} octet(s)")
+
+    # Écriture atomique : un PNG partiel ne doit jamais être servi
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(response.content)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def fetch_pictogram(picto_id):
+    """Chemin du PNG d'un pictogramme ARASAAC, téléchargé au premier appel."""
+    path = pictogram_path(picto_id)
+    if not path.exists():
+        _state()['flights'].do(('pictogram', picto_id), lambda: _download_pictogram(picto_id, path))
+    return path
+
+
+def init_app(app):
+    app.extensions['arasaac'] = {
+        'searches': TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=app.config['ARASAAC_SEARCH_TTL']),
+        'flights': SingleFlight(),
+    }
@@ -0,0 +1,187 @@
+"""
+Paquets hors ligne des arbres pour l'application mobile.
+
+Un paquet est une archive ZIP qui contient :
+  - tree.json : le composite Android de l'arbre (celui de GET /trees/<id>) ;
+  - manifest.json : pour chaque image_url de l'arbre, le fichier de l'archive
+    et la description (celle de l'en-tête X-Image-Description) ;
+  - pictograms/... : les pictogrammes eux-mêmes.
+
+L'archive est écrite fichier par fichier (ZipFile.open en écriture, copie par
+blocs) sans charger les images en mémoire, dans
+PICTOGRAMS_PATH/.bundles/<arbre>-<empreinte>.zip. L'empreinte couvre le
+composite, les descriptions et la signature (taille, date) de chaque fichier :
+tant qu'elle ne change pas, le paquet déjà construit est resservi. Les paquets
+remplacés sont supprimés lors d'une construction, une fois inutilisés depuis
+BUNDLE_STALE_AFTER.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from collections import namedtuple
+from pathlib import Path
+from flask import current_app
+from app import arasaac
+from app.arasaac import ArasaacUnavailable, PictogramNotFound
+from app.cache import SingleFlight
+from app.models import Image
+from app.utils import extract_description_from_path
+
+BUNDLES_DIRNAME = '.bundles'
+BUNDLE_FORMAT = 1
+MOBILE_PICTOGRAMS_PREFIX = '/api/v1/mobile/pictograms/'
+ARASAAC_URL_REGEX = re.compile(r'^https://static\.arasaac\.org/pictograms/(\d+)/\1_\d+\.png$')
+COPY_BUFFER_SIZE = 64 * 1024
+# Un paquet qui n'a pas été servi depuis ce délai peut être supprimé (il sera reconstruit au besoin)
+BUNDLE_STALE_AFTER = 24 * 3600  # Secondes
+
+# Pictogramme d'un paquet : URL dans tree.json, fichier source, nom dans l'archive
+BundleEntry = namedtuple('BundleEntry', 'image_url source arcname description')
+
+_flights = SingleFlight()
+
+
+def _bundles_folder():
+    return Path(current_app.config['PICTOGRAMS_PATH']) / BUNDLES_DIRNAME
+
+
+def _nodes(node):
+    yield node
+    for child in node.get('children') or []:
+        yield from _nodes(child)
+
+
+def _descriptions(paths):
+    """Descriptions des images locales, en une requête (repli : nom de fichier)."""
+    found = {}
+    for image in Image.query.filter(Image.path.in_(paths)):
+        found.setdefault(image.path, image.description if image.description and image.description.strip() else image.name)
+    return {path: found.get(path) or extract_description_from_path(path) for path in paths}
+
+
+def bundle_entries(document, host_url, username):
+    """
+    Pictogrammes référencés par un composite Android, et URL absentes
+    (fichier introuvable, ARASAAC injoignable, ou image d'un autre utilisateur).
+
+    Un nœud peut contenir une URL absolue déjà pointée vers ce serveur : elle
+    n'est pas passée par le filtrage du mappage, d'où la même règle que pour
+    serve_mobile_pictogram (public/ ou <username>/ seulement).
+    """
+    local_prefix = host_url.rstrip('/') + MOBILE_PICTOGRAMS_PREFIX
+    pictograms = Path(current_app.config['PICTOGRAMS_PATH']).resolve()
+    root = document.get('root_node')
+    urls = list(dict.fromkeys(node['image_url'] for node in (_nodes(root) if root else ()) if node.get('image_url')))
+    labels = {node['image_url']: node.get('description') for node in (_nodes(root) if root else ()) if node.get('image_url')}
+
+    local, entries, missing = {}, [], []
+    for url in urls:
+        if url.startswith(local_prefix):
+            relative = posixpath.normpath(url[len(local_prefix):])
+            allowed = relative.startswith(('public/', f"{username}/"))
+            source = (pictograms / relative).resolve()
+            if allowed and source.is_relative_to(pictograms) and source.is_file():
+                local[url] = (relative, source)
+                continue
+        elif match := ARASAAC_URL_REGEX.match(url):
+            try:
+                source = arasaac.fetch_pictogram(int(match.group(1)))
+                entries.append(BundleEntry(url, source, f"pictograms/arasaac/{match.group(1)}.png", labels.get(url)))
+                continue
+            except (ArasaacUnavailable, PictogramNotFound) as e:
+                current_app.logger.warning("Bundle: ARASAAC pictogram unavailable: %s", e)
+        missing.append(url)
+
+    descriptions = _descriptions([relative for relative, _ in local.values()])
+    for url, (relative, source) in local.items():
+        entries.append(BundleEntry(url, source, f"pictograms/{relative}", descriptions[relative]))
+    return entries, missing
+
+
+def bundle_fingerprint(document, entries, missing):
+    digest = hashlib.sha256(f"{BUNDLE_FORMAT}".encode())
+    digest.update(json.dumps(document, sort_keys=True).encode('utf-8'))
+    for entry in sorted(entries, key=lambda entry: entry.arcname):
+        stat = entry.source.stat()
+        digest.update(f"\0{entry.image_url}\0{entry.arcname}\0{entry.description}\0{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+    digest.update(json.dumps(missing).encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+def _write_bundle(path, document, entries, missing):
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'tree_id': document['tree_id'],
+        'name': document['name'],
+        'pictograms': {entry.image_url: {'file': entry.arcname, 'description': entry.description} for entry in entries},
+        'missing': missing,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp, zipfile.ZipFile(tmp, 'w') as bundle:
+            bundle.writestr('tree.json', json.dumps(document, ensure_ascii=False), zipfile.ZIP_DEFLATED)
+            bundle.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False), zipfile.ZIP_DEFLATED)
+            written = set()
+            for entry in entries:
+                if entry.arcname in written:
+                    continue
+                written.add(entry.arcname)
+                # Les images sont déjà compressées : stockées telles quelles
+                with open(entry.source, 'rb') as source, \
+                        bundle.open(zipfile.ZipInfo(entry.arcname, date_time=(1980, 1, 1, 0, 0, 0)), 'w') as target:
+                    shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def _prune(tree_id, keep):
+    """Supprime les autres paquets de l'arbre qui n'ont pas été servis depuis BUNDLE_STALE_AFTER."""
+    limit = time.time() - BUNDLE_STALE_AFTER
+    for stale in keep.parent.glob(f"{tree_id}-*.zip"):
+        try:
+            if stale != keep and stale.stat().st_mtime < limit:
+                stale.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def tree_bundle(tree_id, document, host_url, username):
+    """
+    Paquet d'un arbre, ouvert en lecture, et son empreinte (ETag) ; construit
+    si le contenu a changé depuis le dernier appel.
+
+    Un arbre public a un paquet par variante de son composite (les images
+    privées sont filtrées par utilisateur) : les autres paquets ne sont donc
+    supprimés qu'une fois inutilisés depuis BUNDLE_STALE_AFTER. Le fichier est
+    ouvert ici : une suppression ultérieure ne gêne pas son envoi.
+    """
+    entries, missing = bundle_entries(document, host_url, username)
+    fingerprint = bundle_fingerprint(document, entries, missing)
+    path = _bundles_folder() / f"{tree_id}-{fingerprint}.zip"
+
+    def build():
+        if not path.exists():
+            _write_bundle(path, document, entries, missing)
+            _prune(tree_id, path)
+
+    for _ in range(2):
+        _flights.do(path.name, build)
+        try:
+            bundle = open(path, 'rb')
+        except FileNotFoundError:
+            continue  # Supprimé entre-temps par un autre processus : reconstruit
+        # Paquet en service : date rafraîchie pour _prune
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return bundle, fingerprint
+    raise FileNotFoundError(path)
@@ -0,0 +1,281 @@
+"""
+Commandes `flask thumbnails` : reconstruction, vérification et nettoyage de
+PICTOGRAMS_PATH_MIN.
+
+    flask thumbnails rebuild [--workers N] [--restart]
+    flask thumbnails verify [--workers N] [--fix]
+    flask thumbnails prune-orphans [--dry-run]
+    flask search refresh-popularity
+
+Le rendu passe par app.thumbnails (le même code que les uploads et l'import
+public) et s'exécute dans un ProcessPoolExecutor. La reconstruction enregistre
+sa progression et reprend là où elle s'était arrêtée.
+
+`flask search refresh-popularity` recompte l'usage des images dans les arbres
+et les listes, qui départage les résultats de recherche.
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from app import db
+from app.models import Image, ImageBlob
+from app.search import refresh_popularity
+from app.storage import BLOBS_DIRNAME, blob_path, blob_thumbnail_path, link_or_copy
+from app.thumbnails import SIZES_DIRNAME, SPRITES_DIRNAME, check_thumbnail, generate_thumbnail, thumbnail_path, thumbnail_signature
+
+thumbnails_cli = AppGroup('thumbnails', help="Gestion des miniatures (PICTOGRAMS_PATH_MIN).")
+search_cli = AppGroup('search', help="Index de recherche des pictogrammes.")
+
+# Fichier de reprise de `rebuild`, à la racine de PICTOGRAMS_PATH_MIN
+REBUILD_STATE_NAME = '.rebuild-state.json'
+# Images lues en base (et confiées au pool) à la fois
+BATCH_SIZE = 512
+
+
+class Throughput:
+    """Compteurs de débit d'une commande."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.items = 0
+        self.bytes = 0
+        self.saved = 0
+        self.palette = 0
+        self.errors = 0
+
+    def add(self, result):
+        size, saved, mode, error = result
+        self.bytes += size
+        self.saved += saved
+        self.palette += mode == 'palette'
+        if error:
+            self.errors += 1
+            click.echo(f"Erreur : {error}", err=True)
+
+    def report(self, label):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        click.echo(
+            f"{label} : {self.items} miniature(s) en {elapsed:.1f} s "
+            f"({self.items / elapsed:.1f}/s, {self.bytes / elapsed / 1024:.0f} Ko/s), "
+            f"{self.errors} erreur(s)."
+        )
+        if self.bytes:
+            click.echo(
+                f"Encodage : {self.palette} en palette, {self.bytes / 1024:.0f} Ko écrits, "
+                f"{self.saved / 1024:.0f} Ko économisés par rapport aux couleurs vraies "
+                f"({self.saved * 100 / (self.bytes + self.saved):.1f} %)."
+            )
+
+
+def _render(job):
+    """
+    Exécuté dans un processus du pool : génère une miniature puis la lie aux
+    chemins des images qui la partagent.
+    Retourne (octets écrits, octets économisés, encodage, erreur).
+    """
+    source, target, links = job
+    try:
+        encoding = generate_thumbnail(source, target)
+        for link in links:
+            link_or_copy(target, link)
+        return len(encoding.data), encoding.truecolor_size - len(encoding.data), encoding.mode, None
+    except Exception as e:
+        return 0, 0, None, f"{source} : {type(e).__name__}: {e}"
+
+
+def _check(paths):
+    """Exécuté dans un processus du pool."""
+    source, target = paths
+    return check_thumbnail(source, target)
+
+
+def _pool(workers):
+    workers = os.cpu_count() if workers is None else workers
+    return ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+
+def _map(executor, function, items):
+    if executor is None:
+        return map(function, items)
+    return executor.map(function, items, chunksize=max(1, min(32, len(items) // 32)))
+
+
+def _image_rows(after_id=0):
+    """(id, path, sha256, extension) des images, par lots ordonnés par id."""
+    while True:
+        rows = db.session.query(Image.id, Image.path, ImageBlob.sha256, ImageBlob.extension) \
+            .outerjoin(ImageBlob, Image.blob_id == ImageBlob.id) \
+            .filter(Image.id > after_id, Image.path.isnot(None)) \
+            .order_by(Image.id).limit(BATCH_SIZE).all()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1].id
+
+
+def _render_jobs(rows, blobs_done):
+    """
+    Tâches de rendu d'un lot : une par image hors blob, une par blob (liée
+    ensuite au chemin de chaque image qui le partage).
+    """
+    pictograms = Path(current_app.config['PICTOGRAMS_PATH'])
+    jobs = []
+    by_blob = {}
+    for row in rows:
+        if row.sha256 is None:
+            jobs.append((pictograms / row.path, thumbnail_path(row.path), []))
+            continue
+        if row.sha256 not in by_blob:
+            done = row.sha256 in blobs_done
+            by_blob[row.sha256] = (blob_path(row), blob_thumbnail_path(row), [], done)
+        by_blob[row.sha256][2].append(thumbnail_path(row.path))
+    for sha256, (source, target, links, done) in by_blob.items():
+        if done:
+            # Déjà rendu plus tôt dans cette reconstruction : il suffit de lier
+            for link in links:
+                link_or_copy(target, link)
+            continue
+        jobs.append((source, target, links))
+        blobs_done.add(sha256)
+    return jobs
+
+
+def _load_state(path):
+    try:
+        return json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+@thumbnails_cli.command('rebuild')
+@click.option('--workers', type=int, default=None, help="Processus de rendu (défaut : nombre de CPU).")
+@click.option('--restart', is_flag=True, help="Ignore une reconstruction interrompue et repart de zéro.")
+def rebuild(workers, restart):
+    """Régénère toutes les miniatures (après un changement de THUMB_SIZE ou d'encodeur)."""
+    thumbs_folder = Path(current_app.config['PICTOGRAMS_PATH_MIN'])
+    thumbs_folder.mkdir(parents=True, exist_ok=True)
+    state_path = thumbs_folder / REBUILD_STATE_NAME
+    signature = thumbnail_signature()
+
+    after_id = 0
+    state = None if restart else _load_state(state_path)
+    if state and state.get('signature') == signature:
+        after_id = state.get('last_id', 0)
+        click.echo(f"Reprise de la reconstruction après l'image {after_id}.")
+
+    total = db.session.query(Image.id).filter(Image.id > after_id, Image.path.isnot(None)).count()
+    click.echo(f"{total} image(s) à traiter ({signature}).")
+    stats = Throughput()
+    blobs_done = set()
+    executor = _pool(workers)
+    try:
+        for rows in _image_rows(after_id):
+            jobs = _render_jobs(rows, blobs_done)
+            for result in _map(executor, _render, jobs):
+                stats.add(result)
+            stats.items += len(rows)
+            # Point de reprise : le lot est entièrement écrit
+            state_path.write_text(json.dumps({'signature': signature, 'last_id': rows[-1].id}), encoding='utf-8')
+            click.echo(f"  {stats.items}/{total}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    state_path.unlink(missing_ok=True)
+    stats.report("Reconstruction terminée")
+
+
+@thumbnails_cli.command('verify')
+@click.option('--workers', type=int, default=None, help="Processus de vérification (défaut : nombre de CPU).")
+@click.option('--fix', is_flag=True, help="Régénère les miniatures manquantes, corrompues ou périmées.")
+def verify(workers, fix):
+    """Vérifie que chaque image a une miniature lisible et à jour."""
+    pictograms = Path(current_app.config['PICTOGRAMS_PATH'])
+    stats = Throughput()
+    problems = {'missing': 0, 'corrupt': 0, 'stale': 0}
+    to_fix = []
+    executor = _pool(workers)
+    try:
+        for rows in _image_rows():
+            checks = [((blob_path(row) if row.sha256 else pictograms / row.path), thumbnail_path(row.path))
+                      for row in rows]
+            for row, problem in zip(rows, _map(executor, _check, checks)):
+                if problem:
+                    problems[problem] += 1
+                    to_fix.append(row)
+                    click.echo(f"{problem} : {row.path}")
+            stats.items += len(rows)
+
+        stats.report("Vérification terminée")
+        click.echo(", ".join(f"{count} {problem}" for problem, count in problems.items()))
+
+        if fix and to_fix:
+            fixed = Throughput()
+            for start in range(0, len(to_fix), BATCH_SIZE):
+                rows = to_fix[start:start + BATCH_SIZE]
+                for result in _map(executor, _render, _render_jobs(rows, set())):
+                    fixed.add(result)
+                fixed.items += len(rows)
+            fixed.report("Réparation terminée")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if to_fix and not fix:
+        raise SystemExit(1)
+
+
+@thumbnails_cli.command('prune-orphans')
+@click.option('--dry-run', is_flag=True, help="Liste les fichiers sans les supprimer.")
+def prune_orphans(dry_run):
+    """Supprime les miniatures qui ne correspondent plus à aucune image ni à aucun blob."""
+    thumbs_folder = Path(current_app.config['PICTOGRAMS_PATH_MIN'])
+    expected = {thumbnail_path(path) for (path,) in db.session.query(Image.path).filter(Image.path.isnot(None))}
+    expected |= {blob_thumbnail_path(blob) for blob in db.session.query(ImageBlob.sha256, ImageBlob.extension)}
+
+    stats = Throughput()
+    for root, dirs, files in os.walk(thumbs_folder, topdown=False):
+        root_path = Path(root)
+        if root_path == thumbs_folder:
+            # Fichiers de service (état de reconstruction, etc.)
+            files = [f for f in files if not f.startswith('.')]
+        parts = root_path.relative_to(thumbs_folder).parts
+        if SPRITES_DIRNAME in parts:
+            continue  # Planches gérées par build_folder_sprite
+        # Déclinaisons mobiles (.sizes/<taille>/...) : attendues tant que la miniature l'est
+        variant = parts[:1] == (SIZES_DIRNAME,)
+        for name in files:
+            path = root_path / name
+            if path in expected or (variant and thumbs_folder.joinpath(*parts[2:], name) in expected):
+                continue
+            stats.items += 1
+            stats.bytes += path.stat().st_size
+            click.echo(f"{'(simulation) ' if dry_run else ''}orpheline : {path.relative_to(thumbs_folder)}")
+            if not dry_run:
+                path.unlink()
+        if not dry_run and root_path != thumbs_folder and root_path.name not in (SPRITES_DIRNAME, BLOBS_DIRNAME, SIZES_DIRNAME):
+            try:
+                root_path.rmdir()  # Seulement s'il est vide
+            except OSError:
+                pass
+
+    click.echo(f"{stats.items} miniature(s) orpheline(s), {stats.bytes / 1024:.0f} Ko"
+               f"{' (simulation)' if dry_run else ' libérés'}.")
+
+
+@search_cli.command('refresh-popularity')
+def refresh_popularity_command():
+    """Recompte le nombre d'arbres et de listes qui utilisent chaque image."""
+    started = time.monotonic()
+    changed = refresh_popularity()
+    click.echo(f"Popularité recalculée en {time.monotonic() - started:.1f} s : {changed} image(s) mise(s) à jour.")
+
+
+def init_app(app):
+    app.cli.add_command(thumbnails_cli)
+    app.cli.add_command(search_cli)
@@ -0,0 +1,98 @@
+"""
+Compression des réponses (gzip, et brotli si le paquet est installé).
+
+Un after_request compresse les réponses dont le type figure dans
+COMPRESSION_MIMETYPES et qui dépassent COMPRESSION_MIN_SIZE octets, selon
+l'en-tête Accept-Encoding du client. Sont laissées telles quelles : les
+images et autres types hors liste, les fichiers servis par send_file
+(direct_passthrough), les réponses en flux, partielles ou déjà encodées.
+
+Quand une réponse porte un ETag, le corps compressé est gardé en cache par
+(chemin, ETag, encodage) : la même version n'est compressée qu'une fois.
+L'ETag devient faible (W/"...") puisque les octets envoyés diffèrent selon
+l'encodage ; If-None-Match continue de fonctionner.
+"""
+import gzip
+from flask import request
+from app.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # brotli est facultatif : gzip seul
+    brotli = None
+
+GZIP_LEVEL = 6
+# Qualité brotli adaptée à la compression à la volée (11 est bien trop lent)
+BROTLI_QUALITY = 5
+BODY_CACHE_SIZE = 256
+BODY_CACHE_TTL = 3600  # Secondes
+
+
+def _encoders():
+    encoders = {'gzip': lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        encoders['br'] = lambda data: brotli.compress(data, quality=BROTLI_QUALITY)
+    return encoders
+
+
+def choose_encoding(accept_encodings, encoders):
+    """Encodage préféré du client parmi ceux disponibles (brotli à qualité égale), ou None."""
+    best, best_quality = None, 0
+    for encoding in ('br', 'gzip'):
+        if encoding not in encoders:
+            continue
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compressible(response, config):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if 'Content-Encoding' in response.headers or 'Content-Range' in response.headers:
+        return False
+    return response.mimetype in config['COMPRESSION_MIMETYPES']
+
+
+def compress_response(response, app):
+    config = app.config
+    if not config['COMPRESSION_ENABLED'] or not _compressible(response, config):
+        return response
+
+    # La réponse dépend d'Accept-Encoding, même quand elle n'est pas compressée
+    response.vary.add('Accept-Encoding')
+    if response.content_length is not None and response.content_length < config['COMPRESSION_MIN_SIZE']:
+        return response
+    state = app.extensions['compression']
+    encoding = choose_encoding(request.accept_encodings, state['encoders'])
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < config['COMPRESSION_MIN_SIZE']:
+        return response
+
+    compress = state['encoders'][encoding]
+    etag, _ = response.get_etag()
+    if etag:
+        body = state['bodies'].get_or_set((request.path, etag, encoding), lambda: compress(data))
+        response.set_etag(etag, weak=True)
+    else:
+        body = compress(data)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.extensions['compression'] = {
+        'encoders': _encoders(),
+        'bodies': TTLCache(maxsize=BODY_CACHE_SIZE, ttl=BODY_CACHE_TTL),
+    }
+
+    @app.after_request
+    def compress(response):
+        return compress_response(response, app)
@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from flask_wtf.recaptcha import RecaptchaField
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField
-from wtforms.validators import DataRequired, ValidationError, Email, EqualTo
+from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, IntegerField
+from wtforms.validators import DataRequired, ValidationError, Email, EqualTo, Optional, NumberRange
 from app.models import User
 from flask_babel import lazy_gettext as _l
 import re
@@ -60,6 +60,11 @@ class DeleteAccountForm(FlaskForm):
     username_confirm = StringField(_l('Username'), validators=[DataRequired()], filters=[strip_filter])
     submit_delete_account = SubmitField(_l('Delete My Account'))
 
+class ImageSettingsForm(FlaskForm):
+    image_max_edge = IntegerField(_l('Maximum image size (pixels, 0 = original size)'),
+                                  validators=[Optional(), NumberRange(min=0, max=8192)])
+    submit_image_settings = SubmitField(_l('Save'))
+
 class ForgotPasswordForm(FlaskForm):
     email = StringField(_l('Email'), validators=[DataRequired(), Email()], filters=[strip_filter])
     submit = SubmitField(_l('Request Password Reset'))
@@ -2,6 +2,8 @@ from app import db, login
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from datetime import datetime, UTC
+from sqlalchemy.orm import validates
+from app.utils import normalize_root_path, normalize_search_key
 
 @login.user_loader
 def load_user(id):
@@ -20,6 +22,9 @@ class User(UserMixin, db.Model):
     locale = db.Column(db.String(10)) # ex: 'en', 'es', 'fr'
     confirmed = db.Column(db.Boolean, default=False, nullable=False, server_default='0')
     confirmed_on = db.Column(db.DateTime, nullable=True)
+    is_admin = db.Column(db.Boolean, default=False, nullable=False, server_default='0')
+    # Plus grand côté des images importées (None : IMAGE_MAX_EDGE, 0 : pas de réduction)
+    image_max_edge = db.Column(db.Integer, nullable=True)
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -63,14 +68,42 @@ class Folder(db.Model):
     def __repr__(self):
         return f'<Folder {self.name}>'
 
+class ImageBlob(db.Model):
+    """Fichier stocké une seule fois, adressé par son empreinte SHA-256."""
+    __tablename__ = 'image_blob'
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), index=True, unique=True, nullable=False)
+    extension = db.Column(db.String(10), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, default=0, nullable=False, server_default='0', index=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(UTC))
+
+    def __repr__(self):
+        return f'<ImageBlob {self.sha256[:12]} refs={self.ref_count}>'
+
 class Image(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    path = db.Column(db.String(256))
+    path = db.Column(db.String(256), index=True)
     name = db.Column(db.String(64))
+    # Nom replié pour la recherche (voir normalize_search_key), tenu à jour avec name
+    search_key = db.Column(db.String(128), index=True)
     description = db.Column(db.String(256))
+    # Nombre d'arbres et de listes qui utilisent l'image (`flask search refresh-popularity`)
+    use_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     is_public = db.Column(db.Boolean, default=False, nullable=False, server_default='0')
     folder_id = db.Column(db.Integer, db.ForeignKey('folder.id'))
+    blob_id = db.Column(db.Integer, db.ForeignKey('image_blob.id'), nullable=True, index=True)
+    # Upload d'origine, conservé lorsque l'image a été normalisée (IMAGE_KEEP_ORIGINAL)
+    original_blob_id = db.Column(db.Integer, db.ForeignKey('image_blob.id'), nullable=True, index=True)
+
+    blob = db.relationship('ImageBlob', foreign_keys=[blob_id])
+    original_blob = db.relationship('ImageBlob', foreign_keys=[original_blob_id])
+
+    @validates('name')
+    def _update_search_key(self, key, name):
+        self.search_key = normalize_search_key(name)
+        return name
 
     def to_dict(self):
         return {
@@ -87,6 +120,36 @@ class Image(db.Model):
     def __repr__(self):
         return '<Image {}>'.format(self.name)
 
+class ThumbnailJob(db.Model):
+    """File d'attente persistante de génération des miniatures."""
+    __tablename__ = 'thumbnail_job'
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('image.id', ondelete='CASCADE'), nullable=False, index=True)
+    status = db.Column(db.String(16), default='pending', nullable=False, server_default='pending', index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    last_error = db.Column(db.String(256))
+    # Après un échec : pas de nouvel essai avant cette date (délai croissant)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(UTC))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC))
+
+    image = db.relationship('Image', backref=db.backref('thumbnail_jobs', lazy='dynamic', cascade='all, delete-orphan'))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'image_id': self.image_id,
+            'path': self.image.path if self.image else None,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    def __repr__(self):
+        return f'<ThumbnailJob image={self.image_id} {self.status}>'
+
 class Tree(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -94,9 +157,13 @@ class Tree(db.Model):
     is_public = db.Column(db.Boolean, default=False, nullable=False, server_default='0')
     root_id = db.Column(db.Integer, default=-1, nullable=True)
     root_url = db.Column(db.String(256), nullable=True)
+    # root_url normalisée (voir normalize_root_path), tenue à jour avec root_url
+    root_path = db.Column(db.String(256), nullable=True)
     json_data = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(UTC))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC))
+    # Version de la dernière écriture, attribuée par app.sync (synchronisation mobile)
+    sync_version = db.Column(db.Integer, default=0, nullable=False, server_default='0', index=True)
 
     user = db.relationship('User', backref=db.backref('trees', lazy=True))
 
@@ -104,6 +171,11 @@ class Tree(db.Model):
         db.UniqueConstraint('user_id', 'name', name='_user_id_name_uc'),
     )
 
+    @validates('root_url')
+    def _update_root_path(self, key, root_url):
+        self.root_path = normalize_root_path(root_url)
+        return root_url
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -121,6 +193,40 @@ class Tree(db.Model):
     def __repr__(self):
         return '<Tree {}>'.format(self.name)
 
+class TreeTombstone(db.Model):
+    """Trace d'un arbre supprimé, renvoyée aux appareils par la synchronisation."""
+    id = db.Column(db.Integer, primary_key=True)
+    tree_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    sync_version = db.Column(db.Integer, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, default=lambda: datetime.now(UTC))
+
+    def __repr__(self):
+        return f'<TreeTombstone tree={self.tree_id} v{self.sync_version}>'
+
+class SyncCounter(db.Model):
+    """Compteurs de versions de app.sync, une ligne par compteur."""
+    __tablename__ = 'sync_counter'
+    name = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class RefreshToken(db.Model):
+    """Jeton de renouvellement de l'application mobile (voir app/tokens.py) ; seule son empreinte est stockée."""
+    __tablename__ = 'refresh_token'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    token_hash = db.Column(db.String(64), nullable=False, unique=True)
+    # Chaîne de rotations issue d'une même connexion (un appareil)
+    family = db.Column(db.String(32), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(UTC))
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime)
+    # 'rotated', 'logout', 'reuse' ou 'password'
+    revoked_reason = db.Column(db.String(16))
+
+    def __repr__(self):
+        return f'<RefreshToken user={self.user_id} family={self.family[:8]}>'
+
 class PictogramList(db.Model):
     __tablename__ = 'pictogram_list'
     id = db.Column(db.Integer, primary_key=True)
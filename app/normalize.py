@@ -0,0 +1,164 @@
+"""
+Normalisation des images à l'import.
+
+Optionnelle (IMAGE_NORMALIZE) : le plus grand côté est plafonné, les métadonnées
+(EXIF, profil ICC, commentaires) sont retirées et l'image est réencodée dans un
+format compact (IMAGE_NORMALIZED_FORMAT). L'original n'est conservé que si
+IMAGE_KEEP_ORIGINAL est activé.
+"""
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+from flask import current_app
+from PIL import Image as PILImage, ImageOps
+
+# Extensions acceptées par format, la première étant celle utilisée à l'écriture
+FORMAT_SUFFIXES = {
+    'JPEG': ('.jpg', '.jpeg'),
+    'PNG': ('.png',),
+    'GIF': ('.gif',),
+    'WEBP': ('.webp',),
+}
+
+ORIGINALS_DIRNAME = '.originals'
+
+# Clés de PIL.Image.info qui portent des métadonnées à retirer
+METADATA_KEYS = ('exif', 'icc_profile', 'comment', 'xmp', 'XML:com.adobe.xmp', 'photoshop')
+
+NormalizeSettings = namedtuple('NormalizeSettings', 'max_edge image_format quality keep_original')
+
+
+def normalize_settings(user=None):
+    """
+    Réglages de normalisation pour un utilisateur, ou None si elle est désactivée.
+    User.image_max_edge remplace IMAGE_MAX_EDGE ; 0 désactive le redimensionnement.
+    """
+    config = current_app.config
+    if not config.get('IMAGE_NORMALIZE'):
+        return None
+    max_edge = config.get('IMAGE_MAX_EDGE', 1024)
+    if user is not None and getattr(user, 'image_max_edge', None) is not None:
+        max_edge = user.image_max_edge
+    return NormalizeSettings(
+        max_edge=max_edge,
+        image_format=config.get('IMAGE_NORMALIZED_FORMAT', 'WEBP').upper(),
+        quality=config.get('IMAGE_NORMALIZED_QUALITY', 85),
+        keep_original=config.get('IMAGE_KEEP_ORIGINAL', False),
+    )
+
+
+def filename_for_format(filename, image_format):
+    """Ajuste l'extension de filename au format réel de l'image."""
+    suffixes = FORMAT_SUFFIXES[image_format]
+    path = Path(filename)
+    if path.suffix.lower() in suffixes:
+        return filename
+    return str(path.with_suffix(suffixes[0]))
+
+
+def _prepare(img, image_format):
+    """Convertit le mode de l'image pour le format cible (fond blanc si pas d'alpha)."""
+    has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    if image_format == 'JPEG':
+        if has_alpha:
+            rgba = img.convert('RGBA')
+            background = PILImage.new('RGB', rgba.size, 'white')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            return background
+        return img.convert('RGB')
+    if img.mode not in ('RGB', 'RGBA'):
+        return img.convert('RGBA' if has_alpha else 'RGB')
+    return img
+
+
+def _has_metadata(img):
+    """EXIF, profil ICC, XMP, commentaires ou chunks texte PNG."""
+    if any(key in img.info for key in METADATA_KEYS):
+        return True
+    return bool(getattr(img, 'text', None)) or bool(img.getexif())
+
+
+def normalize_image(source_path, target_folder, settings):
+    """
+    Écrit une version normalisée de source_path dans un fichier temporaire de
+    target_folder et retourne son chemin, ou None si l'image est laissée telle
+    quelle (animation, ou image sans métadonnées dont le réencodage n'apporte
+    rien). N'utilise pas le contexte applicatif.
+    """
+    source_size = os.path.getsize(source_path)
+    with PILImage.open(source_path) as img:
+        if getattr(img, 'is_animated', False):
+            return None
+        had_metadata = _has_metadata(img)
+        # L'orientation EXIF est appliquée aux pixels avant de retirer les métadonnées
+        img = ImageOps.exif_transpose(img)
+        resized = False
+        if settings.max_edge and max(img.size) > settings.max_edge:
+            img.thumbnail((settings.max_edge, settings.max_edge), PILImage.LANCZOS)
+            resized = True
+        img = _prepare(img, settings.image_format)
+        img.info = {}
+
+        Path(target_folder).mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=target_folder, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                img.save(tmp, settings.image_format, quality=settings.quality, optimize=True)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+    # Sans redimensionnement ni métadonnées à retirer, on ne garde le réencodage que s'il est plus léger
+    if not resized and not had_metadata and os.path.getsize(tmp_name) >= source_size:
+        Path(tmp_name).unlink()
+        return None
+    return tmp_name
+
+
+def normalize_public_file(source_path, pictograms_path, settings):
+    """
+    Normalise sur place un fichier de la banque publique (script d'import).
+    L'original est déplacé sous PICTOGRAMS_PATH/.originals si demandé, sinon supprimé.
+    Retourne le nouveau chemin, ou None si le fichier est inchangé.
+    """
+    source_path = Path(source_path)
+    tmp_name = normalize_image(source_path, source_path.parent, settings)
+    if tmp_name is None:
+        return None
+
+    target = source_path.with_name(filename_for_format(source_path.name, settings.image_format))
+    if settings.keep_original:
+        original = Path(pictograms_path) / ORIGINALS_DIRNAME / source_path.relative_to(pictograms_path)
+        original.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(source_path, original)
+    elif target != source_path:
+        source_path.unlink()
+    if target == source_path:
+        os.replace(tmp_name, target)
+        return target
+    return _claim_name(tmp_name, target)
+
+
+def _claim_name(tmp_name, target):
+    """
+    Déplace tmp_name vers target, ou vers target_1, target_2... si le nom est pris
+    ("a.png" et "a.jpg" deviennent tous deux "a.webp"). os.link échoue si la cible
+    existe : deux processus de l'import ne peuvent pas prendre le même nom.
+    """
+    candidate, number = target, 0
+    while True:
+        try:
+            os.link(tmp_name, candidate)
+            os.unlink(tmp_name)
+            return candidate
+        except FileExistsError:
+            pass
+        except OSError:
+            # Système de fichiers sans liens physiques : repli non atomique
+            if not candidate.exists():
+                os.replace(tmp_name, candidate)
+                return candidate
+        number += 1
+        candidate = target.with_name(f"{target.stem}_{number}{target.suffix}")
@@ -0,0 +1,34 @@
+from functools import wraps
+from flask import Blueprint, render_template, redirect, url_for, flash, abort
+from flask_babel import _
+from flask_login import current_user, login_required
+from app.models import ThumbnailJob
+from app.thumbnail_queue import queue_stats, retry_failed
+
+bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+def admin_required(view):
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not current_user.is_admin:
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+@bp.route('/thumbnails')
+@admin_required
+def thumbnails():
+    """Queue depth and failures of the background thumbnail generation."""
+    stats = queue_stats()
+    failures = ThumbnailJob.query.filter_by(status='failed') \
+        .order_by(ThumbnailJob.updated_at.desc()).limit(50).all()
+    return render_template('admin/thumbnails.html', title=_('Thumbnail queue'),
+                           stats=stats, failures=failures)
+
+@bp.route('/thumbnails/retry', methods=['POST'])
+@admin_required
+def retry_thumbnails():
+    count = retry_failed()
+    flash(_('%(count)s thumbnail job(s) queued again.', count=count), 'success')
+    return redirect(url_for('admin.thumbnails'))
@@ -1,25 +1,38 @@
-from flask import Blueprint, jsonify, request, current_app, json, abort
+from flask import Blueprint, jsonify, request, current_app, json, abort, send_file, url_for
 from flask_login import current_user, login_required
 from flask_babel import _
 from werkzeug.utils import secure_filename
 from app import db
 from app.models import Tree, PictogramList, Folder, Image
+from app.thumbnails import build_folder_sprite, remove_variant_folder, remove_variants, sprite_image_path, thumbnail_path
+from app.cache import description_cache
+from app.storage import (
+    UploadRejected, receive_upload, normalize_received, store_received, discard_received, blobs_folder,
+    link_or_copy, blob_path, release_blob, purge_unreferenced_blobs
+)
+from app.thumbnail_queue import enqueue_thumbnail, dispatch
+from app.normalize import normalize_settings, filename_for_format
+from app.search import SEARCH_LIMIT, SEARCH_PAGE_SIZE, search_page
+from app.utils import get_image_ids_from_tree
 from pathlib import Path
 import shutil
-from PIL import Image as PILImage
+import struct
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
 @bp.route('/trees/load', methods=['GET'])
 def load_trees():
-    # Public trees are all trees with is_public = True, ordered by name
-    public_trees = Tree.query.filter_by(is_public=True).order_by(Tree.name).all()
+    # Public trees are all trees with is_public = True, ordered by name.
+    # Owners are joined in the same query: to_dict() reads tree.user.username.
+    public_trees = Tree.query.options(joinedload(Tree.user)).filter_by(is_public=True).order_by(Tree.name).all()
 
     user_trees = []
     if current_user.is_authenticated:
         # Private trees are user-owned trees with is_public = False, ordered by name
-        user_trees = Tree.query.filter_by(user_id=current_user.id, is_public=False).order_by(Tree.name).all()
+        user_trees = Tree.query.options(joinedload(Tree.user)).filter_by(user_id=current_user.id, is_public=False).order_by(Tree.name).all()
 
     return jsonify({
         'public_trees': [tree.to_dict() for tree in public_trees],
@@ -241,22 +254,119 @@ def folder_images(folder_id):
     results = [{'type': 'image', 'data': img.to_dict()} for img in images]
     return jsonify(results)
 
-@bp.route('/search_local_images')
-def search_local_images():
-    q = request.args.get('q', '').strip()
-    if len(q) < 1:
-        return jsonify([])
-        
+@bp.route('/folder_sprite/<int:folder_id>', methods=['GET'])
+def folder_sprite(folder_id):
+    """
+    Returns the sprite sheet metadata for a folder: one PNG holding every
+    thumbnail of the folder, plus the offset of each image inside it.
+    """
+    folder = db.session.get(Folder, folder_id)
+    if folder is None:
+        abort(404)
+    if folder.user_id is not None:
+        if not current_user.is_authenticated or folder.user_id != current_user.id:
+            return jsonify({'error': 'Unauthorized'}), 403
+
+    images = folder.images.all()
+    version, metadata = build_folder_sprite(folder, images)
+    return jsonify({
+        'folder_id': folder.id,
+        'version': version,
+        'url': url_for('api.folder_sprite_image', folder_id=folder.id, version=version),
+        **metadata
+    })
+
+@bp.route('/folder_sprite/<int:folder_id>/<version>.png', methods=['GET'])
+def folder_sprite_image(folder_id, version):
+    folder = db.session.get(Folder, folder_id)
+    if folder is None:
+        abort(404)
+    if folder.user_id is not None:
+        if not current_user.is_authenticated or folder.user_id != current_user.id:
+            return jsonify({'error': 'Unauthorized'}), 403
+
+    if not version.isalnum():
+        abort(404)
+    sprite_path = sprite_image_path(folder.id, version)
+    if not sprite_path.exists():
+        abort(404)
+    # The URL is versioned by content, so the browser may cache it for a long time
+    return send_file(sprite_path, mimetype='image/png', max_age=31536000)
+
+# Maximum number of thumbnails returned by a single bundle request
+MAX_BUNDLE_IDS = 200
+
+def thumbnail_visibility_conditions():
+    """Same access rules as files.serve_pictogram_min, as SQL conditions."""
     conditions = [
-        Image.user_id.is_(None),
+        Image.path.startswith('public/'),
         Image.is_public.is_(True)
     ]
     if current_user.is_authenticated:
         conditions.append(Image.user_id == current_user.id)
-        
-    images = Image.query.filter(or_(*conditions)).filter(Image.name.ilike(f'%{q}%')).limit(100).all()
-    results = [{'type': 'image', 'data': img.to_dict()} for img in images]
-    return jsonify(results)
+    return conditions
+
+@bp.route('/thumbnails/bundle', methods=['GET'])
+def thumbnails_bundle():
+    """
+    Returns the thumbnails of several images in one length-prefixed binary response.
+    Each entry is: image id (uint32, big-endian), length (uint32, big-endian), PNG bytes.
+    Images that do not exist, are not accessible or have no thumbnail are omitted.
+    """
+    raw_ids = request.args.get('ids', '')
+    try:
+        image_ids = list(dict.fromkeys(int(part) for part in raw_ids.split(',') if part.strip()))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': _('Invalid data')}), 400
+
+    if not image_ids:
+        return jsonify({'status': 'error', 'message': _('Invalid data')}), 400
+    if len(image_ids) > MAX_BUNDLE_IDS:
+        return jsonify({'status': 'error', 'message': _('Too many images requested')}), 400
+
+    # One query for all ACL checks
+    images = Image.query.filter(
+        Image.id.in_(image_ids),
+        or_(*thumbnail_visibility_conditions())
+    ).all()
+    images_by_id = {image.id: image for image in images}
+
+    chunks = []
+    for image_id in image_ids:
+        image = images_by_id.get(image_id)
+        if image is None:
+            continue
+        try:
+            data = thumbnail_path(image.path).read_bytes()
+        except OSError:
+            continue
+        chunks.append(struct.pack('>II', image.id, len(data)))
+        chunks.append(data)
+
+    response = current_app.response_class(b''.join(chunks), mimetype='application/octet-stream')
+    response.headers['X-Bundle-Count'] = str(len(chunks) // 2)
+    return response
+
+@bp.route('/search_local_images')
+def search_local_images():
+    q = request.args.get('q', '').strip()
+    if len(q) < 1:
+        return jsonify({'results': [], 'has_more': False, 'next_cursor': None})
+
+    # Results come ranked (exact, prefix, substring, description match, then popularity);
+    # pass next_cursor back as ?cursor= to get the following page
+    limit = min(max(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), 1), SEARCH_LIMIT)
+    user_id = current_user.id if current_user.is_authenticated else None
+    try:
+        page = search_page(q, user_id, limit, request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': _('Invalid cursor')}), 400
+    return jsonify({
+        'results': [{'type': 'image', 'data': image} for image in page.items],
+        'has_more': page.next_cursor is not None,
+        'next_cursor': page.next_cursor,
+    })
+
 @bp.route('/pictograms', methods=['GET'])
 @login_required
 def get_pictograms():
@@ -266,11 +376,11 @@ def get_pictograms():
 
     return jsonify(root_folder.to_dict(include_children=True))
 
-def check_user_quota():
+def check_user_quota(new_items=1):
     max_items = current_app.config.get('MAX_ITEMS_LIMIT', 5000)
     user_folders = Folder.query.filter_by(user_id=current_user.id).count()
     user_images = Image.query.filter_by(user_id=current_user.id).count()
-    return (user_folders + user_images) < max_items
+    return (user_folders + user_images + new_items) <= max_items
 
 @bp.route('/folder/create', methods=['POST'])
 @login_required
@@ -315,27 +425,81 @@ def create_folder():
 
     return jsonify({'status': 'success', 'folder': new_folder.to_dict(include_children=False)})
 
-# --- Helper pour la création de miniatures ---
-THUMB_SIZE = (48, 48)
+ALLOWED_IMAGE_MIMETYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp'}
+# Formats accepted once the header has been sniffed (defense in depth vs fake extensions)
+ALLOWED_IMAGE_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+# Room left for the multipart boundaries and form fields around each file
+UPLOAD_FORM_OVERHEAD = 64 * 1024
 
-def create_thumbnail_for_upload(filepath_relative):
-    """Génère une miniature pour une image uploadée."""
-    try:
-        source_folder = Path(current_app.config['PICTOGRAMS_PATH'])
-        thumbs_folder = Path(current_app.config['PICTOGRAMS_PATH_MIN'])
+# Shared pool for the reception of batch uploads
+_validation_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='upload-validation')
 
-        source_path = source_folder / filepath_relative
-        thumb_path_relative = Path(filepath_relative).with_suffix('.png')
-        thumb_path_full = thumbs_folder / thumb_path_relative
+def max_upload_bytes():
+    return current_app.config['MAX_IMAGE_SIZE_KB'] * 1024
 
-        thumb_path_full.parent.mkdir(parents=True, exist_ok=True)
+def limit_request_size(file_count):
+    """Lets Werkzeug refuse oversized bodies before reading them (answered by the 413 handler)."""
+    request.max_content_length = file_count * (max_upload_bytes() + UPLOAD_FORM_OVERHEAD)
 
-        with PILImage.open(source_path) as img:
-            img.thumbnail(THUMB_SIZE)
-            img.save(thumb_path_full, 'PNG', quality=85, optimize=True)
+def limit_upload_size():
+    """
+    App-level before_request hook, registered before CSRFProtect: the CSRF check
+    reads request.form, which parses the whole body, so the limit must be set first.
+    """
+    if request.endpoint == 'api.upload_image':
+        limit_request_size(1)
+    elif request.endpoint == 'api.upload_images_batch':
+        limit_request_size(current_app.config.get('MAX_BATCH_UPLOAD_FILES', 100))
 
-    except Exception as e:
-        current_app.logger.error(f"Erreur lors de la création de la miniature pour {filepath_relative}: {e}")
+def receive_image(file, tmp_folder, max_bytes, settings=None):
+    """
+    Streams an uploaded file to a temporary file, hashing it and sniffing its
+    header in the same pass, then normalizes it when settings are given.
+    Returns (received, original, error_code); original is the untouched upload,
+    kept only when the image was normalized and IMAGE_KEEP_ORIGINAL is set.
+    Needs no app context, so it can run in a worker thread.
+    """
+    if file.mimetype not in ALLOWED_IMAGE_MIMETYPES:
+        return None, None, 'format'
+    try:
+        received = receive_upload(file.stream, tmp_folder, max_bytes, ALLOWED_IMAGE_FORMATS)
+    except UploadRejected as e:
+        return None, None, e.code
+    if settings is None:
+        return received, None, None
+
+    try:
+        normalized = normalize_received(received, tmp_folder, settings)
+    except Exception:
+        discard_received(received)
+        return None, None, 'invalid'
+    if normalized is None:
+        return received, None, None
+    if settings.keep_original:
+        return normalized, received, None
+    discard_received(received)
+    return normalized, None, None
+
+def store_image_files(received, original, filename):
+    """Stores a received upload (and its kept original) as blobs. Returns (filename, blob, original_blob)."""
+    filename = filename_for_format(filename, received.format)
+    original_blob = None
+    if original is not None:
+        original_blob = store_received(original, Path(filename_for_format(filename, original.format)).suffix)
+    blob = store_received(received, Path(filename).suffix)
+    return filename, blob, original_blob
+
+def upload_error_message(error):
+    if error == 'format':
+        return _('Format de fichier non autorisé.')
+    if error == 'too_large':
+        return _('L\'image dépasse la taille maximale autorisée (%(max)s Ko).',
+                 max=current_app.config['MAX_IMAGE_SIZE_KB'])
+    return _('Fichier image invalide ou potentiellement malveillant.')
+
+@bp.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'status': 'error', 'message': upload_error_message('too_large')}), 413
 
 @bp.route('/image/upload', methods=['POST'])
 @login_required
@@ -361,6 +525,17 @@ def upload_image():
     if file:
         filename = secure_filename(file.filename)
 
+        received, original, error = receive_image(file, blobs_folder(), max_upload_bytes(),
+                                                  normalize_settings(current_user))
+        if error:
+            status = 413 if error == 'too_large' else 400
+            return jsonify({'status': 'error', 'message': upload_error_message(error)}), status
+
+        # Content-addressed storage: identical files are stored once,
+        # the folder path is a link to the shared blob.
+        # Normalization may have changed the format, hence the file extension.
+        filename, blob, original_blob = store_image_files(received, original, filename)
+
         # The folder path from DB is relative. Combine it with the base path for physical operations.
         base_path = Path(current_app.config['PICTOGRAMS_PATH'])
         physical_path = base_path / folder.path / filename
@@ -368,43 +543,108 @@ def upload_image():
         # The new path for the DB is also relative.
         relative_path = Path(folder.path) / filename
 
-        # Validate MIME and Extension
-        allowed_mimetypes = {'image/jpeg', 'image/png', 'image/gif', 'image/webp'}
-        if file.mimetype not in allowed_mimetypes:
-            return jsonify({'status': 'error', 'message': _('Format de fichier non autorisé.')}), 400
-
-        # Deep magic-byte verification (Defense in depth vs Fake Extensions)
-        try:
-            pil_img = PILImage.open(file)
-            pil_img.verify()
-            file.seek(0) # Reset stream after reading
-        except Exception:
-            return jsonify({'status': 'error', 'message': _('Fichier image invalide ou potentiellement malveillant.')}), 400
-
-        file.save(physical_path)
+        link_or_copy(blob_path(blob), physical_path)
 
         new_image = Image(
             name=filename,
             path=str(relative_path).replace('\\', '/'),
             user_id=current_user.id,
             folder_id=folder.id,
+            blob=blob,
+            original_blob=original_blob,
             description="" # Or get from form
         )
         db.session.add(new_image)
+        # The thumbnail job is persisted with the image, then run in the background
+        thumbnail_job = enqueue_thumbnail(new_image)
         db.session.commit()
-
-        # --- AJOUTER L'APPEL POUR CRÉER LA MINIATURE ---
-        try:
-            create_thumbnail_for_upload(new_image.path)
-        except Exception as e:
-            current_app.logger.error(f"Échec de la création de miniature pour {new_image.path}: {e}")
-        # --- FIN DE L'AJOUT ---
+        dispatch([thumbnail_job])
 
         return jsonify({'status': 'success', 'image': new_image.to_dict()})
 
     return jsonify({'status': 'error', 'message': _('File upload failed')}), 500
 
 
+@bp.route('/image/upload/batch', methods=['POST'])
+@login_required
+def upload_images_batch():
+    """
+    Uploads several images into one folder. Files are validated in parallel,
+    all Image rows are inserted in one transaction and their thumbnails queued
+    together. Returns one result per file.
+    """
+    files = [file for file in request.files.getlist('files') if file and file.filename]
+    if not files:
+        return jsonify({'status': 'error', 'message': _('No file part')}), 400
+
+    max_files = current_app.config.get('MAX_BATCH_UPLOAD_FILES', 100)
+    if len(files) > max_files:
+        return jsonify({'status': 'error', 'message': _('Too many files (maximum %(max)s per upload).', max=max_files)}), 400
+
+    folder_id = request.form.get('folder_id')
+    if not folder_id:
+        return jsonify({'status': 'error', 'message': _('No folder_id specified')}), 400
+
+    folder = db.session.get(Folder, folder_id)
+    if not folder or folder.user_id != current_user.id:
+        return jsonify({'status': 'error', 'message': _('Folder not found or not owned by user')}), 404
+
+    if not check_user_quota(len(files)):
+        return jsonify({'status': 'error', 'message': _('L\'espace de stockage maximal est atteint pour ce compte.')}), 429
+
+    tmp_folder, max_bytes = blobs_folder(), max_upload_bytes()
+    settings = normalize_settings(current_user)
+    received_files = list(_validation_pool.map(lambda f: receive_image(f, tmp_folder, max_bytes, settings), files))
+
+    base_path = Path(current_app.config['PICTOGRAMS_PATH'])
+    results = []
+    new_images = []
+    batch_names = set()
+    for file, (received, original, error) in zip(files, received_files):
+        filename = secure_filename(file.filename)
+        # Two files stored under the same name would overwrite each other: the first one wins
+        duplicate = not error and filename and filename_for_format(filename, received.format) in batch_names
+        if error or not filename or duplicate:
+            for part in (received, original):
+                if part:
+                    discard_received(part)
+            message = _('Un autre fichier de cet envoi porte déjà ce nom.') if duplicate else upload_error_message(error)
+            results.append({'filename': file.filename, 'status': 'error', 'message': message})
+            continue
+
+        filename, blob, original_blob = store_image_files(received, original, filename)
+        batch_names.add(filename)
+        link_or_copy(blob_path(blob), base_path / folder.path / filename)
+
+        new_image = Image(
+            name=filename,
+            path=(Path(folder.path) / filename).as_posix(),
+            user_id=current_user.id,
+            folder_id=folder.id,
+            blob=blob,
+            original_blob=original_blob,
+            description=""
+        )
+        db.session.add(new_image)
+        new_images.append(new_image)
+        results.append({'filename': file.filename, 'status': 'success', 'image': new_image})
+
+    thumbnail_jobs = [enqueue_thumbnail(image) for image in new_images]
+    db.session.commit()
+    dispatch(thumbnail_jobs)
+
+    for result in results:
+        if 'image' in result:
+            result['image'] = result['image'].to_dict()
+
+    return jsonify({
+        'status': 'success' if new_images else 'error',
+        'uploaded': len(new_images),
+        'failed': len(results) - len(new_images),
+        'results': results
+    })
+
+
 @bp.route('/image/<int:image_id>', methods=['PUT'])
 @login_required
 def update_image_details(image_id):
@@ -431,6 +671,7 @@ def update_image_details(image_id):
         image.is_public = bool(data['is_public'])
 
     db.session.commit()
+    description_cache.pop(image.path)
 
     return jsonify({
         'status': 'success',
@@ -438,17 +679,6 @@ def update_image_details(image_id):
         'image': image.to_dict()
     })
 
-def get_image_ids_from_tree(nodes):
-    """Recursively extracts all image IDs from a tree structure."""
-    image_ids = set()
-    for node in nodes:
-        # The 'id' in the tree data corresponds to the image ID
-        if 'id' in node and node['id'] != -1:
-            image_ids.add(node['id'])
-        if 'children' in node and node['children']:
-            image_ids.update(get_image_ids_from_tree(node['children']))
-    return image_ids
-
 @bp.route('/tree/save', methods=['POST'])
 @login_required
 def save_tree():
@@ -531,8 +761,11 @@ def delete_folder_recursive(folder):
             physical_path_min = base_path_min / image.path
             physical_path_min = physical_path_min.with_suffix('.png')
             physical_path_min.unlink(missing_ok=True)
+            remove_variants(image.path)
         except OSError as e:
             print(f"Error deleting file {physical_path}: {e}") # Or use proper logging
+        release_blob(image)
+        description_cache.pop(image.path)
         db.session.delete(image)
 
     # Delete the folder directory itself
@@ -550,6 +783,7 @@ def delete_folder_recursive(folder):
             shutil.rmtree(physical_path_min)
     except OSError as e:
         print(f"Error deleting directory {physical_path_min}: {e}")
+    remove_variant_folder(folder.path)
 
     # Delete the folder from DB
     db.session.delete(folder)
@@ -574,6 +808,7 @@ def delete_item():
 
         delete_folder_recursive(folder)
         db.session.commit()
+        purge_unreferenced_blobs()
         return jsonify({'status': 'success', 'message': _('Folder and all its contents deleted')})
 
     elif item_type == 'image':
@@ -588,12 +823,16 @@ def delete_item():
             base_path_min = Path(current_app.config['PICTOGRAMS_PATH_MIN'])
             physical_path_min = base_path_min / image.path
             physical_path_min = physical_path_min.with_suffix('.png')
-            physical_path_min.unlink()
+            physical_path_min.unlink(missing_ok=True) # May still be pending
+            remove_variants(image.path)
         except OSError as e:
             return jsonify({'status': 'error', 'message': _('Could not delete file: %(error)s', error=e)}), 500
 
+        release_blob(image)
         db.session.delete(image)
         db.session.commit()
+        description_cache.pop(image.path)
+        purge_unreferenced_blobs()
         return jsonify({'status': 'success', 'message': _('Image deleted')})
 
     return jsonify({'status': 'error', 'message': _('Invalid item type')}), 400
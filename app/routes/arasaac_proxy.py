@@ -0,0 +1,43 @@
+from flask import Blueprint, jsonify, current_app, abort, send_file
+from flask_babel import _
+from app import arasaac
+from app.arasaac import ArasaacUnavailable, MAX_QUERY_LENGTH, PictogramNotFound
+
+# Caching proxy in front of api.arasaac.org / static.arasaac.org (see app/arasaac.py)
+bp = Blueprint('arasaac', __name__, url_prefix='/api/arasaac')
+
+# Browser cache lifetime of proxied pictograms (they are stable per id)
+PICTOGRAM_MAX_AGE = 7 * 24 * 3600
+
+
+@bp.route('/pictograms/<locale>/search/<path:query>')
+def search_pictograms(locale, query):
+    if locale not in current_app.config['LANGUAGES']:
+        return jsonify({'status': 'error', 'message': _('Unsupported language')}), 400
+    query = query.strip()
+    if not query:
+        return jsonify([])
+    if len(query) > MAX_QUERY_LENGTH:
+        return jsonify({'status': 'error', 'message': _('Search query is too long')}), 400
+
+    try:
+        results = arasaac.search(locale, query)
+    except ArasaacUnavailable as e:
+        current_app.logger.warning("ARASAAC search failed: %s", e)
+        return jsonify({'status': 'error', 'message': _('ARASAAC is unavailable, please try again later')}), 502
+
+    response = jsonify(results)
+    response.headers['Cache-Control'] = f"public, max-age={current_app.config['ARASAAC_SEARCH_TTL']}"
+    return response
+
+
+@bp.route('/pictograms/<int:picto_id>.png')
+def pictogram(picto_id):
+    try:
+        path = arasaac.fetch_pictogram(picto_id)
+    except PictogramNotFound:
+        abort(404)
+    except ArasaacUnavailable as e:
+        current_app.logger.warning("ARASAAC pictogram download failed: %s", e)
+        return jsonify({'status': 'error', 'message': _('ARASAAC is unavailable, please try again later')}), 502
+    return send_file(path, mimetype='image/png', max_age=PICTOGRAM_MAX_AGE)
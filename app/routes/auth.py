@@ -3,9 +3,13 @@ from flask_login import current_user, login_user, logout_user, login_required
 from flask_babel import _
 from markupsafe import Markup
 from app import db
-from app.forms import LoginForm, RegistrationForm, ChangePasswordForm, DeleteAccountForm, ForgotPasswordForm, ResetPasswordForm, ResendConfirmationForm
-from app.models import User, Tree, PictogramList, Image, Folder
+from app.forms import LoginForm, RegistrationForm, ChangePasswordForm, DeleteAccountForm, ForgotPasswordForm, ResetPasswordForm, ResendConfirmationForm, ImageSettingsForm
+from app.models import User, Tree, TreeTombstone, RefreshToken, PictogramList, Image, Folder
+from app.tokens import revoke_user_refresh_tokens
+from app.search import touch_public_library
 from app.utils import send_email, generate_confirmation_token, confirm_token, generate_password_reset_token, confirm_password_reset_token
+from app.storage import release_user_blobs, purge_unreferenced_blobs
+from app.thumbnails import remove_variant_folder
 from datetime import datetime, UTC
 from pathlib import Path
 import shutil
@@ -147,6 +151,7 @@ def reset_with_token_route(token):
     if form.validate_on_submit():
         user = User.query.filter_by(email=email).first_or_404()
         user.set_password(form.password.data)
+        revoke_user_refresh_tokens(user.id)
         db.session.commit()
         flash(_('Your password has been reset successfully.'), 'success')
         return redirect(url_for('auth.login'))
@@ -158,9 +163,26 @@ def reset_with_token_route(token):
 def account():
     change_password_form = ChangePasswordForm()
     delete_account_form = DeleteAccountForm()
+    image_settings_form = ImageSettingsForm(image_max_edge=current_user.image_max_edge)
     return render_template('account.html', title='Account Management',
                            change_password_form=change_password_form,
-                           delete_account_form=delete_account_form)
+                           delete_account_form=delete_account_form,
+                           image_settings_form=image_settings_form)
+
+@bp.route('/image_settings', methods=['POST'])
+@login_required
+def image_settings():
+    form = ImageSettingsForm()
+    if form.validate_on_submit():
+        # Empty field: back to the server default (IMAGE_MAX_EDGE)
+        current_user.image_max_edge = form.image_max_edge.data
+        db.session.commit()
+        flash(_('Your image settings have been saved.'), 'success')
+    else:
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(_('Error in %(field)s: %(error)s', field=getattr(form, field).label.text, error=error), 'danger')
+    return redirect(url_for('auth.account'))
 
 @bp.route('/change_password', methods=['POST'])
 @login_required
@@ -170,6 +192,8 @@ def change_password():
         user = current_user
         if user.check_password(form.current_password.data):
             user.set_password(form.new_password.data)
+            # Mobile devices have to log in again with the new password
+            revoke_user_refresh_tokens(user.id)
             db.session.commit()
             flash(_('Your password has been changed successfully.'), 'success')
         else:
@@ -189,10 +213,14 @@ def delete_account():
             user = current_user
             # 1. Delete all trees of the user
             Tree.query.filter_by(user_id=user.id).delete()
+            TreeTombstone.query.filter_by(user_id=user.id).delete()
+            RefreshToken.query.filter_by(user_id=user.id).delete()
             # 2. Delete all lists of the user
             PictogramList.query.filter_by(user_id=user.id).delete()
-            # 3. Delete all images belonging to the user
+            # 3. Delete all images belonging to the user (and their blob references)
+            release_user_blobs(user.id)
             Image.query.filter_by(user_id=user.id).delete()
+            touch_public_library(db.session)  # Ses images partagées quittent la banque publique
             # 4. Delete the user's pictogram directory
             user_pictogram_folder = Path(current_app.config['PICTOGRAMS_PATH']) / user.username
             if user_pictogram_folder.exists():
@@ -200,11 +228,13 @@ def delete_account():
             user_pictogram_min_folder = Path(current_app.config['PICTOGRAMS_PATH_MIN']) / user.username
             if user_pictogram_min_folder.exists():
                 shutil.rmtree(user_pictogram_min_folder)
+            remove_variant_folder(user.username)
             # 5. Delete all folders of the user
             Folder.query.filter_by(user_id=user.id).delete()
             # 6. Delete the user account
             db.session.delete(user)
             db.session.commit()
+            purge_unreferenced_blobs()
             logout_user()
             flash(_('Your account has been successfully deleted.'), 'success')
             return redirect(url_for('main.index'))
@@ -4,6 +4,8 @@ from pathlib import Path
 import os
 from app import db
 from app.models import Image
+from app.thumbnail_queue import is_pending
+from app.thumbnails import thumbnail_path
 
 bp = Blueprint('files', __name__)
 
@@ -32,11 +34,24 @@ def serve_pictogram(filepath):
     return send_from_directory(pictograms_path, filepath)
 
 
+def _pending_thumbnail_placeholder(image):
+    """Placeholder served while the thumbnail of the image is still being generated."""
+    if image is not None and is_pending(image) and not thumbnail_path(image.path).exists():
+        response = send_from_directory(current_app.static_folder, 'images/loading.gif')
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    return None
+
+
 @bp.route('/pictogramsmin/<path:filepath>')
 def serve_pictogram_min(filepath):
     """Serves a pictogram from the external data directory."""
     pictograms_path = Path(current_app.config['PICTOGRAMS_PATH_MIN'])
     if filepath.startswith("public/"):
+        if not (pictograms_path / filepath).exists():
+            placeholder = _pending_thumbnail_placeholder(db.session.scalar(db.select(Image).filter_by(path=filepath)))
+            if placeholder:
+                return placeholder
     # send_from_directory is security-conscious and will prevent path traversal attacks.
         return send_from_directory(pictograms_path, filepath)
     image = db.session.scalar(db.select(Image).filter_by(path=filepath))
@@ -44,6 +59,9 @@ def serve_pictogram_min(filepath):
     if image is None or (((current_user.is_authenticated and image.user_id != current_user.id) or not current_user.is_authenticated) and not image.is_public):
         # Si l'image n'existe pas ou n'appartient pas à l'utilisateur, on bloque.
         return send_from_directory(current_app.static_folder, 'images/prohibit-bold.png')
+    placeholder = _pending_thumbnail_placeholder(image)
+    if placeholder:
+        return placeholder
     pictograms_path_min, old_extension= os.path.splitext(filepath)
     pictograms_path_min = pictograms_path_min + ".png"
     return send_from_directory(pictograms_path, pictograms_path_min)
@@ -1,8 +1,16 @@
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app, send_from_directory, send_file
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt, get_jwt_identity
 from app.models import User, Tree, Image
 from app import db 
+from app.cache import description_cache
+from app.utils import extract_description_from_path
+from app.search import search
+from app.sync import MAX_SYNC_LIMIT, SYNC_LIMIT, changes_since
+from app.bundles import tree_bundle
+from app.thumbnails import pictogram_variant
+from app.tokens import InvalidRefreshToken, issue_refresh_token, revoke_refresh_token, rotate_refresh_token
 import json
+from collections import namedtuple
 from pathlib import Path
 import posixpath
 import urllib.parse
@@ -11,6 +19,43 @@ import re
 # Création du Blueprint dédié au mobile
 bp = Blueprint('mobile_api', __name__, url_prefix='/api/v1/mobile')
 
+TokenUser = namedtuple('TokenUser', 'id username')
+
+# Nombre maximal d'arbres par appel à /trees/batch
+MAX_BATCH_TREES = 50
+
+
+def create_user_access_token(user):
+    """
+    Jeton d'accès avec le nom et l'état de confirmation de l'utilisateur en
+    claims : les routes s'autorisent sans relire User à chaque requête.
+    """
+    return create_access_token(identity=str(user.id),
+                               additional_claims={'username': user.username, 'confirmed': user.confirmed})
+
+
+def _token_user():
+    """Utilisateur du jeton courant, lu dans ses claims ; None s'il n'existe plus."""
+    user_id = int(get_jwt_identity())
+    claims = get_jwt()
+    if 'username' in claims:
+        return TokenUser(user_id, claims['username'])
+    # Jeton émis avant l'ajout des claims
+    user = db.session.get(User, user_id)
+    return TokenUser(user.id, user.username) if user else None
+
+
+def _natural_number(value):
+    """Entier positif ou nul écrit en chiffres ASCII (pas '²', '-1' ni ' 1'), sinon None."""
+    return int(value) if value.isascii() and value.isdigit() else None
+
+
+def _refresh_token_param(data):
+    """refresh_token d'un corps JSON s'il s'agit d'une chaîne non vide, sinon None."""
+    raw = data.get('refresh_token') if isinstance(data, dict) else None
+    return raw if isinstance(raw, str) and raw else None
+
+
 @bp.route('/login', methods=['POST'])
 def login():
     """Route de connexion pour l'application Android."""
@@ -29,11 +74,14 @@ def login():
             "code": "ACCOUNT_NOT_CONFIRMED"
         }), 403
 
-    access_token = create_access_token(identity=str(user.id))
+    access_token = create_user_access_token(user)
+    refresh_token = issue_refresh_token(user.id)
+    db.session.commit()
 
     return jsonify({
         "message": "Connexion réussie",
         "access_token": access_token,
+        "refresh_token": refresh_token,
         "user": {
             "id": user.id,
             "username": user.username,
@@ -42,6 +90,38 @@ def login():
     }), 200
 
 
+@bp.route('/token/refresh', methods=['POST'])
+def refresh_token():
+    """
+    Renouvellement sans mot de passe : échange le refresh_token contre une
+    nouvelle paire de jetons. L'ancien refresh_token ne vaut plus rien.
+    """
+    raw = _refresh_token_param(request.get_json(silent=True))
+    if raw is None:
+        return jsonify({"error": "refresh_token manquant ou invalide"}), 400
+
+    try:
+        user, new_refresh_token = rotate_refresh_token(raw)
+    except InvalidRefreshToken as e:
+        return jsonify({"error": "Jeton de renouvellement invalide. Veuillez vous reconnecter.", "code": e.code}), 401
+
+    return jsonify({
+        "access_token": create_user_access_token(user),
+        "refresh_token": new_refresh_token
+    }), 200
+
+
+@bp.route('/logout', methods=['POST'])
+def logout():
+    """Déconnexion de l'appareil : révoque son refresh_token."""
+    raw = _refresh_token_param(request.get_json(silent=True))
+    if raw is None:
+        return jsonify({"error": "refresh_token manquant ou invalide"}), 400
+
+    revoke_refresh_token(raw)
+    return jsonify({"message": "Déconnexion réussie"}), 200
+
+
 @bp.route('/trees', methods=['GET'])
 @jwt_required()
 def list_trees():
@@ -53,7 +133,9 @@ def list_trees():
     limit_param = max(1, min(100, request.args.get('limit', 50, type=int)))
     page_param = max(1, request.args.get('page', 1, type=int))
 
-    query = Tree.query
+    # Une seule requête : colonnes utiles et propriétaire joint, sans charger les objets
+    query = db.session.query(Tree.id, Tree.name, User.username, Tree.is_public, Tree.root_path) \
+        .outerjoin(User, Tree.user_id == User.id)
     
     if is_public_param:
         query = query.filter(Tree.is_public)
@@ -62,7 +144,6 @@ def list_trees():
         
     if search_query:
         search_pattern = f"%{search_query.lower()}%"
-        query = query.join(User, Tree.user_id == User.id, isouter=True)
         query = query.filter(
             db.or_(
                 db.func.lower(Tree.name).like(search_pattern),
@@ -71,50 +152,31 @@ def list_trees():
         )
         
     offset_param = (page_param - 1) * limit_param
-    trees = query.offset(offset_param).limit(limit_param).all()
+    rows = query.offset(offset_param).limit(limit_param).all()
     
-    result = []
-    for t in trees:
-        thumbnail_url = t.root_url or ""
-        if thumbnail_url and not thumbnail_url.startswith('http'):
-            norm_path = posixpath.normpath(urllib.parse.urlparse(thumbnail_url).path).lstrip('/')
-            if norm_path.startswith('pictograms/'):
-                norm_path = norm_path[len('pictograms/'):]
-            thumbnail_url = f"{request.host_url.rstrip('/')}/api/v1/mobile/pictograms/{norm_path}"
-            
-        result.append({
-            'id': t.id,
-            'name': t.name,
-            'owner': t.user.username if t.user else 'System',
-            'is_public': t.is_public,
-            'root_image_url': thumbnail_url
-        })
+    pictograms_url = _pictograms_url(request.host_url)
+    result = [_tree_summary(*row, pictograms_url) for row in rows]
         
     return jsonify(result), 200
 
 
-def _extract_description_from_path(filepath):
-    """
-    Système évolutif pour extraire la description d'une image selon sa banque d'origine,
-    si celle-ci n'est pas répertoriée dans la base de données relationnelle.
-    """
-    import os
-    basename = os.path.basename(filepath)
-    name_without_ext = os.path.splitext(basename)[0]
-    
-    # Stratégie pour la banque Arasaac
-    if "public/arasaac/" in filepath:
-        # Ex: '1234_manger_du_pain.png' -> 'manger du pain'
-        clean_name = re.sub(r'^\d+_', '', name_without_ext)
-        clean_name = clean_name.replace('_', ' ').replace('-', ' ')
-        return clean_name.capitalize()
-        
-    # [Placeholder] Stratégie pour une future banque
-    # elif "public/sclera/" in filepath:
-    #     ...
-        
-    # Stratégie par défaut (nettoyage simple)
-    return name_without_ext.replace('_', ' ').capitalize()
+def _pictograms_url(host_url):
+    return f"{host_url.rstrip('/')}/api/v1/mobile/pictograms/"
+
+
+def _tree_summary(tree_id, name, owner, is_public, root_path, pictograms_url):
+    """Métadonnées d'un arbre pour les listes Android ; root_path est déjà normalisé (Tree.root_path)."""
+    thumbnail_url = root_path or ""
+    if thumbnail_url and not thumbnail_url.startswith('http'):
+        thumbnail_url = pictograms_url + thumbnail_url
+
+    return {
+        'id': tree_id,
+        'name': name,
+        'owner': owner or 'System',
+        'is_public': is_public,
+        'root_image_url': thumbnail_url
+    }
 
 
 def _map_node_to_android_structure(web_node, host_url, current_username):
@@ -157,11 +219,10 @@ def _map_node_to_android_structure(web_node, host_url, current_username):
 @jwt_required()
 def get_tree(tree_id):
     """Renvoie le composite structuré d'un Arbre précis."""
-    current_user_id = int(get_jwt_identity())
-    current_user = db.session.get(User, current_user_id)
-    
+    current_user = _token_user()
     if not current_user:
         return jsonify({'error': 'Utilisateur non trouvé'}), 404
+    current_user_id = current_user.id
 
     tree = db.session.get(Tree, tree_id)
     
@@ -172,105 +233,272 @@ def get_tree(tree_id):
         return jsonify({'error': 'Accès refusé.'}), 403
         
     try:
-        raw_json_data = json.loads(tree.json_data)
-        roots = raw_json_data.get('roots', [])
-        root_node = None
-        if roots:
-            root_node = _map_node_to_android_structure(roots[0], request.host_url, current_user.username)
-            
-        return jsonify({
-            'tree_id': tree.id,
-            'name': tree.name,
-            'root_node': root_node
-        }), 200
+        return jsonify(_tree_document(tree, request.host_url, current_user.username)), 200
     except Exception as e:
         current_app.logger.error(f"Erreur de formatage dans get_tree (ID: {tree_id}): {str(e)}")
         return jsonify({'error': "Une erreur interne est survenue lors du formatage de l'arbre."}), 500
 
 
+@bp.route('/trees/batch', methods=['GET'])
+@jwt_required()
+def get_trees_batch():
+    """
+    Composites de plusieurs arbres en un appel : ?ids=3,8,12.
+
+    Les droits sont vérifiés pour tous les arbres en une seule requête. Les
+    documents sont renvoyés dans l'ordre demandé ; les identifiants absents,
+    refusés ou illisibles vont dans errors, sans faire échouer les autres.
+    """
+    current_user = _token_user()
+    if not current_user:
+        return jsonify({'error': 'Utilisateur non trouvé'}), 404
+
+    ids_param = [_natural_number(part.strip()) for part in request.args.get('ids', '').split(',') if part.strip()]
+    if not ids_param or None in ids_param:
+        return jsonify({'error': 'Paramètre ids invalide'}), 400
+    tree_ids = list(dict.fromkeys(ids_param))
+    if len(tree_ids) > MAX_BATCH_TREES:
+        return jsonify({'error': f'{MAX_BATCH_TREES} arbres au maximum par appel'}), 400
+
+    trees = {tree.id: tree for tree in Tree.query.filter(Tree.id.in_(tree_ids))}
+
+    documents, errors = [], []
+    for tree_id in tree_ids:
+        tree = trees.get(tree_id)
+        if not tree:
+            errors.append({'tree_id': tree_id, 'status': 404, 'error': 'Arbre non trouvé'})
+        elif not tree.is_public and tree.user_id != current_user.id:
+            errors.append({'tree_id': tree_id, 'status': 403, 'error': 'Accès refusé.'})
+        else:
+            try:
+                documents.append(_tree_document(tree, request.host_url, current_user.username))
+            except Exception as e:
+                current_app.logger.error(f"Erreur de formatage dans get_trees_batch (ID: {tree_id}): {str(e)}")
+                errors.append({'tree_id': tree_id, 'status': 500,
+                               'error': "Une erreur interne est survenue lors du formatage de l'arbre."})
+
+    return jsonify({'trees': documents, 'errors': errors}), 200
+
+
+def _tree_document(tree, host_url, current_username):
+    """Composite Android d'un arbre (la racine et ses descendants)."""
+    raw_json_data = json.loads(tree.json_data)
+    roots = raw_json_data.get('roots', [])
+    root_node = None
+    if roots:
+        root_node = _map_node_to_android_structure(roots[0], host_url, current_username)
+
+    return {
+        'tree_id': tree.id,
+        'name': tree.name,
+        'root_node': root_node
+    }
+
+
+@bp.route('/trees/<int:tree_id>/bundle', methods=['GET'])
+@jwt_required()
+def get_tree_bundle(tree_id):
+    """
+    Paquet hors ligne d'un arbre (voir app/bundles.py) : un ZIP avec tree.json,
+    manifest.json et tous les pictogrammes, en une seule requête.
+    L'ETag est l'empreinte du contenu.
+    """
+    current_user = _token_user()
+    if not current_user:
+        return jsonify({'error': 'Utilisateur non trouvé'}), 404
+    current_user_id = current_user.id
+
+    tree = db.session.get(Tree, tree_id)
+
+    if not tree:
+        return jsonify({'error': 'Arbre non trouvé'}), 404
+
+    if not tree.is_public and tree.user_id != current_user_id:
+        return jsonify({'error': 'Accès refusé.'}), 403
+
+    try:
+        document = _tree_document(tree, request.host_url, current_user.username)
+        bundle, fingerprint = tree_bundle(tree.id, document, request.host_url, current_user.username)
+    except Exception as e:
+        current_app.logger.error(f"Erreur de construction du paquet (ID: {tree_id}): {str(e)}")
+        return jsonify({'error': "Une erreur interne est survenue lors de la construction du paquet."}), 500
+
+    response = send_file(bundle, mimetype='application/zip', as_attachment=True,
+                         download_name=f"tree-{tree.id}.zip", etag=fingerprint, max_age=0)
+    # Le contenu dépend de l'utilisateur (images privées filtrées)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@bp.route('/trees/<int:tree_id>', methods=['DELETE'])
+@jwt_required()
+def delete_tree(tree_id):
+    """Supprime un arbre de l'utilisateur ; les autres appareils l'apprennent via /trees/sync."""
+    current_user_id = int(get_jwt_identity())
+    tree = db.session.get(Tree, tree_id)
+
+    if not tree:
+        return jsonify({'error': 'Arbre non trouvé'}), 404
+
+    if tree.user_id != current_user_id:
+        return jsonify({'error': 'Accès refusé.'}), 403
+
+    db.session.delete(tree)
+    db.session.commit()
+    return jsonify({'message': 'Arbre supprimé', 'tree_id': tree_id}), 200
+
+
+@bp.route('/trees/sync', methods=['GET'])
+@jwt_required()
+def sync_trees():
+    """
+    Synchronisation incrémentale des arbres de l'utilisateur.
+
+    ?since=<watermark> (0 ou absent : tout), ?limit=, ?documents=true pour
+    inclure le composite de chaque arbre. Tant que has_more est vrai,
+    rappeler avec since=watermark.
+    """
+    current_user = _token_user()
+    if not current_user:
+        return jsonify({'error': 'Utilisateur non trouvé'}), 404
+    current_user_id = current_user.id
+
+    since = _natural_number(request.args.get('since', '0'))
+    if since is None:
+        return jsonify({'error': 'Paramètre since invalide'}), 400
+    limit_param = max(1, min(MAX_SYNC_LIMIT, request.args.get('limit', SYNC_LIMIT, type=int)))
+    with_documents = request.args.get('documents', 'false').lower() == 'true'
+
+    page = changes_since(current_user_id, since, limit_param)
+
+    pictograms_url = _pictograms_url(request.host_url)
+    trees = []
+    for tree in page.trees:
+        item = _tree_summary(tree.id, tree.name, current_user.username, tree.is_public, tree.root_path, pictograms_url)
+        item.update({
+            'version': tree.sync_version,
+            'created_at': tree.created_at.isoformat() if tree.created_at else None,
+            'updated_at': tree.updated_at.isoformat() if tree.updated_at else None,
+        })
+        if with_documents:
+            try:
+                item['document'] = _tree_document(tree, request.host_url, current_user.username)
+            except Exception as e:
+                current_app.logger.error(f"Erreur de formatage dans sync_trees (ID: {tree.id}): {str(e)}")
+                item['document'] = None
+        trees.append(item)
+
+    return jsonify({
+        'since': since,
+        'watermark': page.watermark,
+        'has_more': page.has_more,
+        'trees': trees,
+        'deleted': [{
+            'id': tombstone.tree_id,
+            'version': tombstone.sync_version,
+            'deleted_at': tombstone.deleted_at.isoformat() if tombstone.deleted_at else None,
+        } for tombstone in page.tombstones],
+    }), 200
+
+
+
+def _image_description(filepath):
+    """Description d'une image : recherche exacte (indexée) sur Image.path."""
+    img = Image.query.filter_by(path=filepath).first()
+
+    real_desc = None
+    if img:
+        real_desc = img.description if img.description and img.description.strip() else img.name
+
+    # Fallback évolutif selon les banques (Arasaac, etc.) si absente ou vide de la DB
+    if not real_desc or not str(real_desc).strip():
+        real_desc = extract_description_from_path(filepath)
+    return real_desc
+
 
 @bp.route('/pictograms/<path:filepath>', methods=['GET'])
 @jwt_required(optional=True)
 def serve_mobile_pictogram(filepath):
-    """Distribution des images."""
+    """
+    Distribution des images. ?size=<n> (une des MOBILE_PICTOGRAM_SIZES) renvoie
+    une déclinaison d'au plus n x n pixels au lieu de l'original.
+    """
     from flask import abort
     filepath = posixpath.normpath(filepath)
     if filepath.startswith('..') or posixpath.isabs(filepath):
         return abort(400)
 
+    size = request.args.get('size')
+    if size is not None:
+        size = _natural_number(size)
+        if size not in current_app.config['MOBILE_PICTOGRAM_SIZES']:
+            return jsonify({'error': 'Paramètre size invalide',
+                            'sizes': current_app.config['MOBILE_PICTOGRAM_SIZES']}), 400
+
     pictograms_path = Path(current_app.config['PICTOGRAMS_PATH'])
     
     response = None
     
     if filepath.startswith('public/'):
-        response = send_from_directory(pictograms_path, filepath)
+        response = _send_pictogram(pictograms_path, filepath, size)
     else:
-        current_user_id = get_jwt_identity()
-        if not current_user_id:
+        if not get_jwt_identity():
             return jsonify({'error': 'Non autorisé. Token manquant ou invalide.'}), 401
-            
-        current_user = db.session.get(User, int(current_user_id))
-        
+
+        # Autorisation depuis le jeton seul : une requête par image d'un arbre
+        current_user = _token_user()
+
         if not current_user:
             return jsonify({"error": "Utilisateur introuvable"}), 404
         
         if filepath.startswith(f"{current_user.username}/"):
-            response = send_from_directory(pictograms_path, filepath)
+            response = _send_pictogram(pictograms_path, filepath, size)
         else:
             return send_from_directory(current_app.static_folder, 'images/prohibit-bold.png'), 403
 
     if response:
-        # Récupération de la description ou du nom depuis la base de données
-        img = Image.query.filter(Image.path.endswith(filepath)).first()
-        
-        real_desc = None
-        if img:
-            real_desc = img.description if img.description and img.description.strip() else img.name
-            
-        # Fallback évolutif selon les banques (Arasaac, etc.) si absente ou vide de la DB
-        if not real_desc or not str(real_desc).strip():
-            real_desc = _extract_description_from_path(filepath)
-            
+        real_desc = description_cache.get_or_set(filepath, lambda: _image_description(filepath))
         if real_desc:
             response.headers['X-Image-Description'] = urllib.parse.quote(str(real_desc).encode('utf-8'))
         return response
 
 
+def _send_pictogram(pictograms_path, filepath, size):
+    """L'original, ou sa déclinaison size x size ; l'original si elle ne peut être produite."""
+    if size:
+        source = pictograms_path / filepath
+        if source.is_file():
+            try:
+                return send_file(pictogram_variant(source, filepath, size), mimetype='image/png')
+            except Exception as e:
+                current_app.logger.warning(f"Déclinaison {size}px impossible pour {filepath}: {str(e)}")
+    return send_from_directory(pictograms_path, filepath)
+
+
 @bp.route('/pictograms/search', methods=['GET'])
 @jwt_required()
 def search_pictograms():
     """Recherche des pictogrammes (Public + Perso) pour l'application mobile."""
-    from app.models import Image
-    from sqlalchemy import or_
-    
-    current_user_id = int(get_jwt_identity())
-    current_user = db.session.get(User, current_user_id)
+    current_user = _token_user()
     if not current_user:
         return jsonify({'error': 'User not found'}), 404
+    current_user_id = current_user.id
 
     q = request.args.get('q', '').strip()
     if len(q) < 1:
         return jsonify([])
         
-    conditions = [
-        Image.user_id.is_(None),
-        Image.is_public.is_(True),
-        Image.user_id == current_user_id
-    ]
-        
-    images = Image.query.filter(or_(*conditions)).filter(Image.name.ilike(f'%{q}%')).limit(100).all()
-    
     results = []
-    for img in images:
-        raw_url = img.path
+    for img in search(q, current_user_id):
+        raw_url = img['path']
         # Nettoyage et formatage URL Mobile
         norm_path = re.sub(r'^/+', '', raw_url)
         norm_path = re.sub(r'^(pictograms/|images/)', '', norm_path)
         full_url = f"{request.host_url.rstrip('/')}/api/v1/mobile/pictograms/{norm_path}"
         
         results.append({
-            'id': img.id,
-            'name': img.name,
+            'id': img['id'],
+            'name': img['name'],
             'image_url': full_url
         })
         
@@ -0,0 +1,508 @@
+"""
+Recherche de pictogrammes.
+
+Sous SQLite, un index plein texte FTS5 (table virtuelle `image_fts`) couvre la
+clé de recherche (nom replié, sans extension) et la description des images.
+C'est un index à contenu externe : il ne stocke que les jetons, les lignes
+restent dans `image`. Des triggers le tiennent à jour à chaque
+INSERT/UPDATE/DELETE, y compris pour les écritures en masse de l'import public
+qui ne passent pas par l'ORM.
+
+Sans FTS5 (autre base, SQLite compilé sans), on retombe sur la clé de
+recherche, indexée pour les préfixes, et un ILIKE sur la description.
+
+Les images publiques (banque publique et images partagées, la quasi-totalité
+des lignes) sont en plus chargées dans un index en mémoire, par processus,
+reconstruit quand le compteur PUBLIC_LIBRARY_COUNTER avance ; en attendant, les
+résultats qui en sortent sont revérifiés (une requête par page) pour ne pas
+proposer une image devenue privée ou supprimée. Les champs de recherche de
+l'interface interrogent le serveur à chaque frappe ; seules les images privées
+de l'utilisateur et cette vérification passent alors par la base.
+
+Classement (search_page) : correspondance exacte de la clé, puis préfixe, puis
+sous-chaîne, puis mots trouvés dans la description ; à rang égal, les images
+les plus utilisées (use_count) d'abord, puis l'ordre alphabétique. Les pages
+suivantes se demandent avec un curseur : la clé de tri du dernier résultat.
+"""
+import base64
+import binascii
+import json
+import threading
+import time
+import weakref
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from itertools import groupby
+from flask import current_app
+from sqlalchemy import DDL, case, event, or_, select, text, tuple_, update
+from sqlalchemy.sql import column, literal_column, table
+from app import db
+from sqlalchemy.orm import Session
+from app.models import Image, PictogramList, SyncCounter, Tree
+from app.sync import reserve_versions
+from app.utils import SEARCH_WORD_REGEX, fold_text, get_image_ids_from_tree, normalize_search_key
+
+FTS_TABLE = 'image_fts'
+# Poids bm25 des colonnes : un mot du nom compte bien plus qu'un mot de la description
+KEY_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+SEARCH_LIMIT = 100
+# Taille de page par défaut de /api/search_local_images
+SEARCH_PAGE_SIZE = 50
+# Compteur (table sync_counter) incrémenté à chaque écriture de la banque publique
+PUBLIC_LIBRARY_COUNTER = 'public_images'
+# Préfixes précalculés par l'index en mémoire : tous ceux d'au plus SHORT_PREFIX
+# lettres, et les plus longs qui apparaissent au moins FREQUENT_PREFIX fois
+SHORT_PREFIX = 2
+FREQUENT_PREFIX = 500
+
+# Rangs de pertinence
+EXACT, PREFIX, SUBSTRING, DESCRIPTION = range(4)
+
+# Une page de résultats : to_dict() des images, curseur de la suivante (None à la fin)
+SearchPage = namedtuple('SearchPage', 'items next_cursor')
+
+FTS_DDL = [
+    # unicode61 coupe sur la ponctuation ('_', '-', '.') et ignore les accents ;
+    # les index de préfixes accélèrent les requêtes tapées au clavier
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        search_key, description,
+        content='image', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS image_fts_insert AFTER INSERT ON image BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, search_key, description) VALUES (new.id, new.search_key, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS image_fts_delete AFTER DELETE ON image BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_key, description) VALUES ('delete', old.id, old.search_key, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS image_fts_update AFTER UPDATE OF search_key, description ON image BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_key, description) VALUES ('delete', old.id, old.search_key, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, search_key, description) VALUES (new.id, new.search_key, new.description);
+    END""",
+]
+FTS_DROP = [
+    "DROP TRIGGER IF EXISTS image_fts_insert",
+    "DROP TRIGGER IF EXISTS image_fts_delete",
+    "DROP TRIGGER IF EXISTS image_fts_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# db.create_all() / drop_all() (tests, nouvelles installations) créent et
+# suppriment l'index avec la table ; en production, c'est la migration.
+for _statement in FTS_DDL:
+    event.listen(Image.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in FTS_DROP:
+    event.listen(Image.__table__, 'before_drop', DDL(_statement).execute_if(dialect='sqlite'))
+
+_fts = table(FTS_TABLE, column('rowid'))
+_fts_available = weakref.WeakKeyDictionary()
+
+
+def fts_available():
+    """Vrai si l'index FTS5 existe dans la base courante (résultat mis en cache par moteur)."""
+    engine = db.engine
+    if engine not in _fts_available:
+        available = False
+        if engine.dialect.name == 'sqlite':
+            available = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE},
+            ).first() is not None
+        _fts_available[engine] = available
+    return _fts_available[engine]
+
+
+def words(value):
+    """Mots repliés d'un texte ; '_', '-' et '.' sont des séparateurs."""
+    return SEARCH_WORD_REGEX.findall(fold_text(value))
+
+
+def query_words(q):
+    """Mots d'une saisie, repliés comme les clés de recherche (extension comprise)."""
+    return normalize_search_key(q).split()
+
+
+def key_prefix_condition(key):
+    """Clé de recherche commençant par key : une plage, servie par ix_image_search_key."""
+    return (Image.search_key >= key) & (Image.search_key < key + '\U0010ffff')
+
+
+def match_expression(q):
+    """
+    Requête FTS5 à partir de la saisie : chaque mot devient un préfixe
+    ("pom"* trouve "pomme"), tous les mots doivent être présents.
+    Retourne None si la saisie ne contient aucun mot.
+    """
+    tokens = query_words(q)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def visibility_conditions(user_id=None):
+    """Images visibles : banque publique, images partagées et, si connecté, les siennes."""
+    conditions = [Image.user_id.is_(None), Image.is_public.is_(True)]
+    if user_id is not None:
+        conditions.append(Image.user_id == user_id)
+    return or_(*conditions)
+
+
+def _word_match_condition(q):
+    """Tous les mots de q trouvés (en préfixe) dans la clé ou la description."""
+    if fts_available():
+        matching = select(_fts.c.rowid).where(literal_column(FTS_TABLE).op('MATCH')(match_expression(q)))
+        return Image.id.in_(matching)
+    key = normalize_search_key(q)
+    # Début de la clé (indexé), début d'un autre mot de la clé, ou la description
+    return or_(key_prefix_condition(key), Image.search_key.like(f'% {key}%'), Image.description.ilike(f'%{q}%'))
+
+
+def search_images(q, user_id=None, limit=SEARCH_LIMIT):
+    """
+    Images visibles par user_id dont le nom ou la description correspond à q,
+    les plus pertinentes d'abord (bm25), directement dans l'index FTS5.
+    """
+    if not query_words(q):
+        return []
+    query = Image.query.filter(visibility_conditions(user_id))
+
+    if not fts_available():
+        return query.filter(_word_match_condition(q)).order_by(Image.search_key, Image.id).limit(limit).all()
+
+    rank = db.func.bm25(literal_column(FTS_TABLE), KEY_WEIGHT, DESCRIPTION_WEIGHT)
+    return query.join(_fts, _fts.c.rowid == Image.id) \
+        .filter(literal_column(FTS_TABLE).op('MATCH')(match_expression(q))) \
+        .order_by(rank, Image.id).limit(limit).all()
+
+
+def encode_cursor(sort_key):
+    return base64.urlsafe_b64encode(json.dumps(list(sort_key)).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Clé de tri (rang, -use_count, clé, id) d'un curseur ; ValueError s'il est invalide."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('invalid cursor')
+    if (not isinstance(data, list) or len(data) != 4 or not isinstance(data[2], str)
+            or not all(isinstance(value, int) and not isinstance(value, bool) for value in (data[0], data[1], data[3]))):
+        raise ValueError('invalid cursor')
+    return tuple(data)
+
+
+def _has_words(tokens, key_words, description_words):
+    """Chaque mot de requête commence un mot de la clé ou de la description."""
+    return all(any(word.startswith(token) for word in key_words) or
+               any(word.startswith(token) for word in description_words)
+               for token in tokens)
+
+
+class AutocompleteIndex:
+    """
+    Index en mémoire des images publiques. Les images sont rangées dans l'ordre
+    de départage (popularité, puis clé) : pour chaque rang de pertinence, on
+    parcourt les positions dans l'ordre et on s'arrête dès que la page est
+    pleine. Immuable : une nouvelle version remplace l'ancienne d'un bloc.
+
+    - exact : dictionnaire clé -> positions ;
+    - préfixe : clés triées, plage trouvée par bisect ;
+    - sous-chaîne : parcours des clés, interrompu quand la page est pleine ;
+    - description : tableau trié (mot, position) des mots des clés et des
+      descriptions, interrogé par préfixe. Les préfixes qui touchent une
+      grande part de la banque sont précalculés.
+    """
+
+    def __init__(self, entries, version=None):
+        """entries : triplets (clé de recherche, use_count, to_dict de l'image)."""
+        self.version = version
+        ordered = sorted(((-(use_count or 0), key or '', item['id']), item) for key, use_count, item in entries)
+        self.items = [item for _, item in ordered]
+        self._sort_keys = [sort_key for sort_key, _ in ordered]
+        self._keys = [key for _, key, _ in self._sort_keys]
+
+        self._by_key = {}
+        for position, key in enumerate(self._keys):
+            self._by_key.setdefault(key, []).append(position)
+        # Les clés ne contiennent pas de retour à la ligne
+        self._joined_keys = '\n'.join(self._keys)
+        self._key_offsets = []
+        offset = 0
+        for key in self._keys:
+            self._key_offsets.append(offset)
+            offset += len(key) + 1
+        by_key = sorted((key, position) for position, key in enumerate(self._keys))
+        self._sorted_keys = [key for key, _ in by_key]
+        self._sorted_key_positions = [position for _, position in by_key]
+
+        self._words = []
+        postings = []
+        for position, item in enumerate(self.items):
+            key_words = self._keys[position].split()
+            description_words = words(item['description'])
+            self._words.append((key_words, description_words))
+            postings.extend((word, position) for word in set(key_words) | set(description_words))
+        postings.sort()
+        self._tokens = [word for word, _ in postings]
+        self._token_positions = [position for _, position in postings]
+        self._precomputed = self._precompute(postings)
+
+    @staticmethod
+    def _precompute(postings):
+        """
+        Positions triées des images pour les préfixes courts et les préfixes
+        fréquents : ce sont les plages les plus longues à parcourir. postings
+        est trié par mot, donc les mots de même préfixe sont contigus.
+        """
+        precomputed = {}
+        length = 1
+        while True:
+            found = False
+            for prefix, group in groupby((posting for posting in postings if len(posting[0]) >= length),
+                                         key=lambda posting: posting[0][:length]):
+                positions = {position for _, position in group}
+                if length > SHORT_PREFIX and len(positions) < FREQUENT_PREFIX:
+                    continue
+                precomputed[prefix] = sorted(positions)
+                found = True
+            # Un préfixe plus long a moins d'occurrences : rien de plus à précalculer
+            if not found and length > SHORT_PREFIX:
+                return precomputed
+            length += 1
+
+    @classmethod
+    def build(cls, version=None):
+        images = Image.query.filter(Image.user_id.is_(None) | Image.is_public.is_(True)).all()
+        return cls([(image.search_key, image.use_count, image.to_dict()) for image in images], version)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _word_positions(self, prefix):
+        """Positions, triées, des images ayant un mot (clé ou description) qui commence par prefix."""
+        if len(prefix) <= SHORT_PREFIX or prefix in self._precomputed:
+            return self._precomputed.get(prefix, [])
+        tokens = self._tokens
+        positions = set()
+        index = bisect_left(tokens, prefix)
+        while index < len(tokens) and tokens[index].startswith(prefix):
+            positions.add(self._token_positions[index])
+            index += 1
+        return sorted(positions)
+
+    def _exact(self, key, tokens, start):
+        return [position for position in self._by_key.get(key, ()) if position >= start]
+
+    def _prefix(self, key, tokens, start):
+        keys = self._sorted_keys
+        positions = []
+        index = bisect_left(keys, key)
+        while index < len(keys) and keys[index].startswith(key):
+            position = self._sorted_key_positions[index]
+            if keys[index] != key and position >= start:
+                positions.append(position)
+            index += 1
+        return sorted(positions)
+
+    def _substring(self, key, tokens, start):
+        # str.find sur toutes les clés à la suite plutôt qu'un test par image
+        keys, offsets = self._joined_keys, self._key_offsets
+        index = keys.find(key, offsets[start]) if start < len(offsets) else -1
+        while index != -1:
+            position = bisect_right(offsets, index) - 1
+            if not self._keys[position].startswith(key):
+                yield position
+            if position + 1 == len(offsets):
+                return
+            index = keys.find(key, offsets[position + 1])
+
+    def _description(self, key, tokens, start):
+        positions = self._word_positions(max(tokens, key=len))
+        for position in positions[bisect_left(positions, start):]:
+            if key not in self._keys[position] and _has_words(tokens, *self._words[position]):
+                yield position
+
+    def search(self, key, after=None, limit=SEARCH_LIMIT):
+        """
+        Jusqu'à limit + 1 résultats pour une clé de recherche, en
+        [(clé de tri, to_dict)], à partir de la clé de tri after exclue.
+        """
+        tokens = key.split()
+        if not tokens:
+            return []
+        hits = []
+        tiers = (self._exact, self._prefix, self._substring, self._description)
+        for rank, positions in enumerate(tiers):
+            start = 0
+            if after is not None:
+                if rank < after[0]:
+                    continue
+                if rank == after[0]:
+                    start = bisect_right(self._sort_keys, tuple(after[1:]))
+            for position in positions(key, tokens, start):
+                hits.append(((rank, *self._sort_keys[position]), self.items[position]))
+                if len(hits) > limit:
+                    return hits
+        return hits
+
+
+def touch_public_library(session):
+    """
+    Signale une écriture de la banque publique : les index en mémoire de tous
+    les processus seront reconstruits. À appeler après les écritures en masse
+    (session.execute(insert/update/delete(Image))), que le listener ne voit pas.
+    """
+    reserve_versions(session, 1, PUBLIC_LIBRARY_COUNTER)
+
+
+def _was_public(image):
+    """Vrai si l'image est publique, ou l'était avant les changements en attente."""
+    state = db.inspect(image)
+    user_ids = list(state.attrs.user_id.history.unchanged or ()) + list(state.attrs.user_id.history.deleted or ())
+    shared = list(state.attrs.is_public.history.unchanged or ()) + list(state.attrs.is_public.history.deleted or ())
+    return image.user_id is None or image.is_public or None in user_ids or True in shared
+
+
+@event.listens_for(Session, 'before_flush')
+def _watch_public_library(session, flush_context, instances):
+    images = [obj for obj in session.new if isinstance(obj, Image)]
+    images += [obj for obj in session.deleted if isinstance(obj, Image)]
+    images += [obj for obj in session.dirty
+               if isinstance(obj, Image) and session.is_modified(obj, include_collections=False)]
+    if any(_was_public(image) for image in images):
+        touch_public_library(session)
+
+
+def public_library_version():
+    """Compteur des écritures de la banque publique (ajout, suppression, partage, renommage, description, popularité)."""
+    return db.session.query(SyncCounter.value).filter_by(name=PUBLIC_LIBRARY_COUNTER).scalar() or 0
+
+
+def public_index():
+    """
+    Index des images publiques de l'application courante, reconstruit quand
+    public_library_version() change (vérifié au plus toutes les
+    SEARCH_INDEX_CHECK_INTERVAL secondes).
+    """
+    app = current_app._get_current_object()
+    state = app.extensions['search_index']
+    now = time.monotonic()
+    if state['index'] is not None and now - state['checked'] < app.config['SEARCH_INDEX_CHECK_INTERVAL']:
+        return state['index']
+    with state['lock']:
+        version = public_library_version()
+        if state['index'] is None or state['index'].version != version:
+            state['index'] = AutocompleteIndex.build(version)
+        state['checked'] = now
+        return state['index']
+
+
+def _private_hits(q, key, user_id, after, limit):
+    """Images privées de user_id, même classement que l'index en mémoire, en une requête."""
+    rank = case(
+        (Image.search_key == key, EXACT),
+        (Image.search_key.startswith(key, autoescape=True), PREFIX),
+        (Image.search_key.contains(key, autoescape=True), SUBSTRING),
+        else_=DESCRIPTION,
+    )
+    sort_key = (rank, -Image.use_count, Image.search_key, Image.id)
+    query = db.session.query(Image, rank).filter(
+        Image.user_id == user_id,
+        Image.is_public.is_(False),
+        or_(Image.search_key.contains(key, autoescape=True), _word_match_condition(q)),
+    )
+    if after is not None:
+        query = query.filter(tuple_(*sort_key) > tuple_(*after))
+    rows = query.order_by(*sort_key).limit(limit + 1).all()
+    return [((image_rank, -image.use_count, image.search_key, image.id), image.to_dict()) for image, image_rank in rows]
+
+
+def search_page(q, user_id=None, limit=SEARCH_PAGE_SIZE, cursor=None):
+    """
+    Une page de résultats (web et mobile) : images publiques par l'index en
+    mémoire, images privées de user_id par la base. cursor vient de la page
+    précédente ; ValueError s'il est invalide.
+    """
+    key = normalize_search_key(q)
+    if not key:
+        return SearchPage([], None)
+    after = decode_cursor(cursor) if cursor else None
+    # (clé de tri, to_dict, vient de l'index en mémoire)
+    hits = [(sort_key, item, True) for sort_key, item in public_index().search(key, after, limit)]
+    if user_id is not None:
+        hits.extend((sort_key, item, False) for sort_key, item in _private_hits(q, key, user_id, after, limit))
+        hits.sort(key=lambda hit: hit[0])
+    page = hits[:limit]
+    next_cursor = encode_cursor(page[-1][0]) if len(hits) > limit else None
+    # Le curseur suit la page complète : une image écartée ne décale pas la suivante
+    hidden = _no_longer_public([item['id'] for _, item, indexed in page if indexed])
+    return SearchPage([item for _, item, indexed in page if not (indexed and item['id'] in hidden)], next_cursor)
+
+
+def _no_longer_public(image_ids):
+    """
+    Images de l'index en mémoire devenues privées ou supprimées depuis sa
+    construction : l'index peut avoir jusqu'à SEARCH_INDEX_CHECK_INTERVAL
+    secondes de retard sur la base.
+    """
+    if not image_ids:
+        return set()
+    still_public = db.session.scalars(
+        select(Image.id).where(Image.id.in_(image_ids), Image.user_id.is_(None) | Image.is_public.is_(True))
+    )
+    return set(image_ids) - set(still_public)
+
+
+def search(q, user_id=None, limit=SEARCH_LIMIT):
+    """Les limit premiers résultats de search_page."""
+    return search_page(q, user_id, limit).items
+
+
+def _tree_image_ids(tree):
+    try:
+        roots = json.loads(tree.json_data or '{}').get('roots') or []
+    except (ValueError, AttributeError):
+        return set()
+    image_ids = get_image_ids_from_tree(roots)
+    if tree.root_id not in (None, -1):
+        image_ids.add(tree.root_id)
+    return image_ids
+
+
+def _list_image_ids(plist):
+    try:
+        payload = json.loads(plist.payload or '[]')
+    except ValueError:
+        return set()
+    if not isinstance(payload, list):
+        return set()
+    return {item['image_id'] for item in payload
+            if isinstance(item, dict) and item.get('image_id') not in (None, -1)}
+
+
+def refresh_popularity():
+    """
+    Recompte use_count : le nombre d'arbres et de listes enregistrés qui
+    utilisent chaque image. Retourne le nombre d'images dont le compte a changé.
+    """
+    counts = {}
+    for tree in Tree.query.yield_per(500):
+        for image_id in _tree_image_ids(tree):
+            counts[image_id] = counts.get(image_id, 0) + 1
+    for plist in PictogramList.query.yield_per(500):
+        for image_id in _list_image_ids(plist):
+            counts[image_id] = counts.get(image_id, 0) + 1
+
+    current = dict(db.session.query(Image.id, Image.use_count))
+    changes = [{'id': image_id, 'use_count': counts.get(image_id, 0)}
+               for image_id, use_count in current.items() if counts.get(image_id, 0) != use_count]
+    if changes:
+        db.session.execute(update(Image), changes)
+        touch_public_library(db.session)
+        db.session.commit()
+    return len(changes)
+
+
+def init_app(app):
+    app.extensions['search_index'] = {'index': None, 'checked': 0.0, 'lock': threading.Lock()}
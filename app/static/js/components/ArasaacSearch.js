@@ -41,7 +41,9 @@ export default class ArasaacSearch {
         try {
             // Use the global locale variable injected in base.html, defaulting to 'en'
             const locale = window.CURRENT_LOCALE || 'en';
-            const response = await fetch(`https://api.arasaac.org/api/pictograms/${locale}/search/${encodeURIComponent(query)}`);
+            // Searches and images go through the server-side caching proxy (app/arasaac.py)
+            const response = await fetch(`/api/arasaac/pictograms/${locale}/search/${encodeURIComponent(query)}`);
+            if (!response.ok) throw new Error(`Arasaac proxy error: ${response.status}`);
             const data = await response.json();
 
             // Clear any active tooltip before destroying the DOM nodes
@@ -66,7 +68,9 @@ export default class ArasaacSearch {
             const results = data.slice(0, 50);
 
             results.forEach(picto => {
-                const imgUrl = `https://static.arasaac.org/pictograms/${picto._id}/${picto._id}_300.png`;
+                const imgUrl = `/api/arasaac/pictograms/${picto._id}.png`;
+                // Trees and lists keep referencing the canonical Arasaac URL
+                const arasaacUrl = `https://static.arasaac.org/pictograms/${picto._id}/${picto._id}_300.png`;
 
                 const itemDiv = document.createElement('div');
                 itemDiv.className = 'arasaac-item';
@@ -121,7 +125,6 @@ export default class ArasaacSearch {
                 // Setup Hover Download Button
                 const dlBtn = document.createElement('a');
                 dlBtn.href = imgUrl;
-                dlBtn.target = '_blank'; // Arasaac is cross-origin, standard download attribute fails CORS without header
                 dlBtn.download = picto.keywords[0].keyword + '.png';
                 dlBtn.innerHTML = '&#128229;'; // Inbox tray emoji
                 dlBtn.style.position = 'absolute';
@@ -155,7 +158,7 @@ export default class ArasaacSearch {
                         data: {
                             id: picto._id, // Use Arasaac ID
                             name: picto.keywords[0].keyword,
-                            path: imgUrl, // Full URL
+                            path: arasaacUrl, // Full URL
                             description: picto.keywords[0].keyword
                         }
                     };
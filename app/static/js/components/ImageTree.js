@@ -1,5 +1,6 @@
 import ImageTreeFolderNode from './ImageTreeFolderNode.js';
 import ImageTreeImageNode from './ImageTreeImageNode.js';
+import fetchThumbnailBundle from './ThumbnailBundle.js';
 
 export default class ImageTree {
     constructor(containerId) {
@@ -72,8 +73,18 @@ export default class ImageTree {
         });
     }
 
+    releaseThumbnailUrls() {
+        if (this.thumbnailUrls) {
+            this.thumbnailUrls.forEach(url => URL.revokeObjectURL(url));
+        }
+        this.thumbnailUrls = new Map();
+    }
+
     async filter(term = '') {
         term = typeof term === 'string' ? term.trim() : '';
+        // Responses to an earlier term (or page) are ignored once a new search starts
+        const searchId = this.searchId = (this.searchId || 0) + 1;
+        this.stopSearchObserver();
 
         let searchResultsContainer = document.getElementById('image-tree-search-results');
         if (!searchResultsContainer) {
@@ -97,85 +108,152 @@ export default class ImageTree {
         searchResultsContainer.style.display = '';
         searchResultsContainer.innerHTML = '<div class="spinner-border spinner-border-sm m-3"></div>';
 
+        this.releaseThumbnailUrls();
+        this.searchGroups = new Map();
+        await this.loadSearchPage(term, null, searchId, searchResultsContainer);
+    }
+
+    stopSearchObserver() {
+        if (this.searchObserver) {
+            this.searchObserver.disconnect();
+            this.searchObserver = null;
+        }
+    }
+
+    async loadSearchPage(term, cursor, searchId, searchResultsContainer) {
+        let page;
         try {
-            const response = await fetch('/api/search_local_images?q=' + encodeURIComponent(term));
+            const params = new URLSearchParams({ q: term });
+            if (cursor) params.set('cursor', cursor);
+            const response = await fetch('/api/search_local_images?' + params);
             if (!response.ok) throw new Error("Search failed");
-            
-            const results = await response.json();
-            searchResultsContainer.innerHTML = '';
+            page = await response.json();
+        } catch (e) {
+            if (searchId !== this.searchId) return;
+            console.error(e);
+            if (!cursor) {
+                searchResultsContainer.innerHTML = '<p class="text-danger m-3">Error performing search.</p>';
+            }
+            return;
+        }
+        if (searchId !== this.searchId) return;
 
+        const results = page.results;
+        if (!cursor) {
+            searchResultsContainer.innerHTML = '';
             if (results.length === 0) {
                 searchResultsContainer.innerHTML = '<p class="text-muted m-3">No results found.</p>';
                 return;
             }
+        }
 
-            const grouped = {};
-            results.forEach(childData => {
-                if (childData.type === 'image') {
-                    const pathParts = childData.data.path.split('/');
-                    pathParts.pop(); // remove filename
-                    let dirPath = pathParts.join(' / ');
-                    if (!dirPath) dirPath = "Root";
-
-                    if (!grouped[dirPath]) {
-                        grouped[dirPath] = [];
-                    }
-                    grouped[dirPath].push(childData);
-                }
-            });
+        // All thumbnails of the page in one round trip
+        let thumbnailUrls = new Map();
+        try {
+            thumbnailUrls = await fetchThumbnailBundle(results.map(childData => childData.data.id));
+        } catch (bundleError) {
+            console.error(bundleError);
+        }
+        if (searchId !== this.searchId) {
+            thumbnailUrls.forEach(url => URL.revokeObjectURL(url));
+            return;
+        }
+        thumbnailUrls.forEach((url, id) => this.thumbnailUrls.set(id, url));
 
-            for (const [dirPath, items] of Object.entries(grouped)) {
-                // Create a folder header block
-                const folderDiv = document.createElement('div');
-                folderDiv.classList.add('image-tree-node', 'folder', 'mb-2');
-                folderDiv.style.marginLeft = '0';
-                
-                const contentElement = document.createElement('div');
-                contentElement.classList.add('node-content');
-                contentElement.style.padding = '5px';
-                contentElement.style.backgroundColor = '#f8f9fa';
-                contentElement.style.border = '1px solid #ddd';
-                contentElement.style.borderRadius = '4px';
-                contentElement.style.cursor = 'pointer';
-
-                const icon = document.createElement('img');
-                icon.src = '/static/images/folder-open-bold.png';
-                icon.style.width = '20px';
-                icon.style.marginRight = '8px';
-                
-                const nameSpan = document.createElement('span');
-                nameSpan.textContent = dirPath;
-                nameSpan.style.fontWeight = 'bold';
-                nameSpan.style.color = '#555';
-
-                contentElement.appendChild(icon);
-                contentElement.appendChild(nameSpan);
-                folderDiv.appendChild(contentElement);
-
-                const childrenContainer = document.createElement('div');
-                childrenContainer.classList.add('children');
-                childrenContainer.style.marginLeft = '15px';
-                childrenContainer.style.display = 'block';
-
-                let isExpanded = true;
-                contentElement.addEventListener('click', () => {
-                    isExpanded = !isExpanded;
-                    childrenContainer.style.display = isExpanded ? 'block' : 'none';
-                    icon.src = isExpanded ? '/static/images/folder-open-bold.png' : '/static/images/folder-bold.png';
-                });
-
-                items.forEach(childData => {
-                    const childNode = new this.nodeTypes.IMAGE(childData.data, this);
-                    childrenContainer.appendChild(childNode.element);
-                    childNode.load(); // Load thumbnail image
-                });
-
-                folderDiv.appendChild(childrenContainer);
-                searchResultsContainer.appendChild(folderDiv);
+        // Results are ranked: folders appear in the order of their best match,
+        // later pages append to the folders already shown
+        results.forEach(childData => {
+            if (childData.type !== 'image') return;
+            const pathParts = childData.data.path.split('/');
+            pathParts.pop(); // remove filename
+            let dirPath = pathParts.join(' / ');
+            if (!dirPath) dirPath = "Root";
+
+            let childrenContainer = this.searchGroups.get(dirPath);
+            if (!childrenContainer) {
+                childrenContainer = this.createSearchGroup(dirPath, searchResultsContainer);
+                this.searchGroups.set(dirPath, childrenContainer);
             }
-        } catch (e) {
-            console.error(e);
-            searchResultsContainer.innerHTML = '<p class="text-danger m-3">Error performing search.</p>';
+            const childNode = new this.nodeTypes.IMAGE(childData.data, this);
+            childrenContainer.appendChild(childNode.element);
+            childNode.load(null, thumbnailUrls.get(childData.data.id)); // Load thumbnail image
+        });
+
+        if (page.has_more) {
+            this.appendLoadMore(term, page.next_cursor, searchId, searchResultsContainer);
+        }
+    }
+
+    createSearchGroup(dirPath, searchResultsContainer) {
+        // Create a folder header block
+        const folderDiv = document.createElement('div');
+        folderDiv.classList.add('image-tree-node', 'folder', 'mb-2');
+        folderDiv.style.marginLeft = '0';
+
+        const contentElement = document.createElement('div');
+        contentElement.classList.add('node-content');
+        contentElement.style.padding = '5px';
+        contentElement.style.backgroundColor = '#f8f9fa';
+        contentElement.style.border = '1px solid #ddd';
+        contentElement.style.borderRadius = '4px';
+        contentElement.style.cursor = 'pointer';
+
+        const icon = document.createElement('img');
+        icon.src = '/static/images/folder-open-bold.png';
+        icon.style.width = '20px';
+        icon.style.marginRight = '8px';
+
+        const nameSpan = document.createElement('span');
+        nameSpan.textContent = dirPath;
+        nameSpan.style.fontWeight = 'bold';
+        nameSpan.style.color = '#555';
+
+        contentElement.appendChild(icon);
+        contentElement.appendChild(nameSpan);
+        folderDiv.appendChild(contentElement);
+
+        const childrenContainer = document.createElement('div');
+        childrenContainer.classList.add('children');
+        childrenContainer.style.marginLeft = '15px';
+        childrenContainer.style.display = 'block';
+
+        let isExpanded = true;
+        contentElement.addEventListener('click', () => {
+            isExpanded = !isExpanded;
+            childrenContainer.style.display = isExpanded ? 'block' : 'none';
+            icon.src = isExpanded ? '/static/images/folder-open-bold.png' : '/static/images/folder-bold.png';
+        });
+
+        folderDiv.appendChild(childrenContainer);
+        searchResultsContainer.appendChild(folderDiv);
+        return childrenContainer;
+    }
+
+    appendLoadMore(term, cursor, searchId, searchResultsContainer) {
+        const button = document.createElement('button');
+        button.type = 'button';
+        button.classList.add('btn', 'btn-sm', 'btn-outline-secondary', 'w-100', 'mt-2');
+        button.textContent = 'Load more';
+
+        let loading = false;
+        const loadMore = async () => {
+            if (loading) return;
+            loading = true;
+            this.stopSearchObserver();
+            button.disabled = true;
+            button.innerHTML = '<span class="spinner-border spinner-border-sm"></span>';
+            await this.loadSearchPage(term, cursor, searchId, searchResultsContainer);
+            button.remove();
+        };
+        button.addEventListener('click', loadMore);
+        searchResultsContainer.appendChild(button);
+
+        // Stream the next page when the button scrolls into view
+        if ('IntersectionObserver' in window) {
+            this.searchObserver = new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) loadMore();
+            }, { root: searchResultsContainer });
+            this.searchObserver.observe(button);
         }
     }
 }
@@ -88,10 +88,11 @@ export default class ImageTreeFolderNode extends ImageTreeNode {
                 }
             }
 
-            // Lazy load images
+            // Lazy load images, from the folder sprite sheet when available
+            const sprite = await this.loadSprite();
             this.children.forEach(child => {
                 if (child instanceof this.nodeTypes.IMAGE) {
-                    child.load();
+                    child.load(sprite);
                 }
             });
         } else {
@@ -100,6 +101,23 @@ export default class ImageTreeFolderNode extends ImageTreeNode {
         }
     }
 
+    async loadSprite() {
+        if (this.sprite !== undefined) return this.sprite;
+        const hasImages = this.children.some(child => child instanceof this.nodeTypes.IMAGE);
+        if (!hasImages) return null;
+
+        this.sprite = null;
+        try {
+            const response = await fetch('/api/folder_sprite/' + this.data.id);
+            if (response.ok) {
+                this.sprite = await response.json();
+            }
+        } catch (e) {
+            console.error("Failed to load folder sprite:", e);
+        }
+        return this.sprite;
+    }
+
     buildChildrenFromData() {
         if (this.children.length > 0) return; // Already built
 
@@ -1,5 +1,7 @@
 import ImageTreeNode from './ImageTreeNode.js';
 
+const TRANSPARENT_PIXEL = 'data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7';
+
 export default class ImageTreeImageNode extends ImageTreeNode {
     constructor(data, imageTree) {
         super(data, imageTree);
@@ -86,14 +88,27 @@ export default class ImageTreeImageNode extends ImageTreeNode {
         return nodeElement;
     }
 
-    load() {
+    load(sprite = null, thumbnailUrl = null) {
         if (this.isLoaded) return;
 
         const imgElement = this.element.querySelector('img');
-
-        const thumbPath = this.data.path;
-
-        imgElement.src = `/pictogramsmin/${thumbPath}`;
+        const cell = sprite && sprite.items ? sprite.items[this.data.id] : null;
+
+        if (cell) {
+            // Render from the folder sprite sheet: one request for the whole folder
+            const size = imgElement.getBoundingClientRect().width || 20;
+            const scale = size / sprite.tile;
+            imgElement.src = TRANSPARENT_PIXEL;
+            imgElement.style.backgroundImage = `url(${sprite.url})`;
+            imgElement.style.backgroundRepeat = 'no-repeat';
+            imgElement.style.backgroundSize = `${sprite.width * scale}px ${sprite.height * scale}px`;
+            imgElement.style.backgroundPosition = `-${cell.x * scale}px -${cell.y * scale}px`;
+        } else if (thumbnailUrl) {
+            imgElement.src = thumbnailUrl;
+        } else {
+            const thumbPath = this.data.path;
+            imgElement.src = `/pictogramsmin/${thumbPath}`;
+        }
         this.isLoaded = true;
     }
 
@@ -0,0 +1,29 @@
+// Fetches many thumbnails in a single request (/api/thumbnails/bundle).
+// The response is a sequence of [id: uint32][length: uint32][PNG bytes], big-endian.
+const MAX_BUNDLE_IDS = 200;
+
+export default async function fetchThumbnailBundle(imageIds) {
+    const urls = new Map();
+    const ids = [...new Set(imageIds.filter(id => Number.isInteger(id) && id > 0))];
+
+    for (let start = 0; start < ids.length; start += MAX_BUNDLE_IDS) {
+        const batch = ids.slice(start, start + MAX_BUNDLE_IDS);
+        const response = await fetch('/api/thumbnails/bundle?ids=' + batch.join(','), {
+            credentials: 'same-origin'
+        });
+        if (!response.ok) throw new Error(`Thumbnail bundle failed: ${response.status}`);
+
+        const buffer = await response.arrayBuffer();
+        const view = new DataView(buffer);
+        let offset = 0;
+        while (offset + 8 <= buffer.byteLength) {
+            const id = view.getUint32(offset);
+            const length = view.getUint32(offset + 4);
+            offset += 8;
+            const blob = new Blob([buffer.slice(offset, offset + length)], { type: 'image/png' });
+            urls.set(id, URL.createObjectURL(blob));
+            offset += length;
+        }
+    }
+    return urls;
+}
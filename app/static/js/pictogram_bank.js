@@ -120,7 +120,9 @@ class PictogramBank {
         document.getElementById('export-image-btn').addEventListener('click', () => this.exportImage());
         document.getElementById('image-upload-file').addEventListener('change', (e) => {
             const fileChosen = document.getElementById('file-chosen');
-            if (e.target.files.length > 0) {
+            if (e.target.files.length > 1) {
+                fileChosen.textContent = `${e.target.files.length} files`;
+            } else if (e.target.files.length > 0) {
                 fileChosen.textContent = e.target.files[0].name;
             } else {
                 fileChosen.textContent = fileChosen.dataset.defaultText;
@@ -254,6 +256,10 @@ class PictogramBank {
             return;
         }
 
+        if (fileInput.files.length > 1) {
+            return this.uploadImagesBatch(fileInput);
+        }
+
         const maxKb = window.MAX_IMAGE_SIZE_KB || 500;
         if (file.size > maxKb * 1024) {
             alert(`The image size cannot exceed ${maxKb} KB.`);
@@ -266,12 +272,8 @@ class PictogramBank {
             return;
         }
 
-        let parentId;
-        if (this.selectedNode && this.selectedNode instanceof FolderNode) {
-            parentId = this.selectedNode.data.id;
-        } else if (this.selectedNode && this.selectedNode instanceof ImageNode) {
-            parentId = this.selectedNode.data.folder_id;
-        } else {
+        const parentId = this.getUploadParentId();
+        if (parentId === null) {
             alert('Please select a parent folder.');
             return;
         }
@@ -310,6 +312,76 @@ class PictogramBank {
         }
     }
 
+    getUploadParentId() {
+        if (this.selectedNode && this.selectedNode instanceof FolderNode) {
+            return this.selectedNode.data.id;
+        } else if (this.selectedNode && this.selectedNode instanceof ImageNode) {
+            return this.selectedNode.data.folder_id;
+        }
+        return null;
+    }
+
+    async uploadImagesBatch(fileInput) {
+        const files = Array.from(fileInput.files);
+        const maxItems = window.MAX_ITEMS_LIMIT || 500;
+        if (this.countItems(this.rootNode) + files.length > maxItems) {
+            alert(`You have reached the maximum limit of ${maxItems} items (folders and images).`);
+            return;
+        }
+
+        const parentId = this.getUploadParentId();
+        if (parentId === null) {
+            alert('Please select a parent folder.');
+            return;
+        }
+
+        // Files rejected on the client are reported with the server-side failures
+        const maxKb = window.MAX_IMAGE_SIZE_KB || 500;
+        const failures = files
+            .filter(file => file.size > maxKb * 1024)
+            .map(file => `${file.name}: the image size cannot exceed ${maxKb} KB.`);
+        const toUpload = files.filter(file => file.size <= maxKb * 1024);
+
+        const batchSize = window.MAX_BATCH_UPLOAD_FILES || 100;
+        const csrfToken = document.querySelector('input[name="csrf_token"]')?.value || '';
+        for (let start = 0; start < toUpload.length; start += batchSize) {
+            const formData = new FormData();
+            formData.append('folder_id', parentId);
+            toUpload.slice(start, start + batchSize).forEach(file => formData.append('files', file));
+
+            try {
+                const response = await fetch('/api/image/upload/batch', {
+                    method: 'POST',
+                    headers: {
+                        'X-CSRFToken': csrfToken
+                    },
+                    body: formData,
+                });
+                const result = await response.json();
+                if (!result.results) {
+                    failures.push(result.message || `Erreur serveur: ${response.status}`);
+                    continue;
+                }
+                result.results.forEach(item => {
+                    if (item.status === 'success') {
+                        this.addNodeToTree(new ImageNode(item.image, this), parentId);
+                    } else {
+                        failures.push(`${item.filename}: ${item.message}`);
+                    }
+                });
+            } catch (e) {
+                console.error('Erreur upload:', e);
+                failures.push('Le téléchargement a échoué. Vérifiez votre connexion.');
+                break;
+            }
+        }
+
+        fileInput.value = '';
+        if (failures.length > 0) {
+            alert(`Some images could not be uploaded:\n${failures.join('\n')}`);
+        }
+    }
+
     async deleteSelected() {
         if (!this.selectedNode) {
             alert('Please select an item to delete.');
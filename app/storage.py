@@ -0,0 +1,232 @@
+"""
+Stockage adressé par contenu des images uploadées.
+
+Chaque fichier est écrit une seule fois sous PICTOGRAMS_PATH/.blobs/<aa>/<sha256><ext>
+et compté par ImageBlob.ref_count. Le chemin habituel de l'image
+(PICTOGRAMS_PATH/<dossier>/<fichier>) est un lien physique vers ce blob, si bien que
+les routes qui servent les fichiers par chemin n'ont pas à connaître les blobs.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+from flask import current_app
+from PIL import Image as PILImage, ImageFile
+from sqlalchemy import update, delete, func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Image, ImageBlob
+from app.normalize import normalize_image
+from app.thumbnails import generate_thumbnail, thumbnail_path
+
+BLOBS_DIRNAME = '.blobs'
+CHUNK_SIZE = 64 * 1024
+
+
+def blobs_folder():
+    return Path(current_app.config['PICTOGRAMS_PATH']) / BLOBS_DIRNAME
+
+
+def blob_path(blob):
+    return blobs_folder() / blob.sha256[:2] / f"{blob.sha256}{blob.extension}"
+
+
+def blob_thumbnail_path(blob):
+    thumbs_folder = Path(current_app.config['PICTOGRAMS_PATH_MIN']) / BLOBS_DIRNAME
+    return thumbs_folder / blob.sha256[:2] / f"{blob.sha256}.png"
+
+
+def link_or_copy(source, target):
+    """Crée target comme lien physique vers source (copie si le système de fichiers refuse)."""
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.unlink(missing_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def acquire_blob(sha256, extension, size):
+    """Ajoute une référence au blob sha256, en le créant si besoin."""
+    result = db.session.execute(
+        update(ImageBlob)
+        .where(ImageBlob.sha256 == sha256)
+        .values(ref_count=ImageBlob.ref_count + 1)
+    )
+    if result.rowcount:
+        return ImageBlob.query.filter_by(sha256=sha256).one()
+
+    blob = ImageBlob(sha256=sha256, extension=extension, size=size, ref_count=1)
+    try:
+        with db.session.begin_nested():
+            db.session.add(blob)
+    except IntegrityError:
+        # Un autre upload vient de créer le même blob
+        return acquire_blob(sha256, extension, size)
+    return blob
+
+
+class UploadRejected(Exception):
+    """Upload refusé pendant la réception ; code : 'too_large' ou 'invalid'."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+# Fichier reçu dans le dossier temporaire, pas encore rattaché à un blob
+ReceivedUpload = namedtuple('ReceivedUpload', 'tmp_path sha256 size format width height')
+
+
+def receive_upload(stream, tmp_folder, max_bytes, allowed_formats):
+    """
+    Reçoit un upload en une seule passe sur le flux : copie vers un fichier
+    temporaire de tmp_folder, calcul du SHA-256 et lecture des dimensions depuis
+    le seul en-tête de l'image. Le flux est abandonné dès que max_bytes est
+    dépassé ou que l'en-tête est invalide.
+    N'utilise pas le contexte applicatif : peut tourner dans un thread.
+    """
+    Path(tmp_folder).mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    parser = ImageFile.Parser()
+    header = None
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(dir=tmp_folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            while chunk := stream.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected('too_large')
+                digest.update(chunk)
+                tmp.write(chunk)
+                if header is None:
+                    try:
+                        parser.feed(chunk)
+                    except Exception:
+                        raise UploadRejected('invalid')
+                    if parser.image is not None:
+                        header = (parser.image.format, *parser.image.size)
+
+        if header is None:
+            # Formats dont l'en-tête n'est lisible qu'une fois le fichier complet
+            try:
+                with PILImage.open(tmp_name) as img:
+                    header = (img.format, *img.size)
+            except Exception:
+                raise UploadRejected('invalid')
+
+        image_format, width, height = header
+        if image_format not in allowed_formats or width * height > PILImage.MAX_IMAGE_PIXELS:
+            raise UploadRejected('invalid')
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return ReceivedUpload(tmp_name, digest.hexdigest(), size, image_format, width, height)
+
+
+def normalize_received(received, tmp_folder, settings):
+    """
+    Version normalisée (voir app.normalize) d'un fichier reçu, sous forme d'un
+    nouveau ReceivedUpload, ou None si l'image est gardée telle quelle.
+    N'utilise pas le contexte applicatif : peut tourner dans un thread.
+    """
+    tmp_name = normalize_image(received.tmp_path, tmp_folder, settings)
+    if tmp_name is None:
+        return None
+    digest = hashlib.sha256()
+    size = 0
+    with open(tmp_name, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+    with PILImage.open(tmp_name) as img:
+        width, height = img.size
+    return ReceivedUpload(tmp_name, digest.hexdigest(), size, settings.image_format, width, height)
+
+
+def discard_received(received):
+    Path(received.tmp_path).unlink(missing_ok=True)
+
+
+def store_received(received, extension):
+    """
+    Rattache un fichier reçu au blob de même contenu (référence +1), en le
+    renommant atomiquement à sa place s'il est nouveau. Un contenu déjà connu
+    n'est pas réécrit. La référence n'est définitive qu'après le commit.
+    """
+    try:
+        blob = acquire_blob(received.sha256, extension.lower(), received.size)
+        target = blob_path(blob)
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(received.tmp_path, target)
+    finally:
+        discard_received(received)
+    return blob
+
+
+def create_image_thumbnail(image):
+    """
+    Crée la miniature d'une image. Pour une image adossée à un blob, la miniature
+    n'est générée qu'une fois par blob puis liée au chemin de miniature de l'image.
+    """
+    target = thumbnail_path(image.path)
+    if image.blob is None:
+        source = Path(current_app.config['PICTOGRAMS_PATH']) / image.path
+        generate_thumbnail(source, target)
+        return
+
+    blob_thumb = blob_thumbnail_path(image.blob)
+    if not blob_thumb.exists():
+        generate_thumbnail(blob_path(image.blob), blob_thumb)
+    link_or_copy(blob_thumb, target)
+
+
+def release_blob(image):
+    """Retire les références de l'image à ses blobs (dans la transaction courante)."""
+    for blob_id in (image.blob_id, image.original_blob_id):
+        if blob_id is not None:
+            db.session.execute(
+                update(ImageBlob)
+                .where(ImageBlob.id == blob_id)
+                .values(ref_count=ImageBlob.ref_count - 1)
+            )
+
+
+def release_user_blobs(user_id):
+    """Retire en une passe les références de toutes les images d'un utilisateur."""
+    for column in (Image.blob_id, Image.original_blob_id):
+        counts = db.session.query(column, func.count(Image.id)) \
+            .filter(Image.user_id == user_id, column.isnot(None)) \
+            .group_by(column).all()
+        for blob_id, count in counts:
+            db.session.execute(
+                update(ImageBlob)
+                .where(ImageBlob.id == blob_id)
+                .values(ref_count=ImageBlob.ref_count - count)
+            )
+
+
+def purge_unreferenced_blobs():
+    """
+    Supprime les blobs qui ne sont plus référencés, fichiers compris.
+    À appeler après le commit des suppressions : la ligne n'est supprimée que si
+    ref_count est toujours nul, un upload concurrent ayant pu la réutiliser.
+    """
+    for blob in ImageBlob.query.filter(ImageBlob.ref_count <= 0).all():
+        result = db.session.execute(
+            delete(ImageBlob)
+            .where(ImageBlob.id == blob.id, ImageBlob.ref_count <= 0)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            try:
+                blob_path(blob).unlink(missing_ok=True)
+                blob_thumbnail_path(blob).unlink(missing_ok=True)
+            except OSError as e:
+                current_app.logger.error(f"Erreur lors de la suppression du blob {blob.sha256}: {e}")
+        db.session.commit()
@@ -0,0 +1,85 @@
+"""
+Synchronisation incrémentale des arbres pour l'application mobile.
+
+Chaque arbre écrit (créé ou modifié) reçoit une version tirée d'un compteur
+global (table sync_counter), incrémenté dans la transaction même de
+l'écriture. L'UPDATE du compteur verrouille la ligne (toute la base sous
+SQLite) jusqu'au commit : les versions deviennent visibles dans l'ordre où
+elles sont attribuées, si bien qu'un appareil qui a vu la version N ne verra
+jamais apparaître plus tard une version inférieure ou égale à N.
+
+Une suppression laisse une TreeTombstone qui porte sa propre version : les
+appareils demandent « tout ce qui a changé depuis N » (changes_since).
+
+Seules les écritures passant par l'ORM sont suivies ; les suppressions en
+masse (Query.delete) ne laissent pas de trace.
+"""
+from collections import namedtuple
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+from app.models import SyncCounter, Tree, TreeTombstone
+
+TREES_COUNTER = 'trees'
+SYNC_LIMIT = 100
+MAX_SYNC_LIMIT = 500
+
+# Une page de changements : arbres écrits et tombes, triés par version
+SyncPage = namedtuple('SyncPage', 'trees tombstones watermark has_more')
+
+
+def reserve_versions(session, count=1, name=TREES_COUNTER):
+    """Réserve count versions consécutives du compteur name ; retourne la première."""
+    connection = session.connection()
+    counter = SyncCounter.__table__
+    result = connection.execute(
+        update(counter).where(counter.c.name == name).values(value=counter.c.value + count))
+    if not result.rowcount:
+        connection.execute(insert(counter).values(name=name, value=count))
+    last = connection.execute(select(counter.c.value).where(counter.c.name == name)).scalar_one()
+    return last - count + 1
+
+
+@event.listens_for(Session, 'before_flush')
+def _stamp_trees(session, flush_context, instances):
+    written = [obj for obj in session.new if isinstance(obj, Tree)]
+    written += [obj for obj in session.dirty
+                if isinstance(obj, Tree) and session.is_modified(obj, include_collections=False)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Tree)]
+    if not written and not deleted:
+        return
+
+    # Une version par arbre : chaque changement a une position unique dans le flux
+    version = reserve_versions(session, len(written) + len(deleted))
+    for tree in written:
+        tree.sync_version = version
+        version += 1
+    for tree in deleted:
+        session.add(TreeTombstone(tree_id=tree.id, user_id=tree.user_id, sync_version=version))
+        version += 1
+
+
+def changes_since(user_id, since=0, limit=SYNC_LIMIT):
+    """
+    Arbres de user_id écrits, et arbres supprimés, après la version since,
+    dans l'ordre des versions. watermark est la version à renvoyer comme
+    since à l'appel suivant.
+
+    Un appareil sans état (since=0) reçoit l'ensemble des arbres et aucune
+    tombe : il n'a rien à supprimer.
+    """
+    trees = Tree.query.filter(Tree.user_id == user_id, Tree.sync_version > since) \
+        .order_by(Tree.sync_version).limit(limit + 1).all()
+    tombstones = []
+    if since > 0:
+        tombstones = TreeTombstone.query.filter(TreeTombstone.user_id == user_id, TreeTombstone.sync_version > since) \
+            .order_by(TreeTombstone.sync_version).limit(limit + 1).all()
+
+    changes = sorted(trees + tombstones, key=lambda change: change.sync_version)
+    page = changes[:limit]
+    watermark = page[-1].sync_version if page else since
+    return SyncPage(
+        [change for change in page if isinstance(change, Tree)],
+        [change for change in page if isinstance(change, TreeTombstone)],
+        watermark,
+        len(changes) > limit,
+    )
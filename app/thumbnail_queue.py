@@ -0,0 +1,181 @@
+"""
+Génération des miniatures en arrière-plan.
+
+Les tâches sont persistées dans la table thumbnail_job (insérées dans la même
+transaction que l'image), puis exécutées par un pool de threads borné. Une tâche
+en échec est reprogrammée avec un délai croissant (next_attempt_at : aucun
+worker ne la reprend avant) jusqu'à THUMBNAIL_MAX_ATTEMPTS, puis marquée
+'failed'. Les tâches restées en attente (redémarrage, pool saturé) sont
+reprises par le pool dès qu'une place se libère.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, UTC
+from flask import current_app
+from sqlalchemy import update, func, or_
+from app import db
+from app.models import ThumbnailJob
+from app.storage import create_image_thumbnail
+
+# Une tâche 'running' plus ancienne que ce délai est considérée comme abandonnée
+STALE_RUNNING_AFTER = timedelta(minutes=10)
+
+
+class ThumbnailWorkerPool:
+    def __init__(self, app):
+        self.app = app
+        self.workers = app.config.get('THUMBNAIL_WORKERS', 2)
+        self.max_attempts = app.config.get('THUMBNAIL_MAX_ATTEMPTS', 3)
+        self.retry_delay = app.config.get('THUMBNAIL_RETRY_DELAY', 10)
+        # Nombre maximal de tâches confiées à l'executor en même temps
+        self.capacity = self.workers * 4
+        self._executor = None
+        if self.workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='thumbnails')
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._recovered = False
+
+    def submit(self, job_ids):
+        """Confie des tâches (déjà commitées) au pool, dans la limite de sa capacité."""
+        if self._executor is None:
+            for job_id in job_ids:
+                self._run(job_id)
+            return
+
+        if not self._recovered:
+            self._recovered = True
+            self.recover()
+
+        with self._lock:
+            for job_id in job_ids:
+                if job_id in self._in_flight:
+                    continue
+                if len(self._in_flight) >= self.capacity:
+                    break  # Reste 'pending' en base, repris plus tard
+                self._in_flight.add(job_id)
+                self._executor.submit(self._run_and_refill, job_id)
+
+    def recover(self):
+        """Remet en attente les tâches abandonnées et relance les tâches en attente."""
+        with self.app.app_context():
+            db.session.execute(
+                update(ThumbnailJob)
+                .where(ThumbnailJob.status == 'running',
+                       ThumbnailJob.updated_at < datetime.now(UTC) - STALE_RUNNING_AFTER)
+                .values(status='pending')
+            )
+            db.session.commit()
+        self._refill()
+
+    def _refill(self):
+        if self._executor is None:
+            return
+        with self._lock:
+            free = self.capacity - len(self._in_flight)
+            exclude = set(self._in_flight)
+        if free <= 0:
+            return
+        with self.app.app_context():
+            query = db.session.query(ThumbnailJob.id).filter(ThumbnailJob.status == 'pending', _due())
+            if exclude:
+                query = query.filter(ThumbnailJob.id.notin_(exclude))
+            job_ids = [job_id for (job_id,) in query.order_by(ThumbnailJob.id).limit(free)]
+        if job_ids:
+            self.submit(job_ids)
+
+    def _run_and_refill(self, job_id):
+        try:
+            self._run(job_id)
+        finally:
+            with self._lock:
+                self._in_flight.discard(job_id)
+        self._refill()
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            # Réservation atomique : un seul worker (ou processus) traite la tâche
+            claimed = db.session.execute(
+                update(ThumbnailJob)
+                .where(ThumbnailJob.id == job_id, ThumbnailJob.status == 'pending', _due())
+                .values(status='running', updated_at=datetime.now(UTC))
+            ).rowcount
+            db.session.commit()
+            if not claimed:
+                return
+
+            job = db.session.get(ThumbnailJob, job_id)
+            if job.image is None:
+                db.session.delete(job)
+                db.session.commit()
+                return
+
+            try:
+                create_image_thumbnail(job.image)
+            except Exception as e:
+                db.session.rollback()
+                job.attempts += 1
+                job.last_error = f"{type(e).__name__}: {e}"[:256]
+                job.status = 'failed' if job.attempts >= self.max_attempts else 'pending'
+                delay = self.retry_delay * 2 ** (job.attempts - 1)
+                job.next_attempt_at = datetime.now(UTC) + timedelta(seconds=delay) if job.status == 'pending' else None
+                db.session.commit()
+                current_app.logger.error(f"Échec de la miniature pour {job.image.path} (essai {job.attempts}) : {e}")
+                if job.status == 'pending' and self._executor is not None:
+                    # Réveil à l'échéance ; d'ici là, _refill et _run l'ignorent
+                    timer = threading.Timer(delay, self.submit, args=([job_id],))
+                    timer.daemon = True
+                    timer.start()
+                return
+
+            db.session.delete(job)
+            db.session.commit()
+
+
+def _due():
+    """Tâches sans délai d'attente en cours."""
+    return or_(ThumbnailJob.next_attempt_at.is_(None), ThumbnailJob.next_attempt_at <= datetime.now(UTC))
+
+
+def get_pool():
+    return current_app.extensions['thumbnail_pool']
+
+
+def init_app(app):
+    app.extensions['thumbnail_pool'] = ThumbnailWorkerPool(app)
+
+
+def enqueue_thumbnail(image):
+    """Ajoute une tâche de miniature pour l'image, dans la transaction courante."""
+    job = ThumbnailJob(image=image, status='pending')
+    db.session.add(job)
+    return job
+
+
+def dispatch(jobs):
+    """À appeler après le commit : lance les tâches dans le pool."""
+    get_pool().submit([job.id for job in jobs])
+
+
+def retry_failed():
+    """Remet en attente toutes les tâches en échec et les relance."""
+    job_ids = [job_id for (job_id,) in db.session.query(ThumbnailJob.id).filter_by(status='failed')]
+    if job_ids:
+        db.session.execute(
+            update(ThumbnailJob)
+            .where(ThumbnailJob.id.in_(job_ids))
+            .values(status='pending', attempts=0, last_error=None, next_attempt_at=None)
+        )
+        db.session.commit()
+        get_pool().submit(job_ids)
+    return len(job_ids)
+
+
+def queue_stats():
+    counts = dict(db.session.query(ThumbnailJob.status, func.count(ThumbnailJob.id))
+                  .group_by(ThumbnailJob.status).all())
+    return {status: counts.get(status, 0) for status in ('pending', 'running', 'failed')}
+
+
+def is_pending(image):
+    return image.thumbnail_jobs.filter(ThumbnailJob.status.in_(('pending', 'running'))).first() is not None
@@ -0,0 +1,323 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+from flask import current_app
+from PIL import Image as PILImage, ImageChops, ImageStat
+from PIL.PngImagePlugin import PngInfo
+from app.cache import SingleFlight
+
+# Taille maximale des miniatures (PICTOGRAMS_PATH_MIN)
+THUMB_SIZE = (48, 48)
+# À incrémenter à chaque changement d'encodeur : `flask thumbnails rebuild`
+# repart de zéro quand la signature des miniatures change
+THUMBNAIL_ENCODER = 'png-palette-1'
+
+# Chunk tEXt des miniatures qui porte leur signature (taille + encodeur)
+SIGNATURE_KEY = 'thumbnail-signature'
+# Chunk tEXt des déclinaisons mobiles : SHA-256 de la source dont elles sont issues
+SOURCE_KEY = 'source-sha256'
+
+# Écart moyen toléré (sur 255, par canal) pour accepter une palette adaptative
+# quand l'image a plus de 256 couleurs ; au-delà, PNG en couleurs vraies
+PALETTE_MAX_ERROR = 1.5
+
+# Résultat d'encodage : octets PNG, 'palette' ou 'truecolor', taille en couleurs vraies
+ThumbnailEncoding = namedtuple('ThumbnailEncoding', 'data mode truecolor_size')
+
+# Planches de sprites : une cellule THUMB_SIZE par image, SPRITE_COLUMNS par ligne
+SPRITE_COLUMNS = 16
+SPRITES_DIRNAME = '.sprites'
+
+# Déclinaisons à la demande pour le mobile : PICTOGRAMS_PATH_MIN/.sizes/<taille>/<chemin>.png
+SIZES_DIRNAME = '.sizes'
+
+_flights = SingleFlight()
+
+
+def thumbnail_path(filepath_relative):
+    """Chemin physique de la miniature d'une image (toujours en .png)."""
+    thumbs_folder = Path(current_app.config['PICTOGRAMS_PATH_MIN'])
+    return thumbs_folder / Path(filepath_relative).with_suffix('.png')
+
+
+def generate_thumbnail(source_path, thumb_path, size=THUMB_SIZE, source_sha256=None):
+    """
+    Génère la miniature PNG de source_path dans thumb_path (écriture atomique).
+    source_sha256 éventuel est enregistré dans la miniature (voir SOURCE_KEY).
+    Retourne le ThumbnailEncoding utilisé.
+    """
+    thumb_path = Path(thumb_path)
+    thumb_path.parent.mkdir(parents=True, exist_ok=True)
+    with PILImage.open(source_path) as img:
+        img.thumbnail(size)
+        encoding = encode_thumbnail(img, thumbnail_signature(size), source_sha256)
+    _write_atomic(thumb_path, lambda f: f.write(encoding.data))
+    return encoding
+
+
+def variant_path(filepath_relative, size):
+    """Chemin physique de la déclinaison d'une image en size x size pixels au plus."""
+    thumbs_folder = Path(current_app.config['PICTOGRAMS_PATH_MIN'])
+    return thumbs_folder / SIZES_DIRNAME / str(size) / Path(filepath_relative).with_suffix('.png')
+
+
+@lru_cache(maxsize=4096)
+def _file_sha256(path, inode, size, mtime_ns):
+    """SHA-256 d'un fichier ; l'inode, la taille et la date n'ont d'usage que comme clé de cache."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _variant_source(target):
+    """SHA-256 de la source enregistré dans une déclinaison, None si elle est absente ou illisible."""
+    try:
+        with PILImage.open(target) as variant:
+            return variant.info.get(SOURCE_KEY)
+    except Exception:
+        return None
+
+
+def pictogram_variant(source_path, filepath_relative, size):
+    """
+    Déclinaison de source_path, générée à la première demande puis dès que le
+    contenu de la source change. La date de la source ne suffit pas : une image
+    envoyée est un lien vers un blob parfois plus ancien que la déclinaison.
+    Les demandes simultanées ne la génèrent qu'une fois.
+    """
+    target = variant_path(filepath_relative, size)
+    stat = os.stat(source_path)
+    source_sha256 = _file_sha256(str(source_path), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    if _variant_source(target) != source_sha256:
+        def build():
+            if _variant_source(target) != source_sha256:
+                generate_thumbnail(source_path, target, (size, size), source_sha256)
+        _flights.do(f"{target}:{source_sha256}", build)
+    return target
+
+
+def remove_variants(filepath_relative):
+    """Supprime les déclinaisons mobiles d'une image, quelle que soit leur taille."""
+    sizes_folder = Path(current_app.config['PICTOGRAMS_PATH_MIN']) / SIZES_DIRNAME
+    if sizes_folder.is_dir():
+        for size_folder in sizes_folder.iterdir():
+            (size_folder / Path(filepath_relative).with_suffix('.png')).unlink(missing_ok=True)
+
+
+def remove_variant_folder(folder_relative):
+    """Supprime les déclinaisons mobiles de tout un dossier, quelle que soit leur taille."""
+    sizes_folder = Path(current_app.config['PICTOGRAMS_PATH_MIN']) / SIZES_DIRNAME
+    if sizes_folder.is_dir():
+        for size_folder in sizes_folder.iterdir():
+            shutil.rmtree(size_folder / folder_relative, ignore_errors=True)
+
+
+def _png_bytes(img, text=None, **params):
+    buffer = io.BytesIO()
+    if text:
+        params['pnginfo'] = PngInfo()
+        for key, value in text.items():
+            params['pnginfo'].add_text(key, value)
+    img.save(buffer, 'PNG', optimize=True, **params)
+    return buffer.getvalue()
+
+
+def _exact_palette(rgba):
+    """Palette exacte (sans perte) si l'image a au plus 256 couleurs, sinon None."""
+    colors = rgba.getcolors(256)
+    if colors is None:
+        return None
+    index = {bytes(color): i for i, (_, color) in enumerate(colors)}
+    data = rgba.tobytes()
+    indices = bytes(index[data[offset:offset + 4]] for offset in range(0, len(data), 4))
+    paletted = PILImage.frombytes('P', rgba.size, indices)
+    paletted.putpalette([channel for _, color in colors for channel in color[:3]])
+    alphas = bytes(color[3] for _, color in colors)
+    params = {'transparency': alphas} if min(alphas) < 255 else {}
+    return paletted, params
+
+
+def _adaptive_palette(rgba, max_colors):
+    """
+    Plus petite palette adaptative (16 à max_colors couleurs) dont l'écart avec
+    l'original reste sous PALETTE_MAX_ERROR, ou None. Sur une image 48x48, la
+    palette elle-même pèse lourd : moins de couleurs, c'est moins d'octets.
+    """
+    for colors in (16, 32, 64, 128, 256):
+        if colors > max_colors:
+            break
+        quantized = rgba.quantize(colors, method=PILImage.Quantize.FASTOCTREE)
+        error = ImageStat.Stat(ImageChops.difference(rgba, quantized.convert('RGBA'))).mean
+        if max(error) <= PALETTE_MAX_ERROR:
+            return quantized, {}
+    return None
+
+
+def encode_thumbnail(img, signature=None, source_sha256=None):
+    """
+    Encode une miniature en PNG. Les pictogrammes sont le plus souvent des
+    dessins en aplats : une palette (exacte, ou adaptative si l'écart est
+    négligeable) est bien plus compacte que des couleurs vraies. On garde
+    toujours l'encodage le plus léger. La signature et le SHA-256 de la source
+    éventuels sont écrits dans des chunks tEXt (SIGNATURE_KEY, SOURCE_KEY).
+    """
+    text = {key: value for key, value in ((SIGNATURE_KEY, signature), (SOURCE_KEY, source_sha256)) if value}
+    rgba = img.convert('RGBA')
+    opaque = rgba.getchannel('A').getextrema()[0] == 255
+    truecolor = _png_bytes(rgba.convert('RGB') if opaque else rgba, text)
+
+    exact = _exact_palette(rgba)
+    # Palette réduite : utile si l'image a trop de couleurs, ou plus qu'il n'en faut
+    exact_colors = len(exact[0].getpalette()) // 3 if exact else 257
+    candidates = [exact, _adaptive_palette(rgba, min(256, exact_colors - 1))]
+
+    best = ThumbnailEncoding(truecolor, 'truecolor', len(truecolor))
+    for candidate in candidates:
+        if candidate is None:
+            continue
+        paletted, params = candidate
+        data = _png_bytes(paletted, text, **params)
+        if len(data) < len(best.data):
+            best = ThumbnailEncoding(data, 'palette', len(truecolor))
+    return best
+
+
+def thumbnail_signature(size=THUMB_SIZE):
+    """Identifie la façon dont les miniatures sont produites (taille + encodeur)."""
+    return f"{size[0]}x{size[1]}:{THUMBNAIL_ENCODER}"
+
+
+def check_thumbnail(source_path, thumb_path):
+    """
+    Vérifie une miniature. Retourne None si elle est à jour, sinon 'missing',
+    'corrupt' ou 'stale' (source plus récente, signature d'un autre encodeur ou
+    d'une autre THUMB_SIZE, ou taille différente de THUMB_SIZE).
+    """
+    try:
+        thumb_stat = os.stat(thumb_path)
+    except OSError:
+        return 'missing'
+    try:
+        with PILImage.open(thumb_path) as thumb:
+            thumb.verify()
+            thumb_size = thumb.size
+            signature = thumb.info.get(SIGNATURE_KEY)
+    except Exception:
+        return 'corrupt'
+    if signature != thumbnail_signature():
+        return 'stale'
+    try:
+        if os.stat(source_path).st_mtime_ns > thumb_stat.st_mtime_ns:
+            return 'stale'
+        with PILImage.open(source_path) as img:  # En-tête seulement
+            source_size = img.size
+    except Exception:
+        return None  # Source illisible : rien de mieux à produire
+    # Même calcul que PIL.Image.thumbnail : réduction seulement, ratio conservé
+    scale = min(1, THUMB_SIZE[0] / source_size[0], THUMB_SIZE[1] / source_size[1])
+    expected = (max(1, round(source_size[0] * scale)), max(1, round(source_size[1] * scale)))
+    if any(abs(a - b) > 1 for a, b in zip(thumb_size, expected)):
+        return 'stale'
+    return None
+
+
+def _sprites_folder():
+    return Path(current_app.config['PICTOGRAMS_PATH_MIN']) / SPRITES_DIRNAME
+
+
+def folder_content_version(images):
+    """
+    Version du contenu d'un dossier : change dès qu'une image est ajoutée,
+    supprimée ou que sa miniature est régénérée.
+    """
+    digest = hashlib.sha1(f"{THUMB_SIZE}".encode())
+    for image in sorted(images, key=lambda img: img.id):
+        try:
+            stat = thumbnail_path(image.path).stat()
+            signature = f"{image.id}:{image.path}:{stat.st_mtime_ns}:{stat.st_size}"
+        except OSError:
+            signature = f"{image.id}:{image.path}:missing"
+        digest.update(signature.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def sprite_image_path(folder_id, version):
+    return _sprites_folder() / f"{folder_id}-{version}.png"
+
+
+def _write_atomic(target, write):
+    """Écrit via un fichier temporaire puis renomme, pour ne jamais servir un fichier partiel."""
+    fd, tmp_name = tempfile.mkstemp(dir=target.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            write(tmp)
+        os.replace(tmp_name, target)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def build_folder_sprite(folder, images):
+    """
+    Assemble les miniatures d'un dossier en une seule planche PNG.
+    Le résultat est mis en cache sur disque, indexé par la version du contenu.
+    Retourne (version, métadonnées) ; les images sans miniature sont absentes de 'items'.
+    """
+    version = folder_content_version(images)
+    sprites_folder = _sprites_folder()
+    sprite_path = sprite_image_path(folder.id, version)
+    map_path = sprite_path.with_suffix('.json')
+
+    if sprite_path.exists() and map_path.exists():
+        try:
+            return version, json.loads(map_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            pass  # Cache corrompu : on reconstruit
+
+    sprites_folder.mkdir(parents=True, exist_ok=True)
+    cell_w, cell_h = THUMB_SIZE
+    thumbs = []
+    for image in sorted(images, key=lambda img: img.name or ''):
+        try:
+            with PILImage.open(thumbnail_path(image.path)) as thumb:
+                thumbs.append((image, thumb.convert('RGBA')))
+        except (OSError, ValueError):
+            continue
+
+    columns = max(1, min(SPRITE_COLUMNS, len(thumbs)))
+    rows = max(1, -(-len(thumbs) // columns))
+    sheet = PILImage.new('RGBA', (columns * cell_w, rows * cell_h), (0, 0, 0, 0))
+    items = {}
+    for index, (image, thumb) in enumerate(thumbs):
+        x = (index % columns) * cell_w
+        y = (index // columns) * cell_h
+        # La miniature est centrée dans sa cellule (le ratio d'origine est conservé)
+        offset = ((cell_w - thumb.width) // 2, (cell_h - thumb.height) // 2)
+        sheet.paste(thumb, (x + offset[0], y + offset[1]))
+        items[str(image.id)] = {'x': x, 'y': y, 'w': cell_w, 'h': cell_h}
+
+    metadata = {
+        'tile': cell_w,
+        'width': sheet.width,
+        'height': sheet.height,
+        'items': items,
+    }
+
+    _write_atomic(sprite_path, lambda f: sheet.save(f, 'PNG', optimize=True))
+    _write_atomic(map_path, lambda f: f.write(json.dumps(metadata).encode('utf-8')))
+
+    # Nettoyage des anciennes versions de ce dossier
+    for stale in sprites_folder.glob(f"{folder.id}-*"):
+        if stale.stem != sprite_path.stem:
+            stale.unlink(missing_ok=True)
+
+    return version, metadata
@@ -0,0 +1,110 @@
+"""
+Jetons de renouvellement (refresh tokens) de l'application mobile.
+
+La connexion (mot de passe, donc un hachage volontairement lent) délivre un
+jeton d'accès de courte durée et un jeton de renouvellement. Ce dernier
+s'échange ensuite contre une nouvelle paire, sans mot de passe : une simple
+recherche par empreinte SHA-256 (le jeton est aléatoire, 256 bits).
+
+Rotation : chaque jeton ne sert qu'une fois et est remplacé par un nouveau de
+la même famille (une famille = une connexion d'un appareil). Présenter un
+jeton déjà échangé trahit un vol ou un rejeu : toute la famille est révoquée
+et l'appareil doit se reconnecter.
+"""
+import hashlib
+import secrets
+import uuid
+from datetime import datetime, timedelta, UTC
+from flask import current_app
+from sqlalchemy import delete, update
+from app import db
+from app.models import RefreshToken, User
+
+
+class InvalidRefreshToken(Exception):
+    """Jeton inconnu, expiré, révoqué ou réutilisé ; code est renvoyé à l'appareil."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def _hash(raw):
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def issue_refresh_token(user_id, family=None):
+    """
+    Nouveau jeton pour user_id (nouvelle famille par défaut). Retourne le jeton
+    en clair, qui n'est jamais stocké ; à l'appelant de valider la session.
+    """
+    now = datetime.now(UTC)
+    # Les jetons expirés de l'utilisateur ne servent plus, même à détecter un rejeu
+    db.session.execute(delete(RefreshToken).where(RefreshToken.user_id == user_id, RefreshToken.expires_at <= now)
+                       .execution_options(synchronize_session=False))
+    raw = secrets.token_urlsafe(32)
+    db.session.add(RefreshToken(
+        user_id=user_id,
+        token_hash=_hash(raw),
+        family=family or uuid.uuid4().hex,
+        created_at=now,
+        expires_at=now + timedelta(days=current_app.config['MOBILE_REFRESH_TOKEN_DAYS']),
+    ))
+    return raw
+
+
+def _revoke(condition, reason):
+    db.session.execute(
+        update(RefreshToken).where(condition, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(UTC), revoked_reason=reason)
+        .execution_options(synchronize_session=False))
+
+
+def rotate_refresh_token(raw):
+    """
+    Échange raw contre un nouveau jeton de la même famille.
+    Retourne (utilisateur, nouveau jeton) ; InvalidRefreshToken sinon.
+    """
+    token_hash = _hash(raw)
+    # Consommation atomique : de deux échanges simultanés, un seul réussit
+    consumed = db.session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.token_hash == token_hash, RefreshToken.revoked_at.is_(None),
+               RefreshToken.expires_at > datetime.now(UTC))
+        .values(revoked_at=datetime.now(UTC), revoked_reason='rotated')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    token = RefreshToken.query.filter_by(token_hash=token_hash).first()
+
+    if not consumed:
+        if token is not None and token.revoked_reason == 'rotated':
+            _revoke(RefreshToken.family == token.family, 'reuse')
+            db.session.commit()
+            raise InvalidRefreshToken('REFRESH_TOKEN_REUSED')
+        db.session.rollback()
+        raise InvalidRefreshToken('INVALID_REFRESH_TOKEN')
+
+    user = db.session.get(User, token.user_id)
+    if user is None or not user.confirmed:
+        _revoke(RefreshToken.family == token.family, 'logout')
+        db.session.commit()
+        raise InvalidRefreshToken('INVALID_REFRESH_TOKEN')
+
+    new_raw = issue_refresh_token(user.id, token.family)
+    db.session.commit()
+    return user, new_raw
+
+
+def revoke_refresh_token(raw):
+    """Déconnexion d'un appareil : révoque la famille du jeton. Retourne False s'il est inconnu."""
+    token = RefreshToken.query.filter_by(token_hash=_hash(raw)).first()
+    if token is None:
+        return False
+    _revoke(RefreshToken.family == token.family, 'logout')
+    db.session.commit()
+    return True
+
+
+def revoke_user_refresh_tokens(user_id, reason='password'):
+    """Révoque tous les jetons de l'utilisateur (changement de mot de passe) ; sans commit."""
+    _revoke(RefreshToken.user_id == user_id, reason)
@@ -1,4 +1,8 @@
+import os
+import posixpath
 import re
+import urllib.parse
+import unicodedata
 from smtplib import SMTPException
 from flask_mail import Message
 from flask import render_template, current_app
@@ -8,6 +12,9 @@ from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 EMAIL_CONFIRMATION_SALT = 'email-confirmation-salt'
 PASSWORD_RESET_SALT = 'password-reset-salt'
 EMAIL_REGEX = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+# Extension de fichier retirée des clés de recherche ("chat.png" -> "chat")
+FILE_EXTENSION_REGEX = re.compile(r'\.[A-Za-z0-9]{1,5}$')
+SEARCH_WORD_REGEX = re.compile(r'[^\W_]+')
 
 def send_email(to, subject, template, **kwargs):
     """Fonction générique pour l'envoi d'e-mails."""
@@ -75,3 +82,70 @@ def confirm_password_reset_token(token, expiration=3600):
         current_app.logger.error(f"Erreur inattendue lors de la validation du token de reset : {type(e).__name__}")
         return False
 
+def extract_description_from_path(filepath):
+    """
+    Système évolutif pour extraire la description d'une image selon sa banque d'origine,
+    si celle-ci n'est pas répertoriée dans la base de données relationnelle.
+    Utilisé à l'ingestion pour stocker la description, et en dernier recours par l'API mobile.
+    """
+    basename = os.path.basename(filepath)
+    name_without_ext = os.path.splitext(basename)[0]
+    
+    # Stratégie pour la banque Arasaac
+    if "public/arasaac/" in filepath:
+        # Ex: '1234_manger_du_pain.png' -> 'manger du pain'
+        clean_name = re.sub(r'^\d+_', '', name_without_ext)
+        clean_name = clean_name.replace('_', ' ').replace('-', ' ')
+        return clean_name.capitalize()
+        
+    # [Placeholder] Stratégie pour une future banque
+    # elif "public/sclera/" in filepath:
+    #     ...
+        
+    # Stratégie par défaut (nettoyage simple)
+    return name_without_ext.replace('_', ' ').capitalize()
+
+
+def fold_text(value):
+    """Minuscules sans accents (décomposition NFKD) : "Été" -> "ete"."""
+    if not value or value.isascii():
+        return (value or '').lower()
+    decomposed = unicodedata.normalize('NFKD', value)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def normalize_search_key(name):
+    """
+    Clé de recherche d'un nom d'image : sans extension, repliée (fold_text),
+    mots séparés par une seule espace. "Été_Summer-2.PNG" -> "ete summer 2".
+    """
+    stem = FILE_EXTENSION_REGEX.sub('', name or '')
+    return ' '.join(SEARCH_WORD_REGEX.findall(fold_text(stem)))
+
+
+def normalize_root_path(root_url):
+    """
+    Image racine d'un arbre telle que la liste mobile l'emploie : chemin relatif
+    au dossier des pictogrammes ("/pictograms/public/a.png" -> "public/a.png"),
+    URL absolue inchangée, None si l'arbre n'a pas d'image.
+    """
+    if not root_url:
+        return None
+    if root_url.startswith('http'):
+        return root_url
+    path = posixpath.normpath(urllib.parse.urlparse(root_url).path).lstrip('/')
+    if path.startswith('pictograms/'):
+        path = path[len('pictograms/'):]
+    return path if path != '.' else None
+
+
+def get_image_ids_from_tree(nodes):
+    """Extrait récursivement les ID d'images d'une structure d'arbre."""
+    image_ids = set()
+    for node in nodes:
+        # L'id d'un nœud est celui de son image
+        if 'id' in node and node['id'] != -1:
+            image_ids.add(node['id'])
+        if 'children' in node and node['children']:
+            image_ids.update(get_image_ids_from_tree(node['children']))
+    return image_ids
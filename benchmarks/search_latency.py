@@ -0,0 +1,134 @@
+"""
+Benchmark de la recherche de pictogrammes : latence par frappe (p50/p95/p99).
+
+Simule la saisie au clavier (tous les préfixes de 1 à 6 lettres de noms tirés
+au hasard) et mesure, pour chaque préfixe :
+  - l'index en mémoire de la banque publique (public_index) ;
+  - l'ancienne requête ILIKE '%q%', pour comparaison ;
+  - la première page servie par /api/search_local_images (search_page : index
+    + images privées d'un utilisateur, SEARCH_PAGE_SIZE résultats).
+
+Par défaut, la banque et les images privées sont synthétiques, dans une base
+SQLite en mémoire ; --real mesure sur la base configurée (lecture seule).
+
+    python benchmarks/search_latency.py [--images 12000] [--private 500] [--queries 2000] [--seed 0]
+    python benchmarks/search_latency.py --real [--user-id ID]
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import create_app, db  # noqa: E402
+from app.models import Image  # noqa: E402
+from app.utils import normalize_search_key  # noqa: E402
+from app.search import (  # noqa: E402
+    AutocompleteIndex, public_index, search_page, visibility_conditions,
+)
+
+SYLLABLES = ['ba', 'be', 'bi', 'bo', 'ca', 'ce', 'chi', 'co', 'da', 'de', 'é', 'fa', 'fe', 'ga', 'gi', 'la',
+             'le', 'li', 'lo', 'ma', 'me', 'mi', 'mo', 'na', 'ne', 'pa', 'pe', 'pi', 'po', 'ra', 're', 'ri',
+             'ro', 'sa', 'se', 'si', 'ta', 'te', 'ti', 'to', 'va', 've', 'vi', 'vo', 'za', 'ç', 'è', 'ou']
+
+
+def _word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def _synthetic_rows(count, rng, user_id=None):
+    rows = []
+    for i in range(count):
+        name = '_'.join(_word(rng) for _ in range(rng.randint(1, 3)))
+        rows.append({
+            'path': f"public/bench/{i}/{name}.png",
+            'name': f"{name}.png",
+            'search_key': normalize_search_key(name),
+            'use_count': rng.randint(0, 20) if rng.random() < 0.1 else 0,
+            'description': ' '.join(_word(rng) for _ in range(rng.randint(0, 4))).capitalize(),
+            'user_id': user_id,
+            'is_public': user_id is None,
+        })
+    return rows
+
+
+def _keystrokes(keys, count, rng):
+    """Préfixes successifs (1 à 6 lettres) de mots tirés au hasard, comme une saisie."""
+    prefixes = []
+    while len(prefixes) < count:
+        name_words = rng.choice(keys).split()
+        if not name_words:
+            continue
+        word = rng.choice(name_words)
+        prefixes.extend(word[:length] for length in range(1, min(6, len(word)) + 1))
+    return prefixes[:count]
+
+
+def _measure(function, queries):
+    timings = []
+    for q in queries:
+        started = time.perf_counter()
+        function(q)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def _ilike(q, user_id):
+    return Image.query.filter(visibility_conditions(user_id)).filter(Image.name.ilike(f'%{q}%')).limit(100).all()
+
+
+def _report(label, timings):
+    # Centiles calculés sur toutes les frappes, premières lettres comprises
+    centiles = statistics.quantiles(timings, n=100, method='inclusive')
+    print(f"{label:<22} p50 {centiles[49]:7.3f} ms   p95 {centiles[94]:7.3f} ms   "
+          f"p99 {centiles[98]:7.3f} ms   max {max(timings):7.3f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=12000, help="Taille de la banque synthétique (défaut : 12000)")
+    parser.add_argument('--private', type=int, default=500, help="Images privées de l'utilisateur synthétique (défaut : 500)")
+    parser.add_argument('--user-id', type=int, default=None, help="Utilisateur de la recherche complète avec --real")
+    parser.add_argument('--queries', type=int, default=2000, help="Nombre de frappes simulées (défaut : 2000)")
+    parser.add_argument('--seed', type=int, default=0, help="Graine du tirage")
+    parser.add_argument('--real', action='store_true', help="Mesure sur la base configurée au lieu d'une banque synthétique")
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    user_id = args.user_id if args.real else 1
+    with tempfile.TemporaryDirectory() as tmp:
+        overrides = {} if args.real else {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'PICTOGRAMS_PATH': tmp,
+            'PICTOGRAMS_PATH_MIN': tmp,
+        }
+        app = create_app(overrides)
+        with app.app_context():
+            if not args.real:
+                db.create_all()
+                db.session.execute(db.insert(Image), _synthetic_rows(args.images, rng))
+                db.session.execute(db.insert(Image), _synthetic_rows(args.private, rng, user_id))
+                db.session.commit()
+
+            started = time.perf_counter()
+            index = AutocompleteIndex.build()
+            build_ms = (time.perf_counter() - started) * 1000
+            if not len(index):
+                print("Banque publique vide : rien à mesurer.")
+                return
+            print(f"Index : {len(index)} image(s), construit en {build_ms:.0f} ms")
+
+            queries = _keystrokes([normalize_search_key(item['name']) for item in index.items], args.queries, rng)
+            print(f"{len(queries)} frappe(s) simulée(s) (graine {args.seed})")
+            public_index()  # Construction hors mesure, comme après le premier appel
+            _report("Index en mémoire", _measure(lambda q: public_index().search(normalize_search_key(q)), queries))
+            _report("ILIKE (avant)", _measure(lambda q: _ilike(q, user_id), queries))
+            _report("search_page (route)", _measure(lambda q: search_page(q, user_id), queries))
+
+
+if __name__ == '__main__':
+    main()
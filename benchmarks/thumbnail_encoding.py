@@ -0,0 +1,79 @@
+"""
+Benchmark de l'encodage des miniatures : PNG en couleurs vraies contre palette.
+
+Prend un échantillon aléatoire de la banque publique (PICTOGRAMS_PATH/public),
+génère les miniatures en mémoire et compare les tailles et les temps.
+
+    python benchmarks/thumbnail_encoding.py [--sample 500] [--seed 0] [--root DOSSIER]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from PIL import Image as PILImage
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.thumbnails import THUMB_SIZE, encode_thumbnail  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+
+def _default_root():
+    from app import create_app
+    app = create_app()
+    return Path(app.config['PICTOGRAMS_PATH']) / 'public'
+
+
+def sample_files(root, size, seed):
+    files = [Path(dirpath) / name
+             for dirpath, _, names in os.walk(root)
+             for name in names if name.lower().endswith(IMAGE_EXTENSIONS)]
+    random.Random(seed).shuffle(files)
+    return files[:size]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sample', type=int, default=500, help="Nombre d'images (défaut : 500)")
+    parser.add_argument('--seed', type=int, default=0, help="Graine de l'échantillonnage")
+    parser.add_argument('--root', type=Path, default=None, help="Dossier à échantillonner (défaut : banque publique)")
+    args = parser.parse_args(argv)
+
+    root = args.root or _default_root()
+    files = sample_files(root, args.sample, args.seed)
+    if not files:
+        print(f"Aucune image trouvée sous {root}.")
+        return
+
+    truecolor_total = encoded_total = palette_count = errors = 0
+    encode_time = 0.0
+    for path in files:
+        try:
+            with PILImage.open(path) as img:
+                img.thumbnail(THUMB_SIZE)
+                started = time.perf_counter()
+                encoding = encode_thumbnail(img)
+                encode_time += time.perf_counter() - started
+        except Exception as e:
+            errors += 1
+            print(f"{path} : {e}")
+            continue
+        truecolor_total += encoding.truecolor_size
+        encoded_total += len(encoding.data)
+        palette_count += encoding.mode == 'palette'
+
+    encoded = len(files) - errors
+    saved = truecolor_total - encoded_total
+    print(f"Échantillon : {encoded} image(s) de {root} (graine {args.seed}), {errors} erreur(s)")
+    print(f"Palette retenue : {palette_count} ({palette_count * 100 / max(encoded, 1):.1f} %)")
+    print(f"Couleurs vraies : {truecolor_total / 1024:.1f} Ko ({truecolor_total / max(encoded, 1):.0f} o/miniature)")
+    print(f"Encodeur        : {encoded_total / 1024:.1f} Ko ({encoded_total / max(encoded, 1):.0f} o/miniature)")
+    print(f"Économie        : {saved / 1024:.1f} Ko ({saved * 100 / max(truecolor_total, 1):.1f} %)")
+    print(f"Temps d'encodage: {encode_time * 1000 / max(encoded, 1):.2f} ms/miniature (toutes les variantes essayées)")
+
+
+if __name__ == '__main__':
+    main()
@@ -33,6 +33,40 @@ class Config:
     # Upload limits
     MAX_IMAGE_SIZE_KB = int(os.environ.get('MAX_IMAGE_SIZE_KB', 2048)) # Default to 2MB
     MAX_ITEMS_LIMIT = int(os.environ.get('MAX_ITEMS_LIMIT', 5000)) # Default to 5000 items
+    MAX_BATCH_UPLOAD_FILES = int(os.environ.get('MAX_BATCH_UPLOAD_FILES', 100)) # Files per batch upload request
+
+    # Ingest-time normalization: cap the longest edge, strip metadata, re-encode
+    IMAGE_NORMALIZE = os.environ.get('IMAGE_NORMALIZE', 'false').lower() in ('1', 'true', 'yes')
+    IMAGE_MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', 1024)) # Pixels, users can override it
+    IMAGE_NORMALIZED_FORMAT = os.environ.get('IMAGE_NORMALIZED_FORMAT', 'WEBP')
+    IMAGE_NORMALIZED_QUALITY = int(os.environ.get('IMAGE_NORMALIZED_QUALITY', 85))
+    IMAGE_KEEP_ORIGINAL = os.environ.get('IMAGE_KEEP_ORIGINAL', 'false').lower() in ('1', 'true', 'yes')
+
+    # Background thumbnail generation (0 = synchronous, in the request)
+    THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+    THUMBNAIL_MAX_ATTEMPTS = int(os.environ.get('THUMBNAIL_MAX_ATTEMPTS', 3))
+    THUMBNAIL_RETRY_DELAY = int(os.environ.get('THUMBNAIL_RETRY_DELAY', 10)) # Seconds, doubled on each attempt
+
+    # In-memory search index of the public library: how often to check whether it changed
+    SEARCH_INDEX_CHECK_INTERVAL = int(os.environ.get('SEARCH_INDEX_CHECK_INTERVAL', 30)) # Seconds
+
+    # ARASAAC proxy (/api/arasaac): upstream servers, search cache lifetime, request timeout
+    ARASAAC_API_URL = os.environ.get('ARASAAC_API_URL', 'https://api.arasaac.org')
+    ARASAAC_STATIC_URL = os.environ.get('ARASAAC_STATIC_URL', 'https://static.arasaac.org')
+    ARASAAC_SEARCH_TTL = int(os.environ.get('ARASAAC_SEARCH_TTL', 3600)) # Seconds
+    ARASAAC_TIMEOUT = float(os.environ.get('ARASAAC_TIMEOUT', 10)) # Seconds
+
+    # Sizes accepted by GET /api/v1/mobile/pictograms/<path>?size= (variants generated on first request)
+    MOBILE_PICTOGRAM_SIZES = [64, 128, 256, 512]
+
+    # Mobile refresh tokens (POST /api/v1/mobile/token/refresh): lifetime of each rotated token
+    MOBILE_REFRESH_TOKEN_DAYS = int(os.environ.get('MOBILE_REFRESH_TOKEN_DAYS', 30))
+
+    # Response compression (gzip, and brotli when the package is installed)
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)) # Bytes
+    # No text/html: pages mixing the CSRF token with reflected input would be open to BREACH
+    COMPRESSION_MIMETYPES = ['application/json', 'text/css', 'text/javascript', 'application/javascript']
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     LANGUAGES = ['en', 'fr', 'es', 'de', 'it', 'nl', 'pl']
@@ -30,7 +30,8 @@ def create_admin_user(username, email, password):
             username=username, 
             email=email, 
             confirmed=True, # Le "hack" pour bypass le SMTP
-            confirmed_on=datetime.now(UTC)
+            confirmed_on=datetime.now(UTC),
+            is_admin=True # Accès aux pages /admin (file des miniatures)
         )
         user.set_password(password)
         
@@ -0,0 +1,47 @@
+"""add FTS5 image search index
+
+Revision ID: 4f2c9a7d1e30
+Revises: 86832b604098
+Create Date: 2026-10-19 18:12:41.503118
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2c9a7d1e30'
+down_revision = '86832b604098'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Index plein texte à contenu externe, tenu à jour par triggers (SQLite uniquement)
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS image_fts USING fts5(
+        name, description,
+        content='image', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+    )""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS image_fts_insert AFTER INSERT ON image BEGIN
+        INSERT INTO image_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS image_fts_delete AFTER DELETE ON image BEGIN
+        INSERT INTO image_fts(image_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS image_fts_update AFTER UPDATE OF name, description ON image BEGIN
+        INSERT INTO image_fts(image_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO image_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""")
+    # Indexation des images existantes
+    op.execute("INSERT INTO image_fts(image_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS image_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS image_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS image_fts_insert")
+    op.execute("DROP TABLE IF EXISTS image_fts")
@@ -0,0 +1,87 @@
+"""add image search key
+
+Revision ID: 898a49cd759b
+Revises: 4f2c9a7d1e30
+Create Date: 2026-10-19 17:29:04.505084
+
+"""
+import re
+import unicodedata
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '898a49cd759b'
+down_revision = '4f2c9a7d1e30'
+branch_labels = None
+depends_on = None
+
+
+def _search_key(name):
+    # Copie de app.utils.normalize_search_key au moment de la migration
+    stem = re.sub(r'\.[A-Za-z0-9]{1,5}$', '', name or '')
+    decomposed = unicodedata.normalize('NFKD', stem)
+    folded = ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+    return ' '.join(re.findall(r'[^\W_]+', folded))
+
+
+def _create_fts(column):
+    op.execute(f"""CREATE VIRTUAL TABLE image_fts USING fts5(
+        {column}, description,
+        content='image', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+    )""")
+    op.execute(f"""CREATE TRIGGER image_fts_insert AFTER INSERT ON image BEGIN
+        INSERT INTO image_fts(rowid, {column}, description) VALUES (new.id, new.{column}, new.description);
+    END""")
+    op.execute(f"""CREATE TRIGGER image_fts_delete AFTER DELETE ON image BEGIN
+        INSERT INTO image_fts(image_fts, rowid, {column}, description) VALUES ('delete', old.id, old.{column}, old.description);
+    END""")
+    op.execute(f"""CREATE TRIGGER image_fts_update AFTER UPDATE OF {column}, description ON image BEGIN
+        INSERT INTO image_fts(image_fts, rowid, {column}, description) VALUES ('delete', old.id, old.{column}, old.description);
+        INSERT INTO image_fts(rowid, {column}, description) VALUES (new.id, new.{column}, new.description);
+    END""")
+    op.execute("INSERT INTO image_fts(image_fts) VALUES ('rebuild')")
+
+
+def _drop_fts():
+    op.execute("DROP TRIGGER IF EXISTS image_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS image_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS image_fts_insert")
+    op.execute("DROP TABLE IF EXISTS image_fts")
+
+
+def upgrade():
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    if sqlite:
+        _drop_fts()
+
+    with op.batch_alter_table('image', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_key', sa.String(length=128), nullable=True))
+        batch_op.create_index(batch_op.f('ix_image_search_key'), ['search_key'], unique=False)
+
+    # Clés des images existantes
+    bind = op.get_bind()
+    image = sa.table('image', sa.column('id', sa.Integer), sa.column('name', sa.String), sa.column('search_key', sa.String))
+    rows = bind.execute(sa.select(image.c.id, image.c.name)).fetchall()
+    updates = [{'image_id': row.id, 'key': _search_key(row.name)} for row in rows]
+    if updates:
+        bind.execute(image.update().where(image.c.id == sa.bindparam('image_id')).values(search_key=sa.bindparam('key')), updates)
+
+    # L'index plein texte porte désormais sur la clé plutôt que sur le nom brut
+    if sqlite:
+        _create_fts('search_key')
+
+
+def downgrade():
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    if sqlite:
+        _drop_fts()
+
+    with op.batch_alter_table('image', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_search_key'))
+        batch_op.drop_column('search_key')
+
+    if sqlite:
+        _create_fts('name')
@@ -3,7 +3,7 @@ from app import create_app, db
 from pathlib import Path
 import shutil
 from app.utils import generate_confirmation_token
-from app.models import User, Image
+from app.models import User, Image, Folder
 
 @pytest.fixture
 def app():
@@ -12,12 +12,17 @@ def app():
     if test_pictos_path.exists():
         shutil.rmtree(test_pictos_path, ignore_errors=True)
     test_pictos_path.mkdir(exist_ok=True)
+    test_pictos_min_path = Path(__file__).parent / 'test_pictos_min'
+    if test_pictos_min_path.exists():
+        shutil.rmtree(test_pictos_min_path, ignore_errors=True)
 
     app = create_app({
         "TESTING": True,
         "SQLALCHEMY_DATABASE_URI": "sqlite:///test.db",
         "PICTOGRAMS_PATH": str(test_pictos_path), # Override the pictogram path for tests
-        "WTF_CSRF_ENABLED": False
+        "PICTOGRAMS_PATH_MIN": str(test_pictos_min_path),
+        "WTF_CSRF_ENABLED": False,
+        "THUMBNAIL_WORKERS": 0 # Thumbnails generated synchronously in tests
     })
 
     with app.app_context():
@@ -27,6 +32,7 @@ def app():
 
     # Cleanup the test pictograms directory
     shutil.rmtree(test_pictos_path, ignore_errors=True)
+    shutil.rmtree(test_pictos_min_path, ignore_errors=True)
 
 
 @pytest.fixture
@@ -68,3 +74,17 @@ def create_user(client, username='testuser', password='Password123', email=None)
         accept_terms='y'
     ), follow_redirects=True)
     return User.query.filter_by(username=username).first()
+
+def mobile_token(client, username, password='Password123'):
+    """Helper function to create a confirmed user and return its mobile API auth headers."""
+    create_user(client, username, password)
+    confirm_user(client, f'{username}@test.com')
+    response = client.post('/api/v1/mobile/login', json={'username': username, 'password': password})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+def login_new_user(client, username, password='Password123'):
+    """Helper function to create, confirm and log in a user; returns its root folder."""
+    user = create_user(client, username, password)
+    confirm_user(client, user.email)
+    login(client, username, password)
+    return Folder.query.filter_by(user_id=user.id, parent_id=None).first()
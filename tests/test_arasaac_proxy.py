@@ -0,0 +1,156 @@
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from PIL import Image as PILImage
+from app.arasaac import pictogram_path
+from app.cache import SingleFlight
+
+
+def _png():
+    buffer = io.BytesIO()
+    PILImage.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class StubArasaac(BaseHTTPRequestHandler):
+    """Faux api.arasaac.org / static.arasaac.org : compte les requêtes reçues."""
+    searches = {
+        ('fr', 'chat'): [
+            {'_id': 2426, 'keywords': [{'keyword': 'chat', 'plural': 'chats'}], 'categories': ['animal']},
+            {'_id': 7, 'keywords': []},
+        ],
+    }
+    pictograms = {2426: _png()}
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        time.sleep(self.server.delay)
+        parts = self.path.strip('/').split('/')
+        if parts[:2] == ['api', 'pictograms'] and parts[3:4] == ['search']:
+            if self.server.fail:
+                return self._send(500, b'oops', 'text/plain')
+            results = self.searches.get((parts[2], parts[4]))
+            if results is None:
+                return self._send(404, b'[]', 'application/json')
+            return self._send(200, json.dumps(results).encode(), 'application/json')
+        if parts[0] == 'pictograms' and int(parts[1]) in self.pictograms:
+            return self._send(200, self.pictograms[int(parts[1])], 'image/png')
+        return self._send(404, b'Not found', 'text/plain')
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream(app):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubArasaac)
+    server.hits, server.delay, server.fail = [], 0, False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    app.config.update(ARASAAC_API_URL=url, ARASAAC_STATIC_URL=url)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_search_is_cached_per_locale_and_query(app, upstream):
+    client = app.test_client()
+    response = client.get('/api/arasaac/pictograms/fr/search/chat')
+    assert response.status_code == 200
+    # Champs utiles seulement, pictogrammes sans mot-clé écartés
+    assert response.get_json() == [{'_id': 2426, 'keywords': [{'keyword': 'chat'}]}]
+    assert client.get('/api/arasaac/pictograms/fr/search/ Chat ').get_json() == response.get_json()
+    assert len(upstream.hits) == 1
+
+    assert client.get('/api/arasaac/pictograms/en/search/chat').get_json() == []
+    assert len(upstream.hits) == 2
+    assert client.get('/api/arasaac/pictograms/en/search/chat').get_json() == []
+    assert len(upstream.hits) == 2
+
+
+def test_search_rejects_unknown_locales_and_reports_upstream_errors(app, upstream):
+    client = app.test_client()
+    assert client.get('/api/arasaac/pictograms/xx/search/chat').status_code == 400
+    assert client.get('/api/arasaac/pictograms/fr/search/' + 'a' * 101).status_code == 400
+    assert upstream.hits == []
+
+    upstream.fail = True
+    assert client.get('/api/arasaac/pictograms/fr/search/chat').status_code == 502
+    # Les erreurs ne sont pas mises en cache
+    upstream.fail = False
+    assert client.get('/api/arasaac/pictograms/fr/search/chat').status_code == 200
+
+
+def test_pictograms_are_cached_on_disk(app, upstream):
+    client = app.test_client()
+    response = client.get('/api/arasaac/pictograms/2426.png')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.data == StubArasaac.pictograms[2426]
+    assert pictogram_path(2426).read_bytes() == StubArasaac.pictograms[2426]
+    assert 'max-age' in response.headers['Cache-Control']
+
+    assert client.get('/api/arasaac/pictograms/2426.png').data == StubArasaac.pictograms[2426]
+    assert len(upstream.hits) == 1
+
+    assert client.get('/api/arasaac/pictograms/99.png').status_code == 404
+    assert not pictogram_path(99).exists()
+
+
+def test_concurrent_misses_share_one_upstream_fetch(app, upstream):
+    upstream.delay = 0.2
+    statuses = []
+
+    def fetch(url):
+        statuses.append(app.test_client().get(url).status_code)
+
+    threads = [threading.Thread(target=fetch, args=(url,))
+               for url in ['/api/arasaac/pictograms/fr/search/chat'] * 5 + ['/api/arasaac/pictograms/2426.png'] * 5]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [200] * 10
+    assert sorted(upstream.hits) == ['/api/pictograms/fr/search/chat', '/pictograms/2426/2426_300.png']
+
+
+def test_single_flight_shares_results_and_errors():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return 'value'
+
+    leader = threading.Thread(target=lambda: results.append(flights.do('k', slow)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flights.do('k', slow))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join()
+    assert results == ['value'] * 4 and len(calls) == 1
+
+    def failing():
+        raise ValueError('boom')
+    with pytest.raises(ValueError):
+        flights.do('k', failing)
+    assert flights.do('k', lambda: 'again') == 'again'
@@ -0,0 +1,41 @@
+from app.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expires_entries():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    clock.now = 5
+    assert cache.get('a') is None
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+def test_ttl_cache_get_or_set_caches_falsy_values():
+    cache = TTLCache()
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return None
+    assert cache.get_or_set('k', factory) is None
+    assert cache.get_or_set('k', factory) is None
+    assert len(calls) == 1
+    assert cache.pop('k') is None and len(cache) == 0
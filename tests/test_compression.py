@@ -0,0 +1,76 @@
+import gzip
+from flask import jsonify, make_response, request
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+from app.compression import choose_encoding
+
+PAYLOAD = {'nodes': [{'id': i, 'label': f'pictogramme {i}'} for i in range(200)]}
+
+
+def _routes(app):
+    app.add_url_rule('/test/large', 'large', lambda: jsonify(PAYLOAD))
+    app.add_url_rule('/test/small', 'small', lambda: jsonify({'ok': True}))
+    app.add_url_rule('/test/image', 'image', lambda: app.response_class(b'\x89PNG' + b'\0' * 4096, mimetype='image/png'))
+
+    def tagged():
+        response = jsonify(PAYLOAD)
+        response.set_etag('v1')
+        return response.make_conditional(request)
+    app.add_url_rule('/test/tagged', 'tagged', tagged)
+
+
+def test_large_json_is_gzipped_when_accepted(app, client):
+    _routes(app)
+    response = client.get('/test/large', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    body = gzip.decompress(response.data)
+    assert len(response.data) < len(body)
+    assert make_response(jsonify(PAYLOAD)).get_data() == body
+
+    plain = client.get('/test/large')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.get_json() == PAYLOAD
+
+
+def test_small_bodies_and_images_are_left_alone(app, client):
+    _routes(app)
+    headers = {'Accept-Encoding': 'gzip'}
+    assert 'Content-Encoding' not in client.get('/test/small', headers=headers).headers
+    image = client.get('/test/image', headers=headers)
+    assert 'Content-Encoding' not in image.headers
+    assert 'Accept-Encoding' not in image.headers.get('Vary', '')
+    assert client.get('/test/large', headers={'Accept-Encoding': 'gzip;q=0'}).headers.get('Content-Encoding') is None
+
+
+def test_html_pages_are_not_compressed(app, client):
+    # Pages carry the CSRF token next to reflected input (BREACH)
+    app.add_url_rule('/test/page', 'page', lambda: '<p>pictogramme</p>' * 200)
+    response = client.get('/test/page', headers={'Accept-Encoding': 'gzip'})
+    assert response.mimetype == 'text/html'
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_compressed_body_is_reused_for_the_same_etag(app, client):
+    _routes(app)
+    encoders = app.extensions['compression']['encoders']
+    calls = []
+    original = encoders['gzip']
+    encoders['gzip'] = lambda data: calls.append(len(data)) or original(data)
+
+    first = client.get('/test/tagged', headers={'Accept-Encoding': 'gzip'})
+    second = client.get('/test/tagged', headers={'Accept-Encoding': 'gzip'})
+    assert first.data == second.data and len(calls) == 1
+    assert first.headers['ETag'] == 'W/"v1"'
+
+    revalidated = client.get('/test/tagged', headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+
+
+def test_brotli_is_preferred_when_available():
+    encoders = {'gzip': None, 'br': None}
+    assert choose_encoding(parse_accept_header('gzip, deflate, br'), encoders) == 'br'
+    assert choose_encoding(parse_accept_header('gzip;q=1.0, br;q=0.5'), encoders) == 'gzip'
+    assert choose_encoding(parse_accept_header('br'), {'gzip': None}) is None
+    assert choose_encoding(parse_accept_header('*'), {'gzip': None}) == 'gzip'
+    assert choose_encoding(Accept(), encoders) is None
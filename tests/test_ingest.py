@@ -0,0 +1,130 @@
+import json
+import os
+from pathlib import Path
+from PIL import Image as PILImage
+from app import db
+from app.models import Folder, Image
+from add_test_images import MANIFEST_NAME, ingest
+
+
+def _make_public_tree(app, files):
+    pictos = Path(app.config['PICTOGRAMS_PATH'])
+    for relative in files:
+        path = pictos / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        PILImage.new('RGB', (64, 64), color='green').save(path)
+    return pictos
+
+
+def test_ingest_adds_folders_images_and_thumbnails(app):
+    _make_public_tree(app, [
+        'public/animals/cat.png',
+        'public/animals/dog.jpg',
+        'public/animals/birds/owl.png',
+        'public/food/apple_red.png',
+    ])
+
+    stats = ingest(app, workers=0, batch_size=2)
+
+    assert stats['folders_added'] == 4
+    assert stats['images_added'] == 4
+    assert stats['thumbnails'] == 4
+    birds = Folder.query.filter_by(path='public/animals/birds').one()
+    assert birds.parent.path == 'public/animals'
+    assert birds.parent.parent.path == 'public'
+    assert Folder.query.filter_by(path='public').one().parent_id is None
+
+    apple = Image.query.filter_by(path='public/food/apple_red.png').one()
+    assert apple.is_public and apple.user_id is None
+    assert apple.folder.path == 'public/food'
+    assert apple.description == 'Apple red'
+    thumbs = Path(app.config['PICTOGRAMS_PATH_MIN'])
+    assert (thumbs / 'public/animals/dog.png').exists()
+
+    # A second run adds nothing and regenerates no thumbnail
+    stats = ingest(app, workers=0)
+    assert stats['folders_added'] == 0
+    assert stats['images_added'] == 0
+    assert stats['unchanged'] == 4
+    assert stats['thumbnails'] == 0
+    assert Image.query.count() == 4
+
+
+def test_ingest_replaces_legacy_descriptions(app):
+    _make_public_tree(app, ['public/misc/big_house.png'])
+    ingest(app, workers=0)
+    image = Image.query.filter_by(path='public/misc/big_house.png').one()
+    image.description = 'Public pictogram: big_house.png'
+    db.session.commit()
+
+    ingest(app, workers=0, full=True)
+
+    db.session.refresh(image)
+    assert image.description == 'Big house'
+
+
+def test_ingest_with_process_pool(app):
+    files = [f'public/many/picto_{i}.png' for i in range(12)]
+    _make_public_tree(app, files)
+
+    stats = ingest(app, workers=2, batch_size=5)
+
+    assert stats['images_added'] == 12
+    assert stats['thumbnail_errors'] == 0
+    thumbs = Path(app.config['PICTOGRAMS_PATH_MIN'])
+    assert all((thumbs / Path(f).with_suffix('.png')).exists() for f in files)
+
+
+def test_ingest_manifest_tracks_changes(app):
+    pictos = _make_public_tree(app, ['public/set/a.png', 'public/set/b.png', 'public/set/old/c.png'])
+    thumbs = Path(app.config['PICTOGRAMS_PATH_MIN'])
+    ingest(app, workers=0)
+    manifest = json.loads((pictos / MANIFEST_NAME).read_text())
+    assert set(manifest) == {'public/set/a.png', 'public/set/b.png', 'public/set/old/c.png'}
+
+    # Touched but identical: hashed again, not reprocessed
+    os.utime(pictos / 'public/set/a.png', ns=(1, 1))
+    # Modified content: thumbnail regenerated
+    PILImage.new('RGB', (20, 64), color='red').save(pictos / 'public/set/b.png')
+    # Removed file and removed folder
+    (pictos / 'public/set/old/c.png').unlink()
+    (pictos / 'public/set/old').rmdir()
+
+    stats = ingest(app, workers=0)
+
+    assert stats['images_updated'] == 1
+    assert stats['images_removed'] == 1
+    assert stats['thumbnails'] == 1
+    with PILImage.open(thumbs / 'public/set/b.png') as thumb:
+        assert thumb.size == (15, 48)
+    assert Image.query.filter_by(path='public/set/old/c.png').first() is None
+    assert Folder.query.filter_by(path='public/set/old').first() is None
+    assert not (thumbs / 'public/set/old/c.png').exists()
+    manifest = json.loads((pictos / MANIFEST_NAME).read_text())
+    assert set(manifest) == {'public/set/a.png', 'public/set/b.png'}
+    assert manifest['public/set/a.png']['mtime'] == 1
+
+
+def test_ingest_recreates_missing_thumbnail_of_known_image(app):
+    _make_public_tree(app, ['public/known/x.png'])
+    ingest(app, workers=0)
+    thumb = Path(app.config['PICTOGRAMS_PATH_MIN']) / 'public/known/x.png'
+    thumb.unlink()
+
+    stats = ingest(app, workers=0, full=True)
+
+    assert stats['thumbnails'] == 1
+    assert thumb.exists()
+
+
+def test_ingest_full_removes_vanished_images(app):
+    pictos = _make_public_tree(app, ['public/full/a.png', 'public/full/b.png'])
+    ingest(app, workers=0)
+    (pictos / 'public/full/b.png').unlink()
+
+    stats = ingest(app, workers=0, full=True)
+
+    assert stats['images_removed'] == 1
+    assert Image.query.filter_by(path='public/full/b.png').first() is None
+    assert Image.query.filter_by(path='public/full/a.png').first() is not None
+    assert not (Path(app.config['PICTOGRAMS_PATH_MIN']) / 'public/full/b.png').exists()
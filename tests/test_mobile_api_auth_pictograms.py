@@ -1,5 +1,5 @@
 from pathlib import Path
-from tests.conftest import create_user, confirm_user
+from tests.conftest import create_user, confirm_user, login
 
 def test_mobile_pictograms_auth(client, app):
     # Setup user
@@ -52,3 +52,166 @@ def test_mobile_pictograms_auth(client, app):
     # TEST: Path traversal attack (Secured via posix normalization on send_from_directory usually, but explicitly verified)
     r4 = client.get('/api/v1/mobile/pictograms/../config.py', headers=headers)
     assert r4.status_code in [400, 403, 404] 
+
+
+def test_mobile_pictogram_description_header(client, app):
+    import urllib.parse
+    from app import db
+    from app.cache import description_cache
+    from app.models import Image
+
+    user = create_user(client, 'desc_tester', 'Password123')
+    confirm_user(client, user.email)
+    token = client.post('/api/v1/mobile/login', json={'username': 'desc_tester', 'password': 'Password123'}).get_json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    picto_dir = Path(app.config['PICTOGRAMS_PATH'])
+    (picto_dir / 'public' / 'arasaac').mkdir(parents=True, exist_ok=True)
+    (picto_dir / 'public' / 'arasaac' / '1234_manger_du_pain.png').write_text("data")
+    (picto_dir / 'desc_tester').mkdir(parents=True, exist_ok=True)
+    (picto_dir / 'desc_tester' / 'dog.png').write_text("data")
+    description_cache.clear()
+
+    # Not in DB: description derived from the bank file name
+    r = client.get('/api/v1/mobile/pictograms/public/arasaac/1234_manger_du_pain.png', headers=headers)
+    assert urllib.parse.unquote(r.headers['X-Image-Description']) == 'Manger du pain'
+
+    # Exact path match only: a longer path ending with the same suffix is not used
+    image = Image(name='dog.png', path='desc_tester/dog.png', description='Mon chien', user_id=user.id)
+    decoy = Image(name='dog.png', path='other/desc_tester/dog.png', description='Wrong', user_id=user.id)
+    db.session.add_all([decoy, image])
+    db.session.commit()
+    r = client.get('/api/v1/mobile/pictograms/desc_tester/dog.png', headers=headers)
+    assert urllib.parse.unquote(r.headers['X-Image-Description']) == 'Mon chien'
+
+    # Editing the image invalidates the cached description
+    login(client, 'desc_tester', 'Password123')
+    client.put(f'/api/image/{image.id}', json={'description': 'Le chien'})
+    r = client.get('/api/v1/mobile/pictograms/desc_tester/dog.png', headers=headers)
+    assert urllib.parse.unquote(r.headers['X-Image-Description']) == 'Le chien'
+
+
+def test_mobile_pictograms_authorize_from_token_claims(client, app):
+    from flask_jwt_extended import create_access_token, decode_token
+    from sqlalchemy import event
+    from app import db
+
+    user = create_user(client, 'claims_user', 'Password123')
+    confirm_user(client, user.email)
+    token = client.post('/api/v1/mobile/login', json={'username': 'claims_user', 'password': 'Password123'}).get_json()['access_token']
+    claims = decode_token(token)
+    assert (claims['username'], claims['confirmed']) == ('claims_user', True)
+
+    user_dir = Path(app.config['PICTOGRAMS_PATH']) / 'claims_user'
+    user_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(3):
+        (user_dir / f'pic{i}.png').write_text(f"data {i}")
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        for i in range(3):
+            r = client.get(f'/api/v1/mobile/pictograms/claims_user/pic{i}.png', headers={'Authorization': f'Bearer {token}'})
+            assert r.status_code == 200
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert not [s for s in statements if 'FROM user' in s]
+
+    # Jetons émis avant l'ajout des claims : repli sur la base
+    legacy = create_access_token(identity=str(user.id))
+    r = client.get('/api/v1/mobile/pictograms/claims_user/pic0.png', headers={'Authorization': f'Bearer {legacy}'})
+    assert r.status_code == 200
+
+
+def test_mobile_pictogram_size_variants(client, app):
+    import io
+    import os
+    from PIL import Image as PILImage
+
+    user = create_user(client, 'grid_user', 'Password123')
+    confirm_user(client, user.email)
+    token = client.post('/api/v1/mobile/login', json={'username': 'grid_user', 'password': 'Password123'}).get_json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    picto_dir = Path(app.config['PICTOGRAMS_PATH'])
+    for relative in ('public/grand.png', 'grid_user/perso.jpg', 'other_user/secret.png'):
+        (picto_dir / relative).parent.mkdir(parents=True, exist_ok=True)
+        PILImage.new('RGB', (600, 300), 'red').save(picto_dir / relative)
+    (picto_dir / 'public/broken.png').write_text("not an image")
+
+    r = client.get('/api/v1/mobile/pictograms/public/grand.png?size=128')
+    assert r.status_code == 200 and r.mimetype == 'image/png'
+    assert PILImage.open(io.BytesIO(r.data)).size == (128, 64)
+    assert 'X-Image-Description' in r.headers
+    variant = Path(app.config['PICTOGRAMS_PATH_MIN']) / '.sizes' / '128' / 'public' / 'grand.png'
+    assert variant.is_file()
+
+    # Réutilisée tant que la source ne change pas, régénérée ensuite
+    built = variant.stat().st_mtime_ns
+    client.get('/api/v1/mobile/pictograms/public/grand.png?size=128')
+    assert variant.stat().st_mtime_ns == built
+    PILImage.new('RGB', (100, 400), 'blue').save(picto_dir / 'public/grand.png')
+    os.utime(picto_dir / 'public/grand.png', ns=(built + 10**9, built + 10**9))
+    r = client.get('/api/v1/mobile/pictograms/public/grand.png?size=128')
+    assert PILImage.open(io.BytesIO(r.data)).size == (32, 128)
+
+    r = client.get('/api/v1/mobile/pictograms/grid_user/perso.jpg?size=64', headers=headers)
+    assert r.status_code == 200 and PILImage.open(io.BytesIO(r.data)).size == (64, 32)
+
+    # Mêmes règles d'accès qu'avec l'original
+    assert client.get('/api/v1/mobile/pictograms/grid_user/perso.jpg?size=64').status_code == 401
+    assert client.get('/api/v1/mobile/pictograms/other_user/secret.png?size=64', headers=headers).status_code == 403
+    assert not (Path(app.config['PICTOGRAMS_PATH_MIN']) / '.sizes' / '64' / 'other_user').exists()
+
+    for size in ('100', '²', '', '-64'):
+        assert client.get(f'/api/v1/mobile/pictograms/public/grand.png?size={size}').status_code == 400
+    assert client.get('/api/v1/mobile/pictograms/public/absent.png?size=128').status_code == 404
+    # Source illisible : l'original est servi tel quel
+    assert client.get('/api/v1/mobile/pictograms/public/broken.png?size=128').data == b"not an image"
+
+
+def test_mobile_pictogram_variant_follows_source_content(client, app):
+    import io
+    import os
+    from PIL import Image as PILImage
+    from app.models import Folder
+
+    user = create_user(client, 'variant_user', 'Password123')
+    confirm_user(client, user.email)
+    login(client, 'variant_user', 'Password123')
+    token = client.post('/api/v1/mobile/login', json={'username': 'variant_user', 'password': 'Password123'}).get_json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    root_folder = Folder.query.filter_by(user_id=user.id, parent_id=None).first()
+
+    def upload(color):
+        img_io = io.BytesIO()
+        PILImage.new('RGB', (200, 200), color).save(img_io, 'PNG')
+        img_io.seek(0)
+        r = client.post('/api/image/upload', data={'folder_id': root_folder.id, 'file': (img_io, 'a.png')},
+                        content_type='multipart/form-data')
+        return r.get_json()['image']
+
+    def variant_color():
+        r = client.get('/api/v1/mobile/pictograms/variant_user/a.png?size=64', headers=headers)
+        return PILImage.open(io.BytesIO(r.data)).convert('RGB').getpixel((10, 10))
+
+    image = upload('red')
+    assert variant_color() == (255, 0, 0)
+    variant = Path(app.config['PICTOGRAMS_PATH_MIN']) / '.sizes' / '64' / 'variant_user' / 'a.png'
+    assert variant.is_file()
+
+    # Supprimée avec l'image
+    assert client.delete('/api/item/delete', json={'id': image['id'], 'type': 'image'}).status_code == 200
+    assert not variant.exists()
+
+    upload('blue')
+    assert variant_color() == (0, 0, 255)
+
+    # Source liée à un blob plus ancien que la déclinaison : c'est le contenu qui compte
+    source = Path(app.config['PICTOGRAMS_PATH']) / 'variant_user' / 'a.png'
+    source.unlink()
+    PILImage.new('RGB', (200, 200), 'lime').save(source)
+    os.utime(source, ns=(10**9, 10**9))
+    assert variant_color() == (0, 255, 0)
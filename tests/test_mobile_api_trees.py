@@ -1,4 +1,5 @@
 import json
+from sqlalchemy import event
 from app import db
 from app.models import Tree, User
 from tests.conftest import create_user, confirm_user
@@ -83,3 +84,41 @@ def test_mobile_trees_api(client, app):
     assert children[0]['node_id'] == 'child_1'
     assert children[0]['label'] == 'Manger'
     assert children[0]['children'] == []
+
+
+def test_mobile_tree_listing_uses_the_stored_root_path(client, app):
+    user = create_user(client, 'lister', 'Password123')
+    confirm_user(client, user.email)
+    token = client.post('/api/v1/mobile/login', json={'username': 'lister', 'password': 'Password123'}).get_json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    owner = User.query.filter_by(username='lister').one()
+    trees = [
+        Tree(user_id=owner.id, name='local', is_public=True, json_data='{}', root_url='/pictograms/public/../public/a.png?v=2'),
+        Tree(user_id=owner.id, name='arasaac', is_public=True, json_data='{}',
+             root_url='https://static.arasaac.org/pictograms/2426/2426_300.png'),
+        Tree(user_id=None, name='system', is_public=True, json_data='{}'),
+    ]
+    db.session.add_all(trees)
+    db.session.commit()
+    assert [t.root_path for t in trees] == ['public/a.png', 'https://static.arasaac.org/pictograms/2426/2426_300.png', None]
+    trees[0].root_url = '/pictograms/lister/b.png'
+    db.session.commit()
+    assert trees[0].root_path == 'lister/b.png'
+
+    statements = []
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        listing = client.get('/api/v1/mobile/trees', headers=headers).get_json()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+    assert [(t['name'], t['owner'], t['root_image_url']) for t in listing] == [
+        ('local', 'lister', 'http://localhost/api/v1/mobile/pictograms/lister/b.png'),
+        ('arasaac', 'lister', 'https://static.arasaac.org/pictograms/2426/2426_300.png'),
+        ('system', 'System', ''),
+    ]
+    # Arbres et propriétaires en une seule requête
+    assert len(statements) == 1
@@ -0,0 +1,55 @@
+import json
+from sqlalchemy import event
+from app import db
+from app.models import Tree, User
+from tests.conftest import mobile_token
+
+
+def _tree(user_id, name, is_public=False, json_data=None):
+    data = json_data or json.dumps({'roots': [{'id': 1, 'text': name, 'image': '/pictograms/public/a.png', 'children': []}]})
+    tree = Tree(user_id=user_id, name=name, is_public=is_public, json_data=data)
+    db.session.add(tree)
+    db.session.commit()
+    return tree
+
+
+def _batch(client, headers, ids):
+    return client.get('/api/v1/mobile/trees/batch', headers=headers, query_string={'ids': ids})
+
+
+def test_batch_returns_documents_in_order_with_per_item_errors(client, app):
+    headers = mobile_token(client, 'lecteur')
+    mobile_token(client, 'voisin')
+    user = User.query.filter_by(username='lecteur').one()
+    other = User.query.filter_by(username='voisin').one()
+    mine = _tree(user.id, 'maison')
+    shared = _tree(other.id, 'parc', is_public=True)
+    hidden = _tree(other.id, 'secret')
+    broken = _tree(user.id, 'cassé', json_data='{pas du json')
+
+    ids = f'{shared.id},{mine.id},{hidden.id},999,{broken.id},{mine.id}'
+    statements = []
+    def count(conn, cursor, statement, *args):
+        if 'FROM tree' in statement:
+            statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        response = _batch(client, headers, ids)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [document['tree_id'] for document in body['trees']] == [shared.id, mine.id]
+    assert body['trees'][1] == client.get(f'/api/v1/mobile/trees/{mine.id}', headers=headers).get_json()
+    assert [(error['tree_id'], error['status']) for error in body['errors']] == [
+        (hidden.id, 403), (999, 404), (broken.id, 500)]
+    assert len(statements) == 1
+
+
+def test_batch_rejects_invalid_ids(client, app):
+    headers = mobile_token(client, 'pressé')
+    for ids in ('', 'a,b', '1,-2', '²', '1,²'):
+        assert _batch(client, headers, ids).status_code == 400
+    assert _batch(client, headers, ','.join(str(i) for i in range(1, 52))).status_code == 400
+    assert client.get('/api/v1/mobile/trees/batch?ids=1').status_code == 401
@@ -0,0 +1,164 @@
+import io
+import json
+import os
+import time
+import zipfile
+from pathlib import Path
+from PIL import Image as PILImage
+from app import bundles, db
+from app.bundles import BUNDLE_STALE_AFTER
+from app.models import Image, Tree, User
+from tests.conftest import mobile_token
+
+
+def _picture(app, relative, color='red'):
+    path = Path(app.config['PICTOGRAMS_PATH']) / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    PILImage.new('RGB', (8, 8), color).save(path)
+    return path
+
+
+def _node(id, image, children=()):
+    return {'id': id, 'text': f'noeud {id}', 'image': image, 'children': list(children)}
+
+
+def _bundle(client, headers, tree_id):
+    return client.get(f'/api/v1/mobile/trees/{tree_id}/bundle', headers=headers)
+
+
+def test_bundle_holds_the_tree_and_every_pictogram(client, app, monkeypatch):
+    headers = mobile_token(client, 'voyageur')
+    other = mobile_token(client, 'curieux')
+    user = User.query.filter_by(username='voyageur').one()
+    _picture(app, 'public/repas/manger.png')
+    _picture(app, 'voyageur/perso.png', 'blue')
+    db.session.add(Image(name='manger.png', path='public/repas/manger.png', description='Manger', is_public=True))
+    db.session.commit()
+    arasaac_png = _picture(app, 'stub/2426.png', 'green')
+    monkeypatch.setattr('app.bundles.arasaac.fetch_pictogram', lambda picto_id: arasaac_png)
+
+    roots = [_node(1, '/pictograms/voyageur/perso.png', [
+        _node(2, '/pictograms/public/repas/manger.png'),
+        _node(3, '/pictograms/public/repas/manger.png'),
+        _node(4, 'https://static.arasaac.org/pictograms/2426/2426_300.png'),
+        _node(5, '/pictograms/public/absent.png'),
+    ])]
+    tree = Tree(user_id=user.id, name='Repas', is_public=True, json_data=json.dumps({'roots': roots}))
+    db.session.add(tree)
+    db.session.commit()
+
+    response = _bundle(client, headers, tree.id)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    bundle = zipfile.ZipFile(io.BytesIO(response.data))
+    assert sorted(bundle.namelist()) == [
+        'manifest.json', 'pictograms/arasaac/2426.png', 'pictograms/public/repas/manger.png',
+        'pictograms/voyageur/perso.png', 'tree.json']
+
+    document = json.loads(bundle.read('tree.json'))
+    assert document == client.get(f'/api/v1/mobile/trees/{tree.id}', headers=headers).get_json()
+    manifest = json.loads(bundle.read('manifest.json'))
+    pictograms = manifest['pictograms']
+    manger_url = document['root_node']['children'][0]['image_url']
+    assert pictograms[manger_url] == {'file': 'pictograms/public/repas/manger.png', 'description': 'Manger'}
+    assert pictograms[document['root_node']['image_url']]['description'] == 'Perso'
+    assert [url.rsplit('/', 1)[-1] for url in manifest['missing']] == ['absent.png']
+    assert bundle.read('pictograms/public/repas/manger.png') == (
+        Path(app.config['PICTOGRAMS_PATH']) / 'public/repas/manger.png').read_bytes()
+
+    # Un autre utilisateur n'obtient pas les images privées du propriétaire
+    names = zipfile.ZipFile(io.BytesIO(_bundle(client, other, tree.id).data)).namelist()
+    assert 'pictograms/voyageur/perso.png' not in names
+
+
+def test_bundle_is_cached_by_content(client, app):
+    headers = mobile_token(client, 'cache')
+    user = User.query.filter_by(username='cache').one()
+    picture = _picture(app, 'public/lune.png')
+    tree = Tree(user_id=user.id, name='Nuit', json_data=json.dumps({'roots': [_node(1, '/pictograms/public/lune.png')]}))
+    db.session.add(tree)
+    db.session.commit()
+
+    first = _bundle(client, headers, tree.id)
+    etag = first.headers['ETag']
+    bundles = Path(app.config['PICTOGRAMS_PATH']) / '.bundles'
+    built = list(bundles.glob('*.zip'))
+    assert len(built) == 1
+
+    assert _bundle(client, {**headers, 'If-None-Match': etag}, tree.id).status_code == 304
+    assert _bundle(client, headers, tree.id).headers['ETag'] == etag
+    assert list(bundles.glob('*.zip')) == built
+
+    # Image modifiée : nouveau paquet ; l'ancien reste tant qu'il a pu servir récemment
+    PILImage.new('RGB', (16, 16), 'white').save(picture)
+    changed = _bundle(client, headers, tree.id)
+    assert changed.headers['ETag'] != etag
+    assert len(list(bundles.glob('*.zip'))) == 2
+
+    # Une fois inutilisé depuis BUNDLE_STALE_AFTER, la construction suivante le supprime
+    old = time.time() - BUNDLE_STALE_AFTER - 60
+    os.utime(built[0], (old, old))
+    PILImage.new('RGB', (24, 24), 'black').save(picture)
+    _bundle(client, headers, tree.id)
+    assert not built[0].exists()
+    assert len(list(bundles.glob('*.zip'))) == 2
+
+
+def test_bundle_deleted_after_building_is_still_sent(client, app, monkeypatch):
+    headers = mobile_token(client, 'concurrent')
+    user = User.query.filter_by(username='concurrent').one()
+    _picture(app, 'public/soleil.png')
+    tree = Tree(user_id=user.id, name='Jour', json_data=json.dumps({'roots': [_node(1, '/pictograms/public/soleil.png')]}))
+    db.session.add(tree)
+    db.session.commit()
+
+    # Un autre processus supprime le paquet juste après son ouverture
+    real_tree_bundle = bundles.tree_bundle
+    def racing_tree_bundle(*args):
+        bundle, fingerprint = real_tree_bundle(*args)
+        Path(bundle.name).unlink()
+        return bundle, fingerprint
+    monkeypatch.setattr('app.routes.mobile_api.tree_bundle', racing_tree_bundle)
+
+    response = _bundle(client, headers, tree.id)
+    assert response.status_code == 200
+    assert zipfile.ZipFile(io.BytesIO(response.data)).namelist()[0] == 'tree.json'
+
+
+def test_bundle_access_rules(client, app):
+    headers = mobile_token(client, 'owner')
+    other = mobile_token(client, 'intrus')
+    user = User.query.filter_by(username='owner').one()
+    tree = Tree(user_id=user.id, name='Privé', is_public=False, json_data=json.dumps({'roots': []}))
+    db.session.add(tree)
+    db.session.commit()
+
+    assert _bundle(client, other, tree.id).status_code == 403
+    assert _bundle(client, headers, 999).status_code == 404
+    assert client.get(f'/api/v1/mobile/trees/{tree.id}/bundle').status_code == 401
+    bundle = zipfile.ZipFile(io.BytesIO(_bundle(client, headers, tree.id).data))
+    assert json.loads(bundle.read('tree.json'))['root_node'] is None
+
+
+def test_bundle_never_includes_another_users_private_pictograms(client, app):
+    headers = mobile_token(client, 'bob')
+    mobile_token(client, 'alice')
+    bob = User.query.filter_by(username='bob').one()
+    _picture(app, 'alice/secret.png')
+    _picture(app, 'public/ok.png')
+    local = 'http://localhost/api/v1/mobile/pictograms/'
+    roots = [_node(1, f'{local}public/ok.png', [
+        _node(2, f'{local}alice/secret.png'),
+        _node(3, f'{local}bob/../alice/secret.png'),
+        _node(4, f'{local}public/../alice/secret.png'),
+        _node(5, '/pictograms/alice/secret.png'),
+    ])]
+    tree = Tree(user_id=bob.id, name='Vol', is_public=False, json_data=json.dumps({'roots': roots}))
+    db.session.add(tree)
+    db.session.commit()
+
+    assert client.get('/api/v1/mobile/pictograms/alice/secret.png', headers=headers).status_code == 403
+    bundle = zipfile.ZipFile(io.BytesIO(_bundle(client, headers, tree.id).data))
+    assert [name for name in bundle.namelist() if name.startswith('pictograms/')] == ['pictograms/public/ok.png']
+    manifest = json.loads(bundle.read('manifest.json'))
+    assert len(manifest['missing']) == 3
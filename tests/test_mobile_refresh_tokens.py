@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, UTC
+from app import db
+from app.models import RefreshToken, User
+from tests.conftest import create_user, confirm_user, login
+
+
+def _login(client, username):
+    create_user(client, username, 'Password123')
+    confirm_user(client, f'{username}@test.com')
+    response = client.post('/api/v1/mobile/login', json={'username': username, 'password': 'Password123'})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _refresh(client, refresh_token):
+    return client.post('/api/v1/mobile/token/refresh', json={'refresh_token': refresh_token})
+
+
+def test_refresh_rotates_without_checking_the_password(client, app, monkeypatch):
+    tokens = _login(client, 'mobile')
+    assert tokens['refresh_token']
+
+    def no_password_check(*args):
+        raise AssertionError('le renouvellement ne doit pas vérifier le mot de passe')
+    monkeypatch.setattr(User, 'check_password', no_password_check)
+
+    response = _refresh(client, tokens['refresh_token'])
+    assert response.status_code == 200
+    renewed = response.get_json()
+    assert renewed['refresh_token'] != tokens['refresh_token']
+    trees = client.get('/api/v1/mobile/trees', headers={'Authorization': f"Bearer {renewed['access_token']}"})
+    assert trees.status_code == 200
+
+    # Seule l'empreinte est stockée
+    stored = RefreshToken.query.all()
+    assert len(stored) == 2 and len({token.family for token in stored}) == 1
+    assert all(token.token_hash not in (tokens['refresh_token'], renewed['refresh_token']) for token in stored)
+
+
+def test_reusing_a_rotated_token_revokes_the_family(client, app):
+    tokens = _login(client, 'stolen')
+    renewed = _refresh(client, tokens['refresh_token']).get_json()
+
+    replay = _refresh(client, tokens['refresh_token'])
+    assert replay.status_code == 401
+    assert replay.get_json()['code'] == 'REFRESH_TOKEN_REUSED'
+    # Le jeton légitime le plus récent est révoqué lui aussi
+    response = _refresh(client, renewed['refresh_token'])
+    assert response.status_code == 401
+    assert response.get_json()['code'] == 'INVALID_REFRESH_TOKEN'
+
+    # Une autre connexion (autre famille) n'est pas touchée
+    other = client.post('/api/v1/mobile/login', json={'username': 'stolen', 'password': 'Password123'}).get_json()
+    assert _refresh(client, other['refresh_token']).status_code == 200
+
+
+def test_logout_and_expiry_invalidate_the_token(client, app):
+    tokens = _login(client, 'leaving')
+    assert client.post('/api/v1/mobile/logout', json={'refresh_token': tokens['refresh_token']}).status_code == 200
+    assert _refresh(client, tokens['refresh_token']).status_code == 401
+
+    tokens = client.post('/api/v1/mobile/login', json={'username': 'leaving', 'password': 'Password123'}).get_json()
+    RefreshToken.query.filter_by(revoked_at=None).update({'expires_at': datetime.now(UTC) - timedelta(minutes=1)})
+    db.session.commit()
+    response = _refresh(client, tokens['refresh_token'])
+    assert response.status_code == 401
+    assert response.get_json()['code'] == 'INVALID_REFRESH_TOKEN'
+
+    assert _refresh(client, 'inconnu').status_code == 401
+    assert client.post('/api/v1/mobile/token/refresh', json={}).status_code == 400
+
+
+def test_refresh_and_logout_reject_non_string_tokens(client, app):
+    for body in ({'refresh_token': 123}, {'refresh_token': ['x']}, {'refresh_token': {}}, ['x'], 'x'):
+        for url in ('/api/v1/mobile/token/refresh', '/api/v1/mobile/logout'):
+            response = client.post(url, json=body)
+            assert response.status_code == 400
+            assert 'error' in response.get_json()
+
+
+def test_password_change_revokes_refresh_tokens(client, app):
+    tokens = _login(client, 'careful')
+    login(client, 'careful', 'Password123')
+    client.post('/change_password', data={
+        'current_password': 'Password123',
+        'new_password': 'NewPassword456',
+        'new_password2': 'NewPassword456',
+    })
+    assert User.query.filter_by(username='careful').one().check_password('NewPassword456')
+    assert _refresh(client, tokens['refresh_token']).status_code == 401
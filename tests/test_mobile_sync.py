@@ -0,0 +1,103 @@
+import json
+from app import db
+from app.models import Tree, TreeTombstone, User
+from app.sync import changes_since
+from tests.conftest import mobile_token
+
+
+def _tree(user_id, name, **fields):
+    data = {'roots': [{'id': 1, 'text': name, 'image': '/pictograms/public/a.png', 'children': []}]}
+    tree = Tree(user_id=user_id, name=name, root_id=-1, json_data=json.dumps(data), **fields)
+    db.session.add(tree)
+    db.session.commit()
+    return tree
+
+
+def _sync(client, headers, **params):
+    response = client.get('/api/v1/mobile/trees/sync', headers=headers, query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_every_tree_write_gets_a_new_version(app):
+    user = User(username='owner', email='owner@test.com')
+    db.session.add(user)
+    db.session.commit()
+    first = _tree(user.id, 'un')
+    second = _tree(user.id, 'deux')
+    assert 0 < first.sync_version < second.sync_version
+
+    first.name = 'un bis'
+    db.session.commit()
+    assert first.sync_version > second.sync_version
+
+    db.session.delete(second)
+    db.session.commit()
+    tombstone = TreeTombstone.query.one()
+    assert tombstone.tree_id == second.id and tombstone.user_id == user.id
+    assert tombstone.sync_version > first.sync_version
+
+
+def test_sync_returns_changes_and_deletions_since_the_watermark(client, app):
+    headers = mobile_token(client, 'phone')
+    other_headers = mobile_token(client, 'other')
+    user = User.query.filter_by(username='phone').one()
+    other = User.query.filter_by(username='other').one()
+    kept = _tree(user.id, 'maison')
+    removed = _tree(user.id, 'école', is_public=True)
+    _tree(other.id, 'ailleurs', is_public=True)
+
+    full = _sync(client, headers, documents='true')
+    assert [t['name'] for t in full['trees']] == ['maison', 'école']
+    assert full['deleted'] == [] and not full['has_more']
+    assert full['trees'][0]['document']['root_node']['label'] == 'maison'
+    assert full['trees'][0]['version'] < full['trees'][1]['version'] == full['watermark']
+
+    # Rien de neuf : réponse vide, même watermark
+    assert _sync(client, headers, since=full['watermark']) == {
+        'since': full['watermark'], 'watermark': full['watermark'], 'has_more': False, 'trees': [], 'deleted': []}
+
+    kept.json_data = json.dumps({'roots': []})
+    db.session.commit()
+    assert client.delete(f'/api/v1/mobile/trees/{removed.id}', headers=other_headers).status_code == 403
+    assert client.delete(f'/api/v1/mobile/trees/{removed.id}', headers=headers).status_code == 200
+    assert client.delete(f'/api/v1/mobile/trees/{removed.id}', headers=headers).status_code == 404
+
+    delta = _sync(client, headers, since=full['watermark'])
+    assert [t['id'] for t in delta['trees']] == [kept.id]
+    assert 'document' not in delta['trees'][0]
+    assert [d['id'] for d in delta['deleted']] == [removed.id]
+    assert delta['watermark'] == delta['deleted'][0]['version']
+    # L'autre utilisateur ne reçoit que ses propres arbres
+    assert [t['name'] for t in _sync(client, other_headers)['trees']] == ['ailleurs']
+
+
+def test_sync_pages_in_version_order(client, app):
+    headers = mobile_token(client, 'tablet')
+    user = User.query.filter_by(username='tablet').one()
+    trees = [_tree(user.id, f'arbre {i}') for i in range(5)]
+    since = trees[0].sync_version
+    db.session.delete(trees[1])
+    db.session.commit()
+
+    seen, deleted, pages = [], [], 0
+    while True:
+        page = _sync(client, headers, since=since, limit=2)
+        seen += [t['name'] for t in page['trees']]
+        deleted += [d['id'] for d in page['deleted']]
+        since, pages = page['watermark'], pages + 1
+        if not page['has_more']:
+            break
+    assert seen == ['arbre 2', 'arbre 3', 'arbre 4']
+    assert deleted == [trees[1].id]
+    assert pages == 2
+
+    assert changes_since(user.id, 0).tombstones == []
+
+
+def test_sync_rejects_an_invalid_watermark(client):
+    headers = mobile_token(client, 'broken')
+    for since in ('-1', 'abc', '²', '١'):
+        response = client.get('/api/v1/mobile/trees/sync', headers=headers, query_string={'since': since})
+        assert response.status_code == 400
+    assert client.get('/api/v1/mobile/trees/sync').status_code == 401
@@ -0,0 +1,149 @@
+from io import BytesIO
+from pathlib import Path
+from PIL import Image as PILImage
+from app import db
+from app.models import Image, ImageBlob, User
+from app.normalize import NormalizeSettings, filename_for_format, normalize_image
+from app.storage import blob_path
+from tests.conftest import login_new_user
+
+
+def _photo_io(size=(1600, 900), exif=True):
+    img = PILImage.new('RGB', size, color='orange')
+    img_io = BytesIO()
+    if exif:
+        metadata = PILImage.Exif()
+        metadata[0x010F] = 'CameraMaker'  # Make
+        img.save(img_io, 'JPEG', exif=metadata.tobytes())
+    else:
+        img.save(img_io, 'JPEG')
+    img_io.seek(0)
+    return img_io
+
+
+def _upload(client, folder_id, image_io, filename='photo.jpg'):
+    data = {'folder_id': folder_id, 'file': (image_io, filename)}
+    response = client.post('/api/image/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    return response.get_json()['image']
+
+
+def test_normalize_image_caps_edge_and_strips_metadata(tmp_path):
+    source = tmp_path / 'photo.jpg'
+    source.write_bytes(_photo_io().getvalue())
+    settings = NormalizeSettings(max_edge=400, image_format='WEBP', quality=80, keep_original=False)
+
+    result = normalize_image(source, tmp_path, settings)
+
+    with PILImage.open(result) as img:
+        assert img.format == 'WEBP'
+        assert img.size == (400, 225)
+        assert not img.getexif()
+    assert Path(result).stat().st_size < source.stat().st_size
+
+
+def test_normalize_image_keeps_small_image_when_no_gain(tmp_path):
+    source = tmp_path / 'tiny.png'
+    PILImage.new('RGB', (4, 4), color='white').save(source, 'PNG', optimize=True)
+    settings = NormalizeSettings(max_edge=400, image_format='PNG', quality=80, keep_original=False)
+
+    assert normalize_image(source, tmp_path, settings) is None
+    assert list(tmp_path.iterdir()) == [source]
+
+
+def test_normalize_image_strips_metadata_even_without_gain(tmp_path):
+    source = tmp_path / 'tiny.jpg'
+    metadata = PILImage.Exif()
+    metadata[0x010F] = 'CameraMaker'  # Make
+    PILImage.new('RGB', (4, 4), color='white').save(source, 'JPEG', exif=metadata.tobytes(), quality=10)
+    settings = NormalizeSettings(max_edge=400, image_format='JPEG', quality=95, keep_original=False)
+
+    result = normalize_image(source, tmp_path, settings)
+
+    assert result is not None
+    with PILImage.open(result) as img:
+        assert not img.getexif() and 'exif' not in img.info
+
+
+def test_filename_for_format():
+    assert filename_for_format('photo.jpg', 'WEBP') == 'photo.webp'
+    assert filename_for_format('photo.JPEG', 'JPEG') == 'photo.JPEG'
+    assert filename_for_format('fake.png', 'JPEG') == 'fake.jpg'
+
+
+def test_upload_is_normalized_when_enabled(client, app):
+    app.config.update(IMAGE_NORMALIZE=True, IMAGE_MAX_EDGE=512)
+    root_folder = login_new_user(client, 'normalizer')
+
+    image = _upload(client, root_folder.id, _photo_io())
+
+    assert image['name'] == 'photo.webp'
+    assert image['path'].endswith('photo.webp')
+    with PILImage.open(Path(app.config['PICTOGRAMS_PATH']) / image['path']) as img:
+        assert img.format == 'WEBP'
+        assert max(img.size) == 512
+    # Original not kept by default
+    assert db.session.get(Image, image['id']).original_blob_id is None
+    assert ImageBlob.query.count() == 1
+
+
+def test_upload_keeps_original_when_configured(client, app):
+    app.config.update(IMAGE_NORMALIZE=True, IMAGE_MAX_EDGE=512, IMAGE_KEEP_ORIGINAL=True)
+    root_folder = login_new_user(client, 'keeper')
+
+    image = _upload(client, root_folder.id, _photo_io())
+
+    stored = db.session.get(Image, image['id'])
+    assert stored.original_blob is not None
+    with PILImage.open(blob_path(stored.original_blob)) as original:
+        assert original.size == (1600, 900)
+    assert stored.original_blob.extension == '.jpg'
+
+    # Deleting the image releases both blobs
+    response = client.delete('/api/item/delete', json={'id': image['id'], 'type': 'image'})
+    assert response.status_code == 200
+    db.session.expire_all()
+    assert ImageBlob.query.count() == 0
+
+
+def test_user_max_edge_setting(client, app):
+    app.config.update(IMAGE_NORMALIZE=True, IMAGE_MAX_EDGE=512)
+    root_folder = login_new_user(client, 'custom_edge')
+
+    response = client.post('/image_settings', data={'image_max_edge': 300}, follow_redirects=True)
+    assert response.status_code == 200
+    assert User.query.filter_by(username='custom_edge').first().image_max_edge == 300
+
+    image = _upload(client, root_folder.id, _photo_io())
+    with PILImage.open(Path(app.config['PICTOGRAMS_PATH']) / image['path']) as img:
+        assert max(img.size) == 300
+
+    # 0 keeps the original dimensions, metadata is still stripped
+    client.post('/image_settings', data={'image_max_edge': 0}, follow_redirects=True)
+    image = _upload(client, root_folder.id, _photo_io(), 'other.jpg')
+    with PILImage.open(Path(app.config['PICTOGRAMS_PATH']) / image['path']) as img:
+        assert img.size == (1600, 900)
+        assert not img.getexif()
+
+
+def test_ingest_normalization_does_not_merge_files_with_the_same_stem(app):
+    from add_test_images import ingest
+    app.config.update(IMAGE_NORMALIZE=True, IMAGE_MAX_EDGE=64)
+    folder = Path(app.config['PICTOGRAMS_PATH']) / 'public' / 'doubles'
+    folder.mkdir(parents=True)
+    PILImage.new('RGB', (200, 200), color='red').save(folder / 'a.png')
+    PILImage.new('RGB', (200, 200), color='blue').save(folder / 'a.jpg')
+
+    stats = ingest(app, workers=0)
+
+    assert stats['images_added'] == 2
+    assert sorted(p.name for p in folder.iterdir()) == ['a.webp', 'a_1.webp']
+    images = Image.query.filter(Image.path.like('public/doubles/%')).all()
+    assert sorted(image.name for image in images) == ['a.webp', 'a_1.webp']
+    # Les deux contenus sont conservés : un rouge, un bleu
+    dominant = set()
+    for image in images:
+        with PILImage.open(Path(app.config['PICTOGRAMS_PATH']) / image.path) as img:
+            red, _, blue = img.convert('RGB').getpixel((0, 0))
+        dominant.add('red' if red > blue else 'blue')
+    assert dominant == {'red', 'blue'}
@@ -292,3 +292,72 @@ def test_update_image_details_unauthenticated(client):
     # No login
     update_response = client.put('/api/image/1', json={'description': 'test'})
     assert update_response.status_code == 401
+
+# --- POST /api/image/upload/batch ---
+
+def test_upload_images_batch(client, app):
+    """Test uploading several files in one request, with per-file results."""
+    user = create_user(client, 'testuser_batch', 'Password123')
+    confirm_user(client, user.email)
+    login(client, 'testuser_batch', 'Password123')
+    root_folder = Folder.query.filter_by(user_id=user.id, parent_id=None).first()
+
+    data = {
+        'folder_id': root_folder.id,
+        'files': [
+            (create_test_image_io(), 'one.jpg'),
+            (BytesIO(b'not an image'), 'fake.jpg'),
+            (create_test_image_io(), 'two.jpg'),
+        ]
+    }
+    response = client.post('/api/image/upload/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['uploaded'] == 2
+    assert result['failed'] == 1
+    statuses = {item['filename']: item['status'] for item in result['results']}
+    assert statuses == {'one.jpg': 'success', 'fake.jpg': 'error', 'two.jpg': 'success'}
+
+    images = Image.query.filter_by(user_id=user.id).order_by(Image.name).all()
+    assert [image.name for image in images] == ['one.jpg', 'two.jpg']
+    for image in images:
+        assert (Path(app.config['PICTOGRAMS_PATH']) / image.path).exists()
+
+def test_upload_images_batch_respects_quota(client, app):
+    """Test that a batch exceeding the remaining quota is rejected as a whole."""
+    user = create_user(client, 'testuser_batch_quota', 'Password123')
+    confirm_user(client, user.email)
+    login(client, 'testuser_batch_quota', 'Password123')
+    root_folder = Folder.query.filter_by(user_id=user.id, parent_id=None).first()
+
+    app.config['MAX_ITEMS_LIMIT'] = 2 # The root folder already counts as one item
+    data = {
+        'folder_id': root_folder.id,
+        'files': [(create_test_image_io(), 'a.jpg'), (create_test_image_io(), 'b.jpg')]
+    }
+    response = client.post('/api/image/upload/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == 429
+    assert Image.query.filter_by(user_id=user.id).count() == 0
+
+def test_upload_images_batch_rejects_duplicate_names(client, app):
+    """Test that a second file with the same name in one batch is rejected instead of overwriting the first."""
+    user = create_user(client, 'testuser_batch_dup', 'Password123')
+    confirm_user(client, user.email)
+    login(client, 'testuser_batch_dup', 'Password123')
+    root_folder = Folder.query.filter_by(user_id=user.id, parent_id=None).first()
+
+    data = {
+        'folder_id': root_folder.id,
+        'files': [
+            (create_test_image_io(), 'same.jpg'),
+            (create_test_image_io(), 'same.jpg'),
+        ]
+    }
+    response = client.post('/api/image/upload/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['uploaded'] == 1
+    assert result['failed'] == 1
+    assert [item['status'] for item in result['results']] == ['success', 'error']
+
+    assert Image.query.filter_by(user_id=user.id, name='same.jpg').count() == 1
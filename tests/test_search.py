@@ -0,0 +1,350 @@
+import json
+from pathlib import Path
+from PIL import Image as PILImage
+from app import db
+from app.models import Image, PictogramList, Tree, User
+from app.search import (
+    AutocompleteIndex, fts_available, match_expression, public_index, public_library_version, search, search_images, search_page,
+)
+from app.utils import normalize_search_key
+from add_test_images import ingest
+from tests.conftest import create_user, confirm_user, login
+
+
+def _add(**fields):
+    image = Image(path=f"public/{fields['name']}", **fields)
+    db.session.add(image)
+    db.session.commit()
+    return image
+
+
+def _names(images):
+    return [img.name for img in images]
+
+
+def test_fts_index_is_created_with_image_table(app):
+    assert fts_available()
+
+
+def test_match_expression_prefixes_every_word():
+    assert match_expression('pom ver') == '"pom"* "ver"*'
+    assert match_expression('"*-') is None
+
+
+def test_search_matches_prefixes_descriptions_and_folds_accents(app):
+    _add(name='pomme_verte.png', description='Fruit', is_public=True)
+    _add(name='maison.png', description='Été ensoleillé', is_public=True)
+
+    assert _names(search_images('pom')) == ['pomme_verte.png']
+    assert _names(search_images('verte pom')) == ['pomme_verte.png']
+    assert _names(search_images('fruit')) == ['pomme_verte.png']
+    assert _names(search_images('ete')) == ['maison.png']
+    assert search_images('banane') == []
+
+
+def test_search_ranks_name_matches_before_description_matches(app):
+    _add(name='chat_noir.png', description='Un animal', is_public=True)
+    _add(name='panier.png', description='Le panier du chat', is_public=True)
+
+    assert _names(search_images('chat')) == ['chat_noir.png', 'panier.png']
+
+
+def test_search_index_follows_updates_and_deletes(app):
+    image = _add(name='table.png', description='', is_public=True)
+    image.description = 'Meuble en bois'
+    db.session.commit()
+    assert _names(search_images('bois')) == ['table.png']
+
+    db.session.delete(image)
+    db.session.commit()
+    assert search_images('bois') == []
+    assert search_images('table') == []
+
+
+def test_search_filters_visibility_inside_the_query(app):
+    owner = User(username='owner', email='owner@test.com')
+    other = User(username='other', email='other@test.com')
+    db.session.add_all([owner, other])
+    db.session.commit()
+    _add(name='soleil_public.png', user_id=None, is_public=True)
+    _add(name='soleil_prive.png', user_id=owner.id, is_public=False)
+    _add(name='soleil_partage.png', user_id=other.id, is_public=True)
+    _add(name='soleil_autre.png', user_id=other.id, is_public=False)
+
+    assert set(_names(search_images('soleil'))) == {'soleil_public.png', 'soleil_partage.png'}
+    assert set(_names(search_images('soleil', owner.id))) == {
+        'soleil_public.png', 'soleil_prive.png', 'soleil_partage.png'}
+
+
+def test_ingest_is_indexed(app):
+    path = Path(app.config['PICTOGRAMS_PATH']) / 'public/fruits/banane_jaune.png'
+    path.parent.mkdir(parents=True)
+    PILImage.new('RGB', (8, 8)).save(path)
+
+    ingest(app, workers=0)
+
+    assert _names(search_images('banan')) == ['banane_jaune.png']
+    # La description générée à l'import est indexée elle aussi
+    assert _names(search_images('jaune')) == ['banane_jaune.png']
+
+
+def test_web_and_mobile_search_use_the_index(client, app):
+    create_user(client, 'searcher', 'Password123')
+    confirm_user(client, 'searcher@test.com')
+    _add(name='arbre.png', description='Grand chêne', is_public=True)
+
+    response = client.get('/api/search_local_images?q=chene')
+    assert [r['data']['name'] for r in response.get_json()['results']] == ['arbre.png']
+
+    token = client.post('/api/v1/mobile/login', json={'username': 'searcher', 'password': 'Password123'}).get_json()['access_token']
+    response = client.get('/api/v1/mobile/pictograms/search?q=arb', headers={'Authorization': f'Bearer {token}'})
+    assert [r['name'] for r in response.get_json()] == ['arbre.png']
+
+
+def _item(id, name, description='', use_count=0):
+    return normalize_search_key(name), use_count, {'id': id, 'name': name, 'description': description}
+
+
+def test_autocomplete_index_prefix_lookup():
+    index = AutocompleteIndex([
+        _item(1, 'pomme_verte.png', 'Fruit'),
+        _item(2, 'pomme-de-terre.png', 'Légume'),
+        _item(3, 'poire.png', 'Fruit à pépins'),
+        _item(4, 'Été.png', ''),
+        _item(5, 'fruitier.png', 'Arbre'),
+    ])
+
+    def ids(q):
+        return [item['id'] for _, item in index.search(normalize_search_key(q))]
+
+    assert ids('pom') == [2, 1]  # Ordre alphabétique à pertinence égale
+    assert ids('pomme ver') == [1]
+    assert ids('po') == [3, 2, 1]
+    assert ids('ete') == [4]
+    assert ids('legu') == [2]
+    # Un mot du nom passe avant un mot de la description
+    assert ids('fruit') == [5, 3, 1]
+    assert ids('pepin poire') == [3]
+    assert ids('kiwi') == []
+    # limit + 1 résultats : le dernier signale qu'il y a une suite
+    assert [item['id'] for _, item in index.search('po', limit=1)] == [3, 2]
+
+
+def test_public_index_is_rebuilt_when_the_library_changes(app):
+    _add(name='lune.png', is_public=True)
+    assert len(public_index()) == 1
+
+    app.config['SEARCH_INDEX_CHECK_INTERVAL'] = 3600
+    _add(name='lunettes.png', is_public=True)
+    assert len(public_index()) == 1  # Version pas encore revérifiée
+
+    app.config['SEARCH_INDEX_CHECK_INTERVAL'] = 0
+    index = public_index()
+    assert [item['name'] for _, item in index.search('lun')] == ['lune.png', 'lunettes.png']
+    assert public_index() is index  # Même version : pas de reconstruction
+
+
+def test_search_hides_images_made_private_before_the_index_is_rebuilt(app):
+    alice = User(username='alice', email='alice@test.com')
+    db.session.add(alice)
+    db.session.commit()
+    shared = _add(name='carnet.png', user_id=alice.id, is_public=True)
+    gone = _add(name='carnet_vieux.png', is_public=True)
+    _add(name='carnet_neuf.png', is_public=True)
+    assert len(search('carnet')) == 3
+
+    app.config['SEARCH_INDEX_CHECK_INTERVAL'] = 3600
+    index = public_index()
+    shared.is_public = False
+    db.session.delete(gone)
+    db.session.commit()
+
+    assert public_index() is index  # Pas encore reconstruit
+    assert [item['name'] for item in search('carnet')] == ['carnet_neuf.png']
+    assert [item['name'] for item in search('carnet', alice.id)] == ['carnet.png', 'carnet_neuf.png']
+    # Le curseur suit la page complète, images écartées comprises
+    first = search_page('carnet', limit=1)
+    assert first.items == [] and first.next_cursor
+    assert [item['name'] for item in search_page('carnet', limit=1, cursor=first.next_cursor).items] == ['carnet_neuf.png']
+
+def test_public_index_follows_sharing_and_metadata_edits(app):
+    app.config['SEARCH_INDEX_CHECK_INTERVAL'] = 0
+    alice = User(username='alice', email='alice@test.com')
+    db.session.add(alice)
+    db.session.commit()
+    diary = _add(name='diary.png', user_id=alice.id, is_public=True)
+    notes = _add(name='diary_notes.png', user_id=alice.id, is_public=False)
+    cheval = _add(name='cheval.png', description='Un animal', is_public=True)
+    assert [item['name'] for item in search('diary')] == ['diary.png']
+    assert search('horse') == []
+
+    # Échange de visibilité : même nombre d'images publiques, même id max
+    diary.is_public, notes.is_public = False, True
+    db.session.commit()
+    assert [item['name'] for item in search('diary')] == ['diary_notes.png']
+
+    cheval.description = 'horse'
+    db.session.commit()
+    assert [item['name'] for item in search('horse')] == ['cheval.png']
+
+    # Une écriture privée ne touche pas la banque publique
+    version = public_library_version()
+    _add(name='secret.png', user_id=alice.id, is_public=False)
+    assert public_library_version() == version
+
+
+def test_search_merges_public_index_and_user_images(app):
+    owner = User(username='owner', email='owner@test.com')
+    other = User(username='other', email='other@test.com')
+    db.session.add_all([owner, other])
+    db.session.commit()
+    _add(name='velo.png', description='', is_public=True)
+    _add(name='casque.png', description='Pour le vélo', is_public=True)
+    _add(name='velo_rouge.png', user_id=owner.id, is_public=False)
+    _add(name='velo_bleu.png', user_id=other.id, is_public=True)
+    _add(name='velo_vert.png', user_id=other.id, is_public=False)
+
+    assert [item['name'] for item in search('vélo', owner.id)] == [
+        'velo.png', 'velo_bleu.png', 'velo_rouge.png', 'casque.png']
+    assert [item['name'] for item in search('velo')] == ['velo.png', 'velo_bleu.png', 'casque.png']
+    assert search('  ') == []
+
+
+def test_normalize_search_key():
+    assert normalize_search_key('Été_Summer-2.PNG') == 'ete summer 2'
+    assert normalize_search_key('ete_summer.png') == 'ete summer'
+    assert normalize_search_key('  Crème   brûlée ') == 'creme brulee'
+    assert normalize_search_key('M. Dupont') == 'm dupont'  # Pas une extension
+    assert normalize_search_key(None) == ''
+
+
+def test_search_key_follows_the_name(app):
+    image = _add(name='Noël-Sapin.png', is_public=True)
+    assert image.search_key == 'noel sapin'
+    image.name = 'Cadeau_de_Noël.webp'
+    db.session.commit()
+    assert image.search_key == 'cadeau de noel'
+    assert _names(search_images('cadeau')) == ['Cadeau_de_Noël.webp']
+    assert search_images('sapin') == []
+
+
+def test_accents_separators_and_extensions_are_folded(client, app):
+    create_user(client, 'saisons', 'Password123')
+    confirm_user(client, 'saisons@test.com')
+    path = Path(app.config['PICTOGRAMS_PATH']) / 'public/saisons/ete_summer.png'
+    path.parent.mkdir(parents=True)
+    PILImage.new('RGB', (8, 8)).save(path)
+    ingest(app, workers=0)
+    assert Image.query.filter_by(name='ete_summer.png').one().search_key == 'ete summer'
+
+    for q in ('eté', 'ÉTÉ', 'summer', 'ete-sum', 'ete_summer.png'):
+        response = client.get(f'/api/search_local_images?q={q}')
+        assert [r['data']['name'] for r in response.get_json()['results']] == ['ete_summer.png'], q
+    # L'extension n'est pas un mot du nom
+    assert client.get('/api/search_local_images?q=png').get_json()['results'] == []
+
+    token = client.post('/api/v1/mobile/login', json={'username': 'saisons', 'password': 'Password123'}).get_json()['access_token']
+    response = client.get('/api/v1/mobile/pictograms/search?q=Été', headers={'Authorization': f'Bearer {token}'})
+    assert [r['name'] for r in response.get_json()] == ['ete_summer.png']
+
+
+def test_search_without_fts_uses_the_search_key(app, monkeypatch):
+    monkeypatch.setattr('app.search.fts_available', lambda: False)
+    _add(name='Été_Summer.png', description='Saison chaude', is_public=True)
+    _add(name='hiver.png', description='', is_public=True)
+
+    assert _names(search_images('eté')) == ['Été_Summer.png']
+    assert _names(search_images('summ')) == ['Été_Summer.png']
+    assert _names(search_images('chaude')) == ['Été_Summer.png']
+    assert _names(search_images('hiv')) == ['hiver.png']
+    assert search_images('png') == []
+
+
+def test_autocomplete_index_ranks_exact_prefix_substring_then_description():
+    index = AutocompleteIndex([
+        _item(1, 'petit_chat.png'),
+        _item(2, 'panier.png', 'Pour le chat'),
+        _item(3, 'chaton.png'),
+        _item(4, 'achats.png', '', use_count=5),
+        _item(5, 'chat.png'),
+        _item(6, 'chateau.png', '', use_count=2),
+    ])
+
+    hits = index.search('chat')
+    assert [item['id'] for _, item in hits] == [5, 6, 3, 4, 1, 2]
+    assert [sort_key[0] for sort_key, _ in hits] == [0, 1, 1, 2, 2, 3]
+    # Reprise après une clé de tri : milieu d'un rang, puis rang suivant
+    assert [item['id'] for _, item in index.search('chat', after=hits[1][0])] == [3, 4, 1, 2]
+    assert [item['id'] for _, item in index.search('chat', after=hits[4][0])] == [2]
+
+
+def test_search_ranks_by_match_then_popularity(app):
+    owner = User(username='owner', email='owner@test.com')
+    db.session.add(owner)
+    db.session.commit()
+    _add(name='livre_ouvert.png', is_public=True)
+    _add(name='livre.png', is_public=True)
+    _add(name='bibliotheque.png', description='Des livres', is_public=True, use_count=9)
+    _add(name='livres_rangés.png', is_public=True, use_count=3)
+    _add(name='mon_livre.png', user_id=owner.id, is_public=False)
+    _add(name='livre_photo.png', user_id=owner.id, is_public=False, use_count=4)
+
+    assert [item['name'] for item in search('livre', owner.id)] == [
+        'livre.png', 'livre_photo.png', 'livres_rangés.png', 'livre_ouvert.png', 'mon_livre.png', 'bibliotheque.png']
+
+
+def test_search_local_images_pages_with_a_cursor(client, app):
+    create_user(client, 'pager', 'Password123')
+    confirm_user(client, 'pager@test.com')
+    user = User.query.filter_by(username='pager').one()
+    for name in ('fleur.png', 'fleur_bleue.png', 'fleurs_des_champs.png', 'choufleur.png'):
+        _add(name=name, is_public=True)
+    _add(name='fleur_du_jardin.png', user_id=user.id, is_public=False)
+    expected = [item['name'] for item in search('fleur', user.id)]
+    assert len(expected) == 5
+
+    login(client, 'pager', 'Password123')
+    names, cursor, pages = [], None, 0
+    while True:
+        response = client.get('/api/search_local_images', query_string={'q': 'fleur', 'limit': 2, 'cursor': cursor})
+        data = response.get_json()
+        assert len(data['results']) <= 2
+        names += [r['data']['name'] for r in data['results']]
+        pages += 1
+        if not data['has_more']:
+            assert data['next_cursor'] is None
+            break
+        cursor = data['next_cursor']
+    assert names == expected
+    assert pages == 3
+
+    assert search_page('fleur', user.id, limit=5).next_cursor is None
+
+
+def test_search_local_images_rejects_an_invalid_cursor(client):
+    for cursor in ('nope', 'WzEsMl0', 'WyJhIiwwLCJiIiwxXQ'):
+        response = client.get('/api/search_local_images', query_string={'q': 'acorn', 'cursor': cursor})
+        assert response.status_code == 400, cursor
+    assert client.get('/api/search_local_images?q=').get_json() == {
+        'results': [], 'has_more': False, 'next_cursor': None}
+
+
+def test_refresh_popularity_counts_trees_and_lists(app, runner):
+    owner = User(username='owner', email='owner@test.com')
+    db.session.add(owner)
+    db.session.commit()
+    soleil = _add(name='soleil.png', is_public=True)
+    lune = _add(name='lune.png', is_public=True)
+    nuage = _add(name='nuage.png', is_public=True, use_count=7)
+    tree = {'roots': [{'id': soleil.id, 'children': [{'id': lune.id, 'children': []}, {'id': soleil.id}]}]}
+    db.session.add_all([
+        Tree(user_id=owner.id, name='ciel', root_id=soleil.id, json_data=json.dumps(tree)),
+        PictogramList(user_id=owner.id, list_name='nuit', payload=json.dumps([{'image_id': lune.id}, {'image_id': -1}])),
+    ])
+    db.session.commit()
+
+    result = runner.invoke(args=['search', 'refresh-popularity'])
+    assert result.exit_code == 0, result.output
+    assert '3 image(s)' in result.output
+    # Un arbre compte une fois par image, même si elle y apparaît plusieurs fois
+    assert (soleil.use_count, lune.use_count, nuage.use_count) == (1, 2, 0)
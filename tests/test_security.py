@@ -117,10 +117,10 @@ def test_save_public_list_with_global_image_succeeds(seeded_db):
 def test_search_local_images_unauthenticated(seeded_db):
     """Unauthenticated users should only find global and user-public images via search."""
     client = seeded_db
-    response = client.get('/api/search_local_images?q=png')
+    response = client.get('/api/search_local_images?q=p')
     assert response.status_code == 200
 
-    images = response.get_json()
+    images = response.get_json()['results']
     image_ids = {img['data']['id'] for img in images}
 
     # Should see: global (100), user1's public (102), user2's public (202)
@@ -137,10 +137,10 @@ def test_search_local_images_authenticated(seeded_db):
     client = seeded_db
     login(client, 'user1', 'password')
 
-    response = client.get('/api/search_local_images?q=png')
+    response = client.get('/api/search_local_images?q=p')
     assert response.status_code == 200
 
-    images = response.get_json()
+    images = response.get_json()['results']
     image_ids = {img['data']['id'] for img in images}
 
     # User 1 should see:
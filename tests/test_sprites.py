@@ -0,0 +1,67 @@
+from io import BytesIO
+from pathlib import Path
+from PIL import Image as PILImage
+from app import db
+from app.models import Folder, Image
+from tests.conftest import create_user, confirm_user, login
+
+
+def _add_image_with_thumbnail(app, folder, name, color):
+    path = f"{folder.path}/{name}"
+    thumb = Path(app.config['PICTOGRAMS_PATH_MIN']) / Path(path).with_suffix('.png')
+    thumb.parent.mkdir(parents=True, exist_ok=True)
+    PILImage.new('RGB', (48, 30), color=color).save(thumb, 'PNG')
+    image = Image(name=name, path=path, is_public=True, folder_id=folder.id)
+    db.session.add(image)
+    db.session.commit()
+    return image
+
+
+def test_folder_sprite_packs_thumbnails(client, app):
+    folder = Folder(name='public', path='public', user_id=None)
+    db.session.add(folder)
+    db.session.commit()
+    red = _add_image_with_thumbnail(app, folder, 'red.png', 'red')
+    blue = _add_image_with_thumbnail(app, folder, 'blue.jpg', 'blue')
+
+    response = client.get(f'/api/folder_sprite/{folder.id}')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert set(data['items']) == {str(red.id), str(blue.id)}
+    assert data['tile'] == 48
+    assert data['width'] == 96 and data['height'] == 48
+
+    sprite_response = client.get(data['url'])
+    assert sprite_response.status_code == 200
+    assert sprite_response.mimetype == 'image/png'
+    with PILImage.open(BytesIO(sprite_response.data)) as sheet:
+        cell = data['items'][str(red.id)]
+        # Thumbnail is vertically centered in its cell
+        assert sheet.getpixel((cell['x'] + 10, cell['y'] + 24))[:3] == (255, 0, 0)
+
+    # Same content -> same cached version
+    assert client.get(f'/api/folder_sprite/{folder.id}').get_json()['version'] == data['version']
+
+    # New image -> new version, and the stale sheet is removed
+    _add_image_with_thumbnail(app, folder, 'green.png', 'green')
+    new_data = client.get(f'/api/folder_sprite/{folder.id}').get_json()
+    assert new_data['version'] != data['version']
+    assert len(new_data['items']) == 3
+    assert client.get(data['url']).status_code == 404
+
+
+def test_folder_sprite_private_folder(client):
+    owner = create_user(client, 'sprite_owner', 'Password123')
+    confirm_user(client, owner.email)
+    root_folder = Folder.query.filter_by(user_id=owner.id, parent_id=None).first()
+
+    # Anonymous users cannot read a private folder sprite
+    response = client.get(f'/api/folder_sprite/{root_folder.id}')
+    assert response.status_code == 403
+
+    login(client, 'sprite_owner', 'Password123')
+    response = client.get(f'/api/folder_sprite/{root_folder.id}')
+    assert response.status_code == 200
+    assert response.get_json()['items'] == {}
+
+    assert client.get('/api/folder_sprite/9999').status_code == 404
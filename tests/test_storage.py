@@ -0,0 +1,152 @@
+import hashlib
+import os
+from io import BytesIO
+from pathlib import Path
+import pytest
+from PIL import Image as PILImage
+from app import db
+from app.models import Folder, Image, ImageBlob
+from app.storage import UploadRejected, blob_path, blob_thumbnail_path, blobs_folder, receive_upload
+from app.thumbnails import thumbnail_path
+from tests.conftest import login, login_new_user
+from tests.test_pictogram_bank import create_test_image_io
+
+
+def _upload(client, folder_id, filename):
+    data = {'folder_id': folder_id, 'file': (create_test_image_io(), filename)}
+    response = client.post('/api/image/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    return response.get_json()['image']
+
+
+def test_identical_uploads_share_one_blob(client, app):
+    root_folder = login_new_user(client, 'blob_user')
+    subfolder = client.post('/api/folder/create', json={'name': 'copies', 'parent_id': root_folder.id}).get_json()['folder']
+
+    first = _upload(client, root_folder.id, 'same.jpg')
+    second = _upload(client, subfolder['id'], 'same_again.jpg')
+
+    blobs = ImageBlob.query.all()
+    assert len(blobs) == 1
+    blob = blobs[0]
+    blob_id = blob.id
+    stored_path, stored_thumb = blob_path(blob), blob_thumbnail_path(blob)
+    assert blob.ref_count == 2
+    assert db.session.get(Image, first['id']).blob_id == blob.id
+    assert db.session.get(Image, second['id']).blob_id == blob.id
+
+    # Both folder paths resolve to the same stored content, thumbnail made once per blob
+    pictos = Path(app.config['PICTOGRAMS_PATH'])
+    assert (pictos / first['path']).read_bytes() == stored_path.read_bytes()
+    assert (pictos / second['path']).read_bytes() == stored_path.read_bytes()
+    assert stored_thumb.exists()
+    assert thumbnail_path(first['path']).exists()
+    assert thumbnail_path(second['path']).exists()
+
+    # Deleting one image keeps the blob for the other
+    response = client.delete('/api/item/delete', json={'id': first['id'], 'type': 'image'})
+    assert response.status_code == 200
+    db.session.expire_all()
+    assert db.session.get(ImageBlob, blob_id).ref_count == 1
+    assert stored_path.exists()
+    assert (pictos / second['path']).exists()
+
+    # Deleting the folder holding the last reference removes the blob
+    response = client.delete('/api/item/delete', json={'id': subfolder['id'], 'type': 'folder'})
+    assert response.status_code == 200
+    db.session.expire_all()
+    assert db.session.get(ImageBlob, blob_id) is None
+    assert not stored_path.exists()
+    assert not stored_thumb.exists()
+
+
+def test_blob_shared_across_users_survives_account_deletion(client, app):
+    login_new_user(client, 'blob_leaver')
+    leaver_root = Folder.query.filter_by(name='blob_leaver').first()
+    _upload(client, leaver_root.id, 'common.jpg')
+    client.get('/logout', follow_redirects=True)
+
+    stayer_root = login_new_user(client, 'blob_stayer')
+    kept = _upload(client, stayer_root.id, 'common.jpg')
+    blob = ImageBlob.query.one()
+    assert blob.ref_count == 2
+    client.get('/logout', follow_redirects=True)
+
+    login(client, 'blob_leaver', 'Password123')
+    client.post('/delete_account', data={'username_confirm': 'blob_leaver'}, follow_redirects=True)
+
+    db.session.expire_all()
+    blob = ImageBlob.query.one()
+    assert blob.ref_count == 1
+    assert (Path(app.config['PICTOGRAMS_PATH']) / kept['path']).exists()
+
+
+def _noisy_png(size):
+    """PNG that does not compress well, to control the upload size."""
+    img = PILImage.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+    img_io = BytesIO()
+    img.save(img_io, 'PNG')
+    img_io.seek(0)
+    return img_io
+
+
+def test_receive_upload_hashes_and_reads_header(tmp_path):
+    data = _noisy_png((40, 30)).getvalue()
+    received = receive_upload(BytesIO(data), tmp_path, len(data), {'PNG'})
+
+    assert received.sha256 == hashlib.sha256(data).hexdigest()
+    assert received.size == len(data)
+    assert (received.format, received.width, received.height) == ('PNG', 40, 30)
+    assert Path(received.tmp_path).read_bytes() == data
+
+
+def test_receive_upload_rejects_and_cleans_up(tmp_path):
+    data = _noisy_png((40, 30)).getvalue()
+    with pytest.raises(UploadRejected) as excinfo:
+        receive_upload(BytesIO(data), tmp_path, len(data) - 1, {'PNG'})
+    assert excinfo.value.code == 'too_large'
+
+    with pytest.raises(UploadRejected) as excinfo:
+        receive_upload(BytesIO(b'not an image at all'), tmp_path, 1024, {'PNG'})
+    assert excinfo.value.code == 'invalid'
+
+    with pytest.raises(UploadRejected) as excinfo:
+        receive_upload(BytesIO(data), tmp_path, len(data), {'JPEG'})
+    assert excinfo.value.code == 'invalid'
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_upload_over_size_limit_is_rejected(client, app):
+    root_folder = login_new_user(client, 'size_limited')
+    app.config['MAX_IMAGE_SIZE_KB'] = 1
+
+    # Over the per-image limit, detected while streaming the file
+    data = {'folder_id': root_folder.id, 'file': (_noisy_png((40, 40)), 'big.png')}
+    response = client.post('/api/image/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert response.get_json()['status'] == 'error'
+
+    # Far over the limit: the request body is refused before parsing
+    data = {'folder_id': root_folder.id, 'file': (_noisy_png((200, 200)), 'huge.png')}
+    response = client.post('/api/image/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert response.get_json()['status'] == 'error'
+
+    assert Image.query.filter_by(user_id=root_folder.user_id).count() == 0
+    assert ImageBlob.query.count() == 0
+    assert not list(blobs_folder().glob('*.part'))
+
+
+def test_upload_size_limit_applies_before_csrf_check(client, app):
+    root_folder = login_new_user(client, 'size_limited_csrf')
+    app.config['MAX_IMAGE_SIZE_KB'] = 1
+    app.config['MAX_BATCH_UPLOAD_FILES'] = 2
+    # The CSRF check reads the form: the body limit must already be set when it runs
+    app.config['WTF_CSRF_ENABLED'] = True
+
+    for url, field in (('/api/image/upload', 'file'), ('/api/image/upload/batch', 'files')):
+        data = {'folder_id': root_folder.id, field: (BytesIO(b'\0' * (1024 * 1024)), 'huge.png')}
+        response = client.post(url, data=data, content_type='multipart/form-data')
+        assert response.status_code == 413
+        assert response.get_json()['status'] == 'error'
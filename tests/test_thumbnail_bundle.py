@@ -0,0 +1,59 @@
+import struct
+from pathlib import Path
+from PIL import Image as PILImage
+from app import db
+from app.models import Image
+from tests.conftest import create_user, confirm_user, login
+
+
+def _decode_bundle(data):
+    entries = {}
+    offset = 0
+    while offset < len(data):
+        image_id, length = struct.unpack_from('>II', data, offset)
+        offset += 8
+        entries[image_id] = data[offset:offset + length]
+        offset += length
+    return entries
+
+
+def _add_image(app, path, user_id=None, is_public=False):
+    thumb = Path(app.config['PICTOGRAMS_PATH_MIN']) / Path(path).with_suffix('.png')
+    thumb.parent.mkdir(parents=True, exist_ok=True)
+    PILImage.new('RGB', (8, 8), color='red').save(thumb, 'PNG')
+    image = Image(name=Path(path).name, path=path, user_id=user_id, is_public=is_public)
+    db.session.add(image)
+    db.session.commit()
+    return image
+
+
+def test_thumbnail_bundle_applies_acl(client, app):
+    owner = create_user(client, 'bundle_owner', 'Password123')
+    confirm_user(client, owner.email)
+    other = create_user(client, 'bundle_other', 'Password123')
+
+    public = _add_image(app, 'public/bold/cat.png')
+    mine = _add_image(app, 'bundle_owner/mine.jpg', user_id=owner.id)
+    shared = _add_image(app, 'bundle_other/shared.png', user_id=other.id, is_public=True)
+    secret = _add_image(app, 'bundle_other/secret.png', user_id=other.id)
+    ids = [public.id, mine.id, shared.id, secret.id, 9999]
+    query = ','.join(str(i) for i in ids)
+
+    # Anonymous: only the public bank and images flagged public
+    response = client.get(f'/api/thumbnails/bundle?ids={query}')
+    assert response.status_code == 200
+    entries = _decode_bundle(response.data)
+    assert set(entries) == {public.id, shared.id}
+    assert response.headers['X-Bundle-Count'] == '2'
+    assert entries[public.id].startswith(b'\x89PNG')
+
+    login(client, 'bundle_owner', 'Password123')
+    entries = _decode_bundle(client.get(f'/api/thumbnails/bundle?ids={query}').data)
+    assert set(entries) == {public.id, mine.id, shared.id}
+
+
+def test_thumbnail_bundle_invalid_requests(client):
+    assert client.get('/api/thumbnails/bundle').status_code == 400
+    assert client.get('/api/thumbnails/bundle?ids=1,abc').status_code == 400
+    too_many = ','.join(str(i) for i in range(1, 202))
+    assert client.get(f'/api/thumbnails/bundle?ids={too_many}').status_code == 400
@@ -0,0 +1,61 @@
+import os
+from io import BytesIO
+from PIL import Image as PILImage, ImageChops, ImageDraw, ImageStat
+from app.thumbnails import PALETTE_MAX_ERROR, THUMB_SIZE, encode_thumbnail, generate_thumbnail
+
+
+def _pictogram(size=(48, 48)):
+    img = PILImage.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((4, 4, size[0] - 4, size[1] - 4), fill='red', outline='black')
+    return img
+
+
+def _decode(data):
+    with PILImage.open(BytesIO(data)) as img:
+        return img.mode, img.convert('RGBA')
+
+
+def test_flat_pictogram_uses_lossless_palette():
+    img = _pictogram()
+    encoding = encode_thumbnail(img)
+
+    assert encoding.mode == 'palette'
+    assert len(encoding.data) < encoding.truecolor_size
+    mode, decoded = _decode(encoding.data)
+    assert mode == 'P'
+    assert decoded.tobytes() == img.tobytes()
+
+
+def test_antialiased_drawing_uses_close_palette():
+    big = _pictogram((480, 480))
+    big.thumbnail(THUMB_SIZE)
+    encoding = encode_thumbnail(big)
+
+    assert encoding.mode == 'palette'
+    _, decoded = _decode(encoding.data)
+    error = ImageStat.Stat(ImageChops.difference(big.convert('RGBA'), decoded)).mean
+    assert max(error) <= PALETTE_MAX_ERROR
+
+
+def test_photographic_noise_stays_truecolor():
+    noise = PILImage.frombytes('RGB', THUMB_SIZE, os.urandom(THUMB_SIZE[0] * THUMB_SIZE[1] * 3))
+    encoding = encode_thumbnail(noise)
+
+    assert encoding.mode == 'truecolor'
+    assert len(encoding.data) == encoding.truecolor_size
+    mode, decoded = _decode(encoding.data)
+    assert mode == 'RGB'
+    assert decoded.convert('RGB').tobytes() == noise.tobytes()
+
+
+def test_generate_thumbnail_writes_encoded_bytes(tmp_path):
+    source = tmp_path / 'source.png'
+    _pictogram((300, 200)).save(source)
+    target = tmp_path / 'thumbs' / 'source.png'
+
+    encoding = generate_thumbnail(source, target)
+
+    assert target.read_bytes() == encoding.data
+    with PILImage.open(target) as thumb:
+        assert thumb.size == (48, 32)
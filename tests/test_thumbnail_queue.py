@@ -0,0 +1,146 @@
+import time
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+from PIL import Image as PILImage
+from app import db
+from app.models import Image, ThumbnailJob, User
+from app.thumbnail_queue import ThumbnailWorkerPool, enqueue_thumbnail, get_pool
+from app.thumbnails import thumbnail_path
+from tests.conftest import create_user, confirm_user, login
+
+
+def _public_image(app, name, valid=True):
+    path = f"public/queue/{name}"
+    source = Path(app.config['PICTOGRAMS_PATH']) / path
+    source.parent.mkdir(parents=True, exist_ok=True)
+    if valid:
+        PILImage.new('RGB', (100, 100), color='blue').save(source, 'PNG')
+    else:
+        source.write_text("not an image")
+    image = Image(name=name, path=path, is_public=True)
+    db.session.add(image)
+    return image
+
+
+def test_job_runs_and_is_removed(client, app):
+    image = _public_image(app, 'ok.png')
+    job = enqueue_thumbnail(image)
+    db.session.commit()
+
+    get_pool().submit([job.id])
+
+    assert ThumbnailJob.query.count() == 0
+    assert thumbnail_path(image.path).exists()
+
+
+def test_failed_job_is_retried_then_marked_failed(client, app):
+    image = _public_image(app, 'broken.png', valid=False)
+    job = enqueue_thumbnail(image)
+    db.session.commit()
+    job_id = job.id
+
+    pool = get_pool()
+    pool.max_attempts = 2
+    pool.submit([job_id])
+    job = db.session.get(ThumbnailJob, job_id)
+    db.session.refresh(job)
+    assert job.status == 'pending' and job.attempts == 1
+    assert 'UnidentifiedImageError' in job.last_error
+    assert job.next_attempt_at is not None
+
+    # Pas de nouvel essai avant l'échéance
+    pool.submit([job_id])
+    db.session.refresh(job)
+    assert job.attempts == 1
+
+    job.next_attempt_at = datetime.now(UTC) - timedelta(seconds=1)
+    db.session.commit()
+    pool.submit([job_id])
+    db.session.refresh(job)
+    assert job.status == 'failed' and job.attempts == 2
+    assert job.next_attempt_at is None
+
+
+def test_background_retry_waits_for_its_delay(client, app):
+    image = _public_image(app, 'broken_bg.png', valid=False)
+    job = enqueue_thumbnail(image)
+    db.session.commit()
+    job_id = job.id
+
+    app.config['THUMBNAIL_WORKERS'] = 1
+    pool = ThumbnailWorkerPool(app)
+    pool.retry_delay = 3600
+    pool.submit([job_id])
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        db.session.expire_all()
+        if db.session.get(ThumbnailJob, job_id).attempts:
+            break
+        time.sleep(0.05)
+    pool._refill()
+    pool.recover()
+    time.sleep(0.2)
+    pool._executor.shutdown(wait=True)
+
+    db.session.expire_all()
+    job = db.session.get(ThumbnailJob, job_id)
+    assert job.status == 'pending' and job.attempts == 1
+
+
+def test_pending_thumbnail_serves_placeholder(client, app):
+    image = _public_image(app, 'later.png')
+    enqueue_thumbnail(image)
+    db.session.commit()
+
+    response = client.get('/pictogramsmin/public/queue/later.png')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/gif'
+    assert response.headers['Cache-Control'] == 'no-store'
+
+
+def test_background_pool_generates_thumbnails(client, app):
+    images = [_public_image(app, f'bg_{i}.png') for i in range(5)]
+    jobs = [enqueue_thumbnail(image) for image in images]
+    db.session.commit()
+
+    app.config['THUMBNAIL_WORKERS'] = 2
+    pool = ThumbnailWorkerPool(app)
+    pool.capacity = 2  # The remaining jobs are picked up from the table as slots free up
+    pool.submit([job.id for job in jobs])
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        db.session.expire_all()
+        if ThumbnailJob.query.count() == 0:
+            break
+        time.sleep(0.05)
+    pool._executor.shutdown(wait=True)
+
+    assert ThumbnailJob.query.count() == 0
+    assert all(thumbnail_path(image.path).exists() for image in images)
+
+
+def test_admin_thumbnail_queue_view(client, app):
+    user = create_user(client, 'queue_admin', 'Password123')
+    confirm_user(client, user.email)
+    login(client, 'queue_admin', 'Password123')
+    assert client.get('/admin/thumbnails').status_code == 403
+
+    user = User.query.filter_by(username='queue_admin').first()
+    user.is_admin = True
+    image = _public_image(app, 'admin_broken.png', valid=False)
+    db.session.add(ThumbnailJob(image=image, status='failed', attempts=3, last_error='OSError: boom'))
+    db.session.commit()
+
+    response = client.get('/admin/thumbnails')
+    assert response.status_code == 200
+    assert b'public/queue/admin_broken.png' in response.data
+    assert b'OSError: boom' in response.data
+
+    response = client.post('/admin/thumbnails/retry', follow_redirects=True)
+    assert response.status_code == 200
+    job = ThumbnailJob.query.one()
+    db.session.refresh(job)
+    # Attempts were reset and the job ran again: still broken, back to pending
+    assert job.status == 'pending' and job.attempts == 1
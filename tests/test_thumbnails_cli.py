@@ -0,0 +1,152 @@
+import json
+from pathlib import Path
+from PIL import Image as PILImage
+from PIL.PngImagePlugin import PngInfo
+from app import db
+from app.models import Image
+from app.cli import REBUILD_STATE_NAME
+from app.thumbnails import SIGNATURE_KEY, thumbnail_path, thumbnail_signature, variant_path
+
+
+def _public_images(app, count, size=(96, 64)):
+    images = []
+    for i in range(count):
+        path = f"public/cli/picto_{i}.png"
+        source = Path(app.config['PICTOGRAMS_PATH']) / path
+        source.parent.mkdir(parents=True, exist_ok=True)
+        PILImage.new('RGB', size, color='purple').save(source, 'PNG')
+        image = Image(name=source.name, path=path, is_public=True)
+        db.session.add(image)
+        images.append(image)
+    db.session.commit()
+    return images
+
+
+def test_rebuild_generates_all_thumbnails(app):
+    images = _public_images(app, 5)
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['thumbnails', 'rebuild', '--workers', '0'])
+
+    assert result.exit_code == 0, result.output
+    assert 'Reconstruction terminée : 5 miniature(s)' in result.output
+    assert 'Encodage : 5 en palette' in result.output
+    for image in images:
+        with PILImage.open(thumbnail_path(image.path)) as thumb:
+            assert thumb.size == (48, 32)
+    assert not (Path(app.config['PICTOGRAMS_PATH_MIN']) / REBUILD_STATE_NAME).exists()
+
+
+def test_rebuild_resumes_after_interruption(app):
+    images = _public_images(app, 4)
+    state = Path(app.config['PICTOGRAMS_PATH_MIN']) / REBUILD_STATE_NAME
+    state.parent.mkdir(parents=True, exist_ok=True)
+    state.write_text(json.dumps({'signature': thumbnail_signature(), 'last_id': images[1].id}))
+
+    result = app.test_cli_runner().invoke(args=['thumbnails', 'rebuild', '--workers', '0'])
+
+    assert result.exit_code == 0, result.output
+    assert 'Reprise' in result.output
+    assert not thumbnail_path(images[0].path).exists()
+    assert not thumbnail_path(images[1].path).exists()
+    assert thumbnail_path(images[2].path).exists()
+    assert thumbnail_path(images[3].path).exists()
+
+
+def test_rebuild_ignores_state_of_other_signature(app):
+    images = _public_images(app, 2)
+    state = Path(app.config['PICTOGRAMS_PATH_MIN']) / REBUILD_STATE_NAME
+    state.parent.mkdir(parents=True, exist_ok=True)
+    state.write_text(json.dumps({'signature': '32x32:old', 'last_id': images[0].id}))
+
+    result = app.test_cli_runner().invoke(args=['thumbnails', 'rebuild', '--workers', '2'])
+
+    assert result.exit_code == 0, result.output
+    assert all(thumbnail_path(image.path).exists() for image in images)
+
+
+def test_verify_reports_and_fixes(app):
+    images = _public_images(app, 3)
+    runner = app.test_cli_runner()
+    runner.invoke(args=['thumbnails', 'rebuild', '--workers', '0'])
+    thumbnail_path(images[0].path).unlink()
+    thumbnail_path(images[1].path).write_bytes(b'broken')
+
+    result = runner.invoke(args=['thumbnails', 'verify', '--workers', '0'])
+    assert result.exit_code == 1
+    assert '1 missing, 1 corrupt, 0 stale' in result.output
+
+    result = runner.invoke(args=['thumbnails', 'verify', '--workers', '0', '--fix'])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(args=['thumbnails', 'verify', '--workers', '0'])
+    assert result.exit_code == 0, result.output
+    assert '0 missing, 0 corrupt, 0 stale' in result.output
+
+
+
+def test_verify_flags_thumbnails_of_another_signature(app):
+    images = _public_images(app, 2)
+    runner = app.test_cli_runner()
+    runner.invoke(args=['thumbnails', 'rebuild', '--workers', '0'])
+    # Same size, but written by an older encoder (no signature chunk) / at another THUMB_SIZE
+    with PILImage.open(thumbnail_path(images[0].path)) as thumb:
+        thumb.convert('RGB').save(thumbnail_path(images[0].path), 'PNG')
+    old = PngInfo()
+    old.add_text(SIGNATURE_KEY, thumbnail_signature((32, 32)))
+    with PILImage.open(thumbnail_path(images[1].path)) as thumb:
+        thumb.convert('RGB').save(thumbnail_path(images[1].path), 'PNG', pnginfo=old)
+
+    result = runner.invoke(args=['thumbnails', 'verify', '--workers', '0'])
+    assert result.exit_code == 1
+    assert '0 missing, 0 corrupt, 2 stale' in result.output
+
+    result = runner.invoke(args=['thumbnails', 'verify', '--workers', '0', '--fix'])
+    assert result.exit_code == 0, result.output
+    with PILImage.open(thumbnail_path(images[0].path)) as thumb:
+        assert thumb.info[SIGNATURE_KEY] == thumbnail_signature()
+
+def test_prune_orphans(app):
+    images = _public_images(app, 1)
+    runner = app.test_cli_runner()
+    runner.invoke(args=['thumbnails', 'rebuild', '--workers', '0'])
+    thumbs = Path(app.config['PICTOGRAMS_PATH_MIN'])
+    orphan = thumbs / 'public/gone/old.png'
+    orphan.parent.mkdir(parents=True)
+    orphan.write_bytes(b'x')
+    sprite = thumbs / '.sprites' / '1-abc.png'
+    sprite.parent.mkdir(parents=True)
+    sprite.write_bytes(b'x')
+    variant = variant_path(images[0].path, 128)
+    variant.parent.mkdir(parents=True)
+    variant.write_bytes(b'x')
+    orphan_variant = variant_path('public/gone/old.png', 128)
+    orphan_variant.parent.mkdir(parents=True)
+    orphan_variant.write_bytes(b'x')
+
+    result = runner.invoke(args=['thumbnails', 'prune-orphans', '--dry-run'])
+    assert result.exit_code == 0, result.output
+    assert orphan.exists()
+
+    result = runner.invoke(args=['thumbnails', 'prune-orphans'])
+    assert result.exit_code == 0, result.output
+    assert '2 miniature(s) orpheline(s)' in result.output
+    assert not orphan.exists() and not orphan.parent.exists()
+    assert not orphan_variant.exists()
+    assert sprite.exists() and variant.exists()
+    assert thumbnail_path(images[0].path).exists()
+
+
+def test_rebuild_renders_shared_blobs_once(client, app):
+    from tests.conftest import login_new_user
+    from tests.test_storage import _upload
+    root_folder = login_new_user(client, 'cli_blobs')
+    first = _upload(client, root_folder.id, 'a.jpg')
+    second = _upload(client, root_folder.id, 'b.jpg')
+    for image in (first, second):
+        thumbnail_path(image['path']).unlink()
+
+    result = app.test_cli_runner().invoke(args=['thumbnails', 'rebuild', '--workers', '0'])
+
+    assert result.exit_code == 0, result.output
+    assert thumbnail_path(first['path']).exists()
+    assert thumbnail_path(second['path']).samefile(thumbnail_path(first['path']))